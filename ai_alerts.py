@@ -1,24 +1,28 @@
-import pandas as pd
-from datetime import datetime, timedelta
+import argparse
 
-# Load files
-products = pd.read_csv("products.csv")
-stock = pd.read_csv("stock.csv")
-sales = pd.read_csv("sales.csv")
+from data_loader import load_products, load_sales, load_stock
+from expiry_index import load_expiry_index
+from rules import EXPIRING_SOON_DAYS, speed_labels
 
-# ---- FIX DATE CONVERSION (ACCEPT ANY FORMAT) ----
-stock["expiry_date"] = pd.to_datetime(stock["expiry_date"], dayfirst=True, errors="coerce")
-stock["date"] = pd.to_datetime(stock["date"], dayfirst=True, errors="coerce")
-sales["date"] = pd.to_datetime(sales["date"], dayfirst=True, errors="coerce")
+parser = argparse.ArgumentParser(description="Print expiry / overstock / low stock / speed alerts")
+parser.add_argument("--as-of", help="date to check expiry against (default: today)")
+args = parser.parse_args()
 
-# ---- 1. EXPIRY ALERTS ----
-today = datetime(2025,1,1)
-expiry_limit = today + timedelta(days=7)
+# Load files (normalized and cached by data_loader)
+# Dates are read in the format each file is in (date_parsing.py), like every
+# other script; this used to force day-first and disagree with them
+products = load_products()
+stock = load_stock()
+sales = load_sales()
 
-expiry_alerts = stock[stock["expiry_date"] <= expiry_limit]
+# ---- 1. EXPIRY ALERTS ----
+# Lots expiring within 7 days of as-of (or already expired), from the expiry index
+index = load_expiry_index()
+expiring = index.expiring(EXPIRING_SOON_DAYS, args.as_of, include_expired=True)
+expiry_alerts = stock.iloc[index.rows(expiring)]
 
 # ---- 2. AVERAGE SALES PER PRODUCT ----
-avg_sales = sales.groupby("product_id")["qty_sold"].mean().reset_index()
+avg_sales = sales.groupby("product_id")["quantity"].mean().reset_index()
 avg_sales.columns = ["product_id","avg_daily_sale"]
 
 # ---- 3. MERGE STOCK + SALES ----
@@ -35,9 +39,7 @@ low_stock_alerts = merged[merged["stock_level"] < merged["reorder_level"]]
 
 # ---- 6. FAST / SLOW MOVING PRODUCTS ----
 product_speed = avg_sales.copy()
-product_speed["category"] = product_speed["avg_daily_sale"].apply(
-    lambda x: "Fast Moving" if x > 15 else ("Slow Moving" if x < 5 else "Medium")
-)
+product_speed["category"] = speed_labels(product_speed["avg_daily_sale"])
 
 # ---- PRINT OUTPUT ----
 print("\n=========== EXPIRY ALERTS ===========")
@@ -0,0 +1,207 @@
+# backtest.py
+# Rolling-origin backtest of the forecast (future_prediction.py) and the
+# reorder rule (buying_recommendations.py).
+#
+# For every cutoff date we pretend it is that morning: forecast the next
+# HORIZON days from sales up to the cutoff (last 7 observed days, like
+# forecast_next_30), stock up by the buying rule and replay what actually
+# sold. Per fold and key we get
+#   forecast vs actual units  -> MAPE and bias
+#   stockout_days             -> days in the horizon with demand left unmet
+#   overstock_units           -> units still on the shelf at the end
+# Products are scored on total demand (stock pooled across stores), stores
+# on their own store x product series.
+#
+# History has no stock snapshots, so each fold starts from nothing on hand
+# and receives units_to_buy = ceil(forecast * SAFETY_FACTOR).
+#
+# The daily series of all keys are laid out once as one sorted array with
+# prefix sums. A fold is then only a few searchsorted lookups per key (no
+# regrouping of sales), so a daily backtest over a year of history costs
+# about as much as a single aggregation pass.
+#
+#   python backtest.py --horizon 30 --step 1
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from buying_recommendations import SAFETY_FACTOR
+from data_loader import load_sales
+from forecasting import TRAILING_DAYS
+from future_prediction import N_DAYS_FORECAST
+
+RESULT_COLUMNS = ['folds', 'forecast_units', 'actual_units', 'mape', 'bias',
+                  'stockout_days', 'overstock_units']
+
+
+class SeriesIndex:
+    # Daily sales of every key as one array sorted by (key, day), plus
+    # prefix sums, so any key's total over any day range is two lookups.
+
+    def __init__(self, sales, keys, first_day):
+        daily = sales.dropna(subset=keys + ['date']).groupby(
+            keys + ['date'], observed=True, sort=True)['quantity'].sum().reset_index()
+        day = (daily['date'] - first_day).dt.days.to_numpy()
+        key_codes = daily.groupby(keys, observed=True, sort=False).ngroup().to_numpy()
+
+        self.keys = daily.loc[np.r_[True, np.diff(key_codes) != 0], keys].reset_index(drop=True)
+        self.n_keys = len(self.keys)
+        self.span = int(day.max()) + 2 if len(day) else 1
+        self.code = key_codes.astype('int64') * self.span + day
+        self.day = day
+        qty = daily['quantity'].to_numpy(dtype=float)
+        self.csum = np.concatenate([[0.0], np.cumsum(qty)])
+        # Demand can't be negative for stockouts (returns are ignored there)
+        self.demand = np.concatenate([[0.0], np.cumsum(np.maximum(qty, 0))])
+        self.base = np.arange(self.n_keys, dtype='int64') * self.span
+        self.start = np.searchsorted(self.code, self.base)
+
+    def end(self, day):
+        # Per key: index one past its last row dated on or before `day`
+        return np.searchsorted(self.code, self.base + day, side='right')
+
+
+def run_fold(index, cutoff, horizon, window=TRAILING_DAYS):
+    # Forecast from rows up to `cutoff` (a day number) and score the next `horizon` days
+    end = index.end(cutoff)
+    stop = index.end(cutoff + horizon)
+
+    lo = np.maximum(index.start, end - window)
+    seen = end - lo
+    level = np.divide(index.csum[end] - index.csum[lo], seen, out=np.zeros(index.n_keys), where=seen > 0)
+    forecast = np.round(level * horizon, 2)
+    actual = index.csum[stop] - index.csum[end]
+
+    supply = np.maximum(0, np.ceil(np.round(forecast * SAFETY_FACTOR, 2)))
+    # First row whose running demand exceeds supply; past `stop` means no stockout
+    breach = np.searchsorted(index.demand, index.demand[end] + supply, side='right')
+    stocked_out = breach <= stop
+    breach_day = index.day[np.minimum(breach, len(index.day)) - 1]
+    stockout_days = np.where(stocked_out, cutoff + horizon - breach_day + 1, 0)
+    overstock = np.maximum(0.0, supply - index.demand[stop] + index.demand[end])
+    return forecast, actual, stockout_days, overstock
+
+
+class FoldTotals:
+    # Running per-key sums over folds
+
+    def __init__(self, n_keys):
+        self.sums = {name: np.zeros(n_keys) for name in
+                     ['folds', 'forecast', 'actual', 'ape', 'ape_folds', 'stockout', 'overstock']}
+
+    def add(self, forecast, actual, stockout_days, overstock):
+        s = self.sums
+        s['folds'] += 1
+        s['forecast'] += forecast
+        s['actual'] += actual
+        sold = actual > 0
+        s['ape'] += np.where(sold, np.abs(forecast - actual) / np.where(sold, actual, 1), 0.0)
+        s['ape_folds'] += sold
+        s['stockout'] += stockout_days
+        s['overstock'] += overstock
+
+    def frame(self):
+        s = self.sums
+        return pd.DataFrame({
+            'folds': s['folds'].astype(int),
+            'forecast_units': s['forecast'].round(2),
+            'actual_units': s['actual'],
+            'mape': _ratio(s['ape'], s['ape_folds']),
+            'bias': _ratio(s['forecast'] - s['actual'], s['actual']),
+            'stockout_days': s['stockout'].astype(int),
+            'overstock_units': s['overstock'],
+        })
+
+
+def _ratio(num, den):
+    return np.round(np.divide(num, den, out=np.full(len(num), np.nan), where=den > 0), 4)
+
+
+def cutoff_days(n_days, horizon, step=1, min_history=TRAILING_DAYS):
+    # Cutoffs with at least `min_history` days before and a full horizon after
+    # (a cutoff needs its own day of history, so min_history is at least 1)
+    if min_history < 1:
+        raise ValueError(f"min_history must be at least 1 day, not {min_history}")
+    if step < 1:
+        raise ValueError(f"step must be at least 1 day, not {step}")
+    return np.arange(min_history - 1, n_days - horizon, step)
+
+
+def run_backtest(sales, horizon=N_DAYS_FORECAST, step=1, min_history=TRAILING_DAYS):
+    # -> (per product, per store, per fold) frames
+    dates = sales['date'].dropna()
+    if dates.empty:
+        raise ValueError("no dated sales rows to backtest")
+    first_day = dates.min().normalize()
+    n_days = (dates.max().normalize() - first_day).days + 1
+
+    products = SeriesIndex(sales, ['product_id'], first_day)
+    pairs = SeriesIndex(sales, ['store_id', 'product_id'], first_day)
+    product_totals = FoldTotals(products.n_keys)
+    pair_totals = FoldTotals(pairs.n_keys)
+
+    folds = []
+    for cutoff in cutoff_days(n_days, horizon, step, min_history):
+        forecast, actual, stockout_days, overstock = run_fold(products, cutoff, horizon)
+        product_totals.add(forecast, actual, stockout_days, overstock)
+        pair_totals.add(*run_fold(pairs, cutoff, horizon))
+        sold = actual > 0
+        folds.append({
+            'cutoff': first_day + pd.Timedelta(days=int(cutoff)),
+            'forecast_units': round(float(forecast.sum()), 2),
+            'actual_units': float(actual.sum()),
+            'mape': round(float(np.mean(np.abs(forecast[sold] - actual[sold]) / actual[sold])), 4) if sold.any() else np.nan,
+            'bias': round(float((forecast.sum() - actual.sum()) / actual.sum()), 4) if actual.sum() > 0 else np.nan,
+            'stockout_days': int(stockout_days.sum()),
+            'overstock_units': float(overstock.sum()),
+        })
+    if not folds:
+        raise ValueError(f"history of {n_days} days is too short for a {horizon}-day horizon")
+
+    by_product = pd.concat([products.keys, product_totals.frame()], axis=1)
+
+    # Store scores: per-(store, product) folds summed / averaged per store
+    pair_sums = pd.DataFrame({name: values for name, values in pair_totals.sums.items()})
+    pair_sums['store_id'] = np.asarray(pairs.keys['store_id'])
+    store_sums = pair_sums.groupby('store_id').sum()
+    by_store = pd.DataFrame({
+        'store_id': store_sums.index,
+        'products': pair_sums.groupby('store_id').size().to_numpy(),
+        'forecast_units': store_sums['forecast'].round(2).to_numpy(),
+        'actual_units': store_sums['actual'].to_numpy(),
+        'mape': _ratio(store_sums['ape'].to_numpy(), store_sums['ape_folds'].to_numpy()),
+        'bias': _ratio((store_sums['forecast'] - store_sums['actual']).to_numpy(), store_sums['actual'].to_numpy()),
+        'stockout_days': store_sums['stockout'].astype(int).to_numpy(),
+        'overstock_units': store_sums['overstock'].to_numpy(),
+    })
+    return by_product, by_store, pd.DataFrame(folds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest of forecast + reorder rule")
+    parser.add_argument('--horizon', type=int, default=N_DAYS_FORECAST)
+    parser.add_argument('--step', type=int, default=1, help="days between cutoffs")
+    parser.add_argument('--min-history', type=int, default=TRAILING_DAYS,
+                        help="days of history before the first cutoff")
+    args = parser.parse_args()
+    if args.min_history < 1:
+        parser.error("--min-history must be at least 1 (the cutoff day itself)")
+    if args.step < 1:
+        parser.error("--step must be at least 1")
+
+    sales = load_sales()
+    by_product, by_store, folds = run_backtest(sales, args.horizon, args.step, args.min_history)
+
+    by_product.to_csv('backtest_products.csv', index=False)
+    by_store.to_csv('backtest_stores.csv', index=False)
+    folds.to_csv('backtest_folds.csv', index=False)
+
+    print(f"backtest_products.csv, backtest_stores.csv and backtest_folds.csv created "
+          f"({len(folds)} cutoffs, horizon {args.horizon} days)")
+    print(folds[['mape', 'bias', 'stockout_days', 'overstock_units']].describe().round(3).to_string())
+
+
+if __name__ == '__main__':
+    main()
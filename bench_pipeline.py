@@ -0,0 +1,152 @@
+# bench_pipeline.py
+# Times every pipeline stage on synthetic data and saves the results as JSON,
+# so runs from different commits can be compared.
+#
+#   python bench_pipeline.py --stores 50 --products 5000 --days 365 --out bench.json
+#   python bench_pipeline.py ... --compare bench_before.json
+#
+# Each stage is run on its own (in dependency order, not in parallel) and we
+# record wall time, peak traced memory (tracemalloc, covers NumPy/pandas
+# buffers), rows produced and the time to write its CSVs.
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import pipeline
+from data_loader import load_sales, load_stock
+from streaming import peak_rss_mb
+from synthetic_data import generate
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _stage_func(stage, use_cache):
+    if stage.func in (load_sales, load_stock):
+        return lambda: stage.func(use_cache=use_cache)
+    return stage.func
+
+
+def run_benchmark(data_dir, stages, use_cache=False, write_csv=True):
+    results = []
+    frames = {}
+    cwd = os.getcwd()
+    os.chdir(data_dir)
+    try:
+        for stage in stages:
+            inputs = [frames[name] for name in stage.inputs]
+            func = _stage_func(stage, use_cache)
+
+            tracemalloc.start()
+            start = time.perf_counter()
+            output = func(*inputs)
+            seconds = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            output = (output,) if len(stage.outputs) == 1 else output
+            produced = dict(zip(stage.outputs, output))
+            frames.update(produced)
+
+            write_seconds = 0.0
+            if write_csv:
+                start = time.perf_counter()
+                for name, df in produced.items():
+                    if name in pipeline.SINKS:
+                        df.to_csv(pipeline.SINKS[name], index=False)
+                write_seconds = time.perf_counter() - start
+
+            results.append({
+                'stage': stage.name,
+                'seconds': round(seconds, 4),
+                'write_seconds': round(write_seconds, 4),
+                'peak_mb': round(peak / 2**20, 2),
+                'rows_out': {name: int(len(df)) for name, df in produced.items()},
+            })
+            print(f"{stage.name:<24} {seconds:9.3f}s  write {write_seconds:7.3f}s  "
+                  f"peak {peak / 2**20:9.1f} MB")
+    finally:
+        os.chdir(cwd)
+    return results
+
+
+def compare(current, previous):
+    before = {r['stage']: r for r in previous['stages']}
+    print(f"\n{'stage':<24} {'before':>9} {'after':>9} {'change':>8}")
+    for r in current['stages']:
+        old = before.get(r['stage'])
+        if old is None:
+            continue
+        change = (r['seconds'] - old['seconds']) / old['seconds'] * 100 if old['seconds'] else 0.0
+        print(f"{r['stage']:<24} {old['seconds']:9.3f} {r['seconds']:9.3f} {change:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark all pipeline stages on synthetic data")
+    parser.add_argument('--stores', type=int, default=10)
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', help="use/keep generated data here (default: a temp folder)")
+    parser.add_argument('--stages', nargs='+', metavar='STAGE',
+                        help="only these stages (plus what they depend on)")
+    parser.add_argument('--cache', action='store_true', help="let the loaders use the columnar cache")
+    parser.add_argument('--no-csv', action='store_true', help="don't time CSV writes")
+    parser.add_argument('--out', default='bench_results.json')
+    parser.add_argument('--compare', help="earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    stages = pipeline.select_stages(pipeline.STAGES, args.stages) if args.stages else pipeline.STAGES
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir or tmp
+        if not os.path.exists(os.path.join(data_dir, 'sales.csv')):
+            start = time.perf_counter()
+            counts = generate(data_dir, args.stores, args.products, args.days, seed=args.seed)
+            print(f"generated {counts['sales_rows']} sales rows, {counts['stock_rows']} stock rows "
+                  f"in {time.perf_counter() - start:.1f}s")
+        results = run_benchmark(data_dir, stages, use_cache=args.cache, write_csv=not args.no_csv)
+
+    report = {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'stores': args.stores,
+            'products': args.products,
+            'days': args.days,
+            'seed': args.seed,
+            'cache': args.cache,
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+        },
+        'stages': results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\ntotal {sum(r['seconds'] + r['write_seconds'] for r in results):.3f}s, "
+          f"peak RSS {report['meta']['peak_rss_mb']} MB -> {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,53 +4,55 @@
 import pandas as pd
 import numpy as np
 
-# Load needed files
-forecast = pd.read_csv('future_prediction_summary.csv')
-trends = pd.read_csv('social_trends.csv')
-alerts = pd.read_csv('ai_alerts.csv')
-
-# Normalize column names
-forecast.columns = [c.lower().strip() for c in forecast.columns]
-trends.columns = [c.lower().strip() for c in trends.columns]
-alerts.columns = [c.lower().strip() for c in alerts.columns]
-
-# Merge everything
-df = forecast.merge(
-        trends[['product_id','trend_score','trend_category']],
-        on='product_id', how='left'
-    ).merge(
-        alerts[['product_id','movement']],
-        on='product_id', how='left'
-    )
+from data_loader import normalize_columns
+from features import lookup
+from instrumentation import span
+from rules import buying_priority_labels
 
 # Desired stock = forecast for next 30 * safety factor
 SAFETY_FACTOR = 1.2
-df['optimal_stock_next_30'] = (df['forecast_next_30'] * SAFETY_FACTOR).round(2)
-
-# Units to buy = optimal - current
-df['units_to_buy'] = (df['optimal_stock_next_30'] - df['current_stock']).apply(lambda x: max(0, int(np.ceil(x))))
-
-# Buying priority
-def priority(row):
-    if row['trend_category'] in ['viral','trending'] and row['units_to_buy'] > 0:
-        return 'HIGH'
-    if row['movement'] == 'fast-moving':
-        return 'HIGH'
-    if row['trend_category'] == 'stable' and row['units_to_buy'] > 0:
-        return 'MEDIUM'
-    if row['units_to_buy'] > 0:
-        return 'LOW'
-    return 'NO NEED'
-
-df['buying_priority'] = df.apply(priority, axis=1)
-
-# Final table
-final = df[['product_id','forecast_next_30','trend_category','trend_score',
-            'movement','current_stock','optimal_stock_next_30','units_to_buy',
-            'buying_priority']]
-
-# Save file
-final.to_csv('buying_recommendations.csv', index=False)
-
-print("buying_recommendations.csv generated successfully!")
-print(final.head(20).to_string(index=False))
\ No newline at end of file
+
+
+def recommend_buying(forecast, trends, alerts):
+    # trends is the product feature table from social_trends (trend score /
+    # category and movement per product); look the forecast rows up in it
+    with span('merge trend features', cat='aggregate', rows=len(forecast)):
+        df = lookup(forecast, trends, ['trend_score','trend_category','movement'])
+
+        # Products without a trend row still get their movement from the alerts
+        unranked = ~forecast['product_id'].isin(trends['product_id']).to_numpy()
+        if unranked.any():
+            df.loc[unranked, 'movement'] = lookup(forecast[unranked], alerts, ['movement'])['movement']
+
+    with span('label buying priority', cat='label', rows=len(df)):
+        df['optimal_stock_next_30'] = (df['forecast_next_30'] * SAFETY_FACTOR).round(2)
+
+        # Units to buy = optimal - current, rounded up, never below 0
+        df['units_to_buy'] = np.ceil(df['optimal_stock_next_30'] - df['current_stock']).clip(lower=0).astype('int64')
+
+        # Buying priority (vectorized rule, see rules.py)
+        df['buying_priority'] = buying_priority_labels(df['trend_category'], df['movement'], df['units_to_buy'])
+
+    # Final table
+    return df[['product_id','forecast_next_30','trend_category','trend_score',
+               'movement','current_stock','optimal_stock_next_30','units_to_buy',
+               'buying_priority']]
+
+
+def main():
+    # Load needed files (normalized column names)
+    forecast = normalize_columns(pd.read_csv('future_prediction_summary.csv'))
+    trends = normalize_columns(pd.read_csv('social_trends.csv'))
+    alerts = normalize_columns(pd.read_csv('ai_alerts.csv'))
+
+    final = recommend_buying(forecast, trends, alerts)
+
+    # Save file
+    final.to_csv('buying_recommendations.csv', index=False)
+
+    print("buying_recommendations.csv generated successfully!")
+    print(final.head(20).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,50 +4,112 @@
 # - sales.csv, stock.csv, transfer_suggestions.csv
 # - ai_alerts.csv, store_alerts.csv, expiry_alerts.csv
 # - historical_analysis.csv, product_rankings.csv
-# - future_prediction_daily.csv, future_prediction_summary.csv
+# - future_prediction_segments.npz (or future_prediction_daily.csv),
+#   future_prediction_summary.csv
 # - social_trends.csv, trend_based_recommendations.csv
 # - buying_recommendations.csv
 
+import os
+
 import streamlit as st
 import pandas as pd
 import io
 from datetime import datetime
 
+from forecast_store import DAILY_FILE, SEGMENTS_FILE, load_forecast_daily
+
 st.set_page_config(page_title="Retail AI Dashboard", layout="wide")
 
 st.title("Retail AI Inventory Dashboard — Pooja")
 
+# Tables longer than this are shown one page at a time (server-side paging),
+# so the browser never receives millions of rows at once.
+PAGE_ROWS = 1000
+
+
 # --- helper to load CSVs safely
-@st.cache_data
+# Cached per (path, modification time): a rerun reuses the parsed frame, and
+# a new pipeline output invalidates it automatically. The cached frame is
+# shared, not copied per rerun, so pages must not modify it in place.
+@st.cache_resource(max_entries=32, show_spinner=False)
+def _read_csv(path, mtime):
+    df = pd.read_csv(path)
+    df.columns = [c.lower().strip() for c in df.columns]
+    return df
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
 def load_csv_safe(path):
+    mtime = _mtime(path)
+    if mtime is None:
+        return None
     try:
-        df = pd.read_csv(path)
-        df.columns = [c.lower().strip() for c in df.columns]
-        return df
+        return _read_csv(path, mtime)
     except Exception:
         return None
 
-# Load datasets (some may be missing — handle gracefully)
-sales = load_csv_safe('sales.csv')
-stock = load_csv_safe('stock.csv')
-transfer = load_csv_safe('transfer_suggestions.csv')
-ai_alerts = load_csv_safe('ai_alerts.csv')
-store_alerts = load_csv_safe('store_alerts.csv')
-expiry = load_csv_safe('expiry_alerts.csv')
-historical = load_csv_safe('historical_analysis.csv')
-rankings = load_csv_safe('product_rankings.csv')
-future_daily = load_csv_safe('future_prediction_daily.csv')
-future_summary = load_csv_safe('future_prediction_summary.csv')
-social = load_csv_safe('social_trends.csv')
-trend_reco = load_csv_safe('trend_based_recommendations.csv')
-buying = load_csv_safe('buying_recommendations.csv')
-
-# Small utility: show csv and provide download button
-def show_table_and_download(df, file_label):
-    st.dataframe(df)
-    csv = df.to_csv(index=False).encode('utf-8')
+
+# Download payloads are cached too, so the CSV bytes are not rebuilt on
+# every widget interaction.
+@st.cache_resource(max_entries=32, show_spinner=False)
+def _file_bytes(path, mtime):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _frame_csv_bytes(df):
+    return df.to_csv(index=False).encode('utf-8')
+
+
+# Small utility: show csv (paged if large) and provide download button.
+# Pass `path` when showing a whole file: the download is then the file
+# itself instead of a re-serialized DataFrame.
+def show_table_and_download(df, file_label, path=None):
+    if len(df) > PAGE_ROWS:
+        pages = (len(df) - 1) // PAGE_ROWS + 1
+        page_no = st.number_input(f"Page (1-{pages})", min_value=1, max_value=pages, value=1,
+                                  key=f"page_{file_label}")
+        start = (page_no - 1) * PAGE_ROWS
+        st.caption(f"Rows {start + 1:,}-{min(start + PAGE_ROWS, len(df)):,} of {len(df):,}")
+        st.dataframe(df.iloc[start:start + PAGE_ROWS])
+    else:
+        st.dataframe(df)
+
+    if path is not None and _mtime(path) is not None:
+        csv = _file_bytes(path, _mtime(path))
+    else:
+        csv = _frame_csv_bytes(df)
     st.download_button(label=f"Download {file_label} as CSV", data=csv, file_name=f"{file_label}.csv", mime='text/csv')
 
+
+# The daily forecast as run-length segments (forecast_store.py); only the
+# product / dates shown are expanded to daily rows. Falls back to the daily
+# CSV of older runs. Cached per modification time of both files.
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _forecast_segments(segments_mtime, daily_mtime):
+    return load_forecast_daily(SEGMENTS_FILE, DAILY_FILE)
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def _forecast_by_date(segments_mtime, daily_mtime):
+    return _forecast_segments(segments_mtime, daily_mtime).by_date()
+
+
+# The full daily CSV, expanded from the same segments the charts show (a
+# future_prediction_daily.csv on disk may be from an older run)
+@st.cache_data(max_entries=2, show_spinner=False)
+def _forecast_daily_bytes(segments_mtime, daily_mtime):
+    daily = _forecast_segments(segments_mtime, daily_mtime).daily()
+    return daily.to_csv(index=False).encode('utf-8')
+
+
 # Sidebar navigation
 page = st.sidebar.selectbox("Choose page", [
     "Overview",
@@ -63,6 +125,11 @@ page = st.sidebar.selectbox("Choose page", [
 # ---------- Overview ----------
 if page == "Overview":
     st.header("Overview & KPIs")
+    rankings = load_csv_safe('product_rankings.csv')
+    stock = load_csv_safe('stock.csv')
+    ai_alerts = load_csv_safe('ai_alerts.csv')
+    buying = load_csv_safe('buying_recommendations.csv')
+
     col1, col2, col3, col4 = st.columns(4)
     # KPI calculations (guard against missing files)
     total_products = int(rankings['product_id'].nunique()) if rankings is not None else (len(stock['product_id'].unique()) if stock is not None else 0)
@@ -90,15 +157,47 @@ if page == "Overview":
 # ---------- AI Alerts ----------
 elif page == "AI Alerts":
     st.header("AI Alerts (Product-level)")
+    ai_alerts = load_csv_safe('ai_alerts.csv')
     if ai_alerts is None:
         st.info("ai_alerts.csv not found.")
     else:
         st.subheader("AI Alerts Table")
-        show_table_and_download(ai_alerts, "ai_alerts")
+        show_table_and_download(ai_alerts, "ai_alerts", path='ai_alerts.csv')
         st.subheader("Low stock list")
         if 'status' in ai_alerts.columns:
             st.dataframe(ai_alerts[ai_alerts['status'] == 'low_stock'].sort_values('current_stock'))
         else:
             st.info("No status column in ai_alerts")
 
-# ---------- Store Alerts ---------
\ No newline at end of file
+# ---------- Store Alerts ---------
+
+# ---------- Forecast & Trends ----------
+elif page == "Forecast & Trends":
+    st.header("Forecast (next 30 days)")
+    summary_path, daily_path = 'future_prediction_summary.csv', 'future_prediction_daily.csv'
+    future_summary = load_csv_safe(summary_path)
+    if future_summary is None:
+        st.info("future_prediction_summary.csv not found.")
+    else:
+        st.subheader("Forecast summary per product")
+        show_table_and_download(future_summary, "future_prediction_summary", path=summary_path)
+
+    segments_mtime, daily_mtime = _mtime(SEGMENTS_FILE), _mtime(daily_path)
+    if segments_mtime is None and daily_mtime is None:
+        st.info(f"{SEGMENTS_FILE} / {daily_path} not found.")
+    else:
+        # Aggregated + filtered on the server; only the slice asked for is sent
+        segments = _forecast_segments(segments_mtime, daily_mtime)
+        st.subheader("Total forecast per day (all products)")
+        st.line_chart(_forecast_by_date(segments_mtime, daily_mtime).set_index('date'))
+
+        st.subheader("Daily forecast for one product")
+        product = st.selectbox("Product", segments.products)
+        product_daily = segments.daily(products=[product])
+        st.dataframe(product_daily)
+        st.download_button(label="Download this product's daily forecast as CSV",
+                           data=_frame_csv_bytes(product_daily),
+                           file_name=f"future_prediction_daily_{product}.csv", mime='text/csv')
+        st.download_button(label="Download future_prediction_daily as CSV",
+                           data=_forecast_daily_bytes(segments_mtime, daily_mtime),
+                           file_name="future_prediction_daily.csv", mime='text/csv')
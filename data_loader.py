@@ -0,0 +1,247 @@
+# data_loader.py
+# One place to load sales.csv / stock.csv / products.csv.
+# - normalizes column names (lowercase, qty_sold -> quantity, product -> product_id)
+# - parses dates once, one detected format per file (date_parsing.py)
+# - picks compact dtypes (int32 ids, category store_id, datetime64 dates)
+# - keeps a columnar cache in .cache/ keyed by the source file's path, mtime
+#   and size, so later runs memory-map the cache instead of re-parsing the CSV.
+#
+# Feather (via pyarrow) is used for the cache when installed, pickle otherwise.
+# The feather file is written uncompressed in one chunk per column, so numeric
+# and date columns without missing values are read as views of the mapped
+# file (no decompression, no copy); text, category and columns with missing
+# values are converted to pandas as usual.
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from date_parsing import parse_date_columns, sniff_date_format
+from instrumentation import span
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = feather = None
+
+CACHE_DIR = '.cache'
+CACHE_VERSION = 3
+
+COLUMN_RENAMES = {'product': 'product_id'}
+SALES_RENAMES = {'qty_sold': 'quantity'}
+
+SALES_DATE_COLUMNS = ['date']
+STOCK_DATE_COLUMNS = ['date', 'expiry_date']
+ID_COLUMNS = ['product_id']
+CATEGORY_COLUMNS = ['store_id']
+
+
+def normalize_columns(df, renames=None):
+    # Lowercase + strip column names (and a stray BOM), then apply renames
+    df.columns = [c.lower().strip().lstrip('\ufeff') for c in df.columns]
+    mapping = dict(COLUMN_RENAMES)
+    mapping.update(renames or {})
+    mapping = {old: new for old, new in mapping.items()
+               if old in df.columns and new not in df.columns}
+    return df.rename(columns=mapping)
+
+
+def parse_dates(df, columns, dayfirst=False, date_format=None, label='dates'):
+    # One format for all date columns (detected unless given); the format is
+    # kept in df.attrs['date_format'] so more rows of the same file (chunks,
+    # appended lines) can be read the same way
+    date_format = parse_date_columns(df, columns, dayfirst, date_format, label)
+    if date_format is not None:
+        df.attrs['date_format'] = date_format
+    return df
+
+
+def id_key(value):
+    # ids come as 1, 1.0 or '1' depending on the file, or as text ('S01');
+    # one string key for all of them (whole numbers without the '.0'),
+    # None for a missing id
+    if value is None:
+        return None
+    text = str(value).strip()
+    try:
+        number = float(text)
+    except ValueError:
+        return text or None
+    if number != number:
+        return None
+    return str(int(number)) if number.is_integer() else str(number)
+
+
+def sniff_sales_date_format(path, dayfirst=False):
+    # The date format of the whole sales file (see date_parsing.sniff_date_format)
+    return sniff_date_format(path, SALES_DATE_COLUMNS, dayfirst,
+                             normalize=lambda header: normalize_columns(header, SALES_RENAMES))
+
+
+def compact_dtypes(df):
+    # int32 ids when they are whole numbers with no missing values, category store_id
+    for col in ID_COLUMNS:
+        if col in df.columns and pd.api.types.is_numeric_dtype(df[col]) and df[col].notna().all():
+            values = df[col].to_numpy()
+            if np.array_equal(values, np.floor(values)) and np.abs(values).max(initial=0) < 2**31:
+                df[col] = df[col].astype('int32')
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
+
+# ---- cache helpers ----
+
+def _cache_key(path, **options):
+    st = os.stat(path)
+    raw = '|'.join([os.path.abspath(path), str(st.st_mtime_ns), str(st.st_size),
+                    str(CACHE_VERSION)] + [f'{k}={options[k]}' for k in sorted(options)])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def cache_file(name):
+    # Path for a named frame kept in the cache folder (e.g. persisted state)
+    ext = '.feather' if feather is not None else '.pkl'
+    return os.path.join(CACHE_DIR, name + ext)
+
+
+def source_tag(path):
+    # Short hash of the source file's absolute path, so caches of two files
+    # with the same name in different folders never share a prefix
+    return hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:8]
+
+
+def derived_cache_file(path, name, ext, **options):
+    # Cache path for data built from `path` (an index, a model, ...). The
+    # name changes whenever the source file does, like the frame caches.
+    return os.path.join(CACHE_DIR, f'{name}-{source_tag(path)}-{_cache_key(path, **options)}{ext}')
+
+
+def drop_stale_derived(path, name, ext, keep):
+    # Remove older derived_cache_file()s of `name` for the same source file
+    prefix = f'{name}-{source_tag(path)}-'
+    if not os.path.isdir(CACHE_DIR):
+        return
+    for entry in os.listdir(CACHE_DIR):
+        full = os.path.join(CACHE_DIR, entry)
+        if entry.startswith(prefix) and entry.endswith(ext) and full != keep \
+                and len(entry) == len(prefix) + 16 + len(ext):
+            os.remove(full)
+
+
+def _frame_ext():
+    return '.feather' if feather is not None else '.pkl'
+
+
+def _cache_path(path, **options):
+    # <stem>-<source path hash>-<key>: stock.csv in two folders never collide
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return derived_cache_file(path, stem, _frame_ext(), **options)
+
+
+def _mapped_column(column):
+    # A view of the memory-mapped data where Arrow and NumPy lay it out the
+    # same way (one chunk, no nulls, plain numbers / naive timestamps)
+    if column.num_chunks == 1 and column.null_count == 0 and (
+            pa.types.is_integer(column.type) or pa.types.is_floating(column.type)
+            or (pa.types.is_timestamp(column.type) and column.type.tz is None)):
+        return column.chunk(0).to_numpy(zero_copy_only=True)
+    return column.to_pandas()
+
+
+def read_cached_frame(cache_path):
+    if cache_path.endswith('.feather'):
+        table = feather.read_table(cache_path, memory_map=True)
+        df = pd.DataFrame({name: _mapped_column(column) for name, column in zip(table.column_names, table.columns)},
+                          copy=False)
+        df.attrs.update((table.schema.pandas_metadata or {}).get('attributes', {}))
+        return df
+    return pd.read_pickle(cache_path)
+
+
+def write_cached_frame(df, cache_path):
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    tmp = cache_path + '.tmp'
+    if cache_path.endswith('.feather'):
+        feather.write_feather(df.reset_index(drop=True), tmp, compression='uncompressed',
+                              chunksize=max(len(df), 1))
+    else:
+        df.to_pickle(tmp)
+    os.replace(tmp, cache_path)
+
+
+def _drop_stale(path, keep):
+    # Remove older cache files for the same source file (same folder too)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    drop_stale_derived(path, stem, _frame_ext(), keep)
+
+
+def _load(path, build, use_cache, **options):
+    if not use_cache:
+        return build()
+    cache_path = _cache_path(path, **options)
+    if os.path.exists(cache_path):
+        try:
+            with span('read_cache', cat='load', file=cache_path) as info:
+                df = read_cached_frame(cache_path)
+                info['rows'] = len(df)
+            return df
+        except Exception:
+            pass  # unreadable cache: rebuild it below
+    df = build()
+    try:
+        with span('write_cache', cat='write', rows=len(df), file=cache_path):
+            write_cached_frame(df, cache_path)
+            _drop_stale(path, cache_path)
+    except OSError:
+        pass  # read-only folder: still return the parsed data
+    return df
+
+
+def read_csv(path):
+    with span('read_csv', cat='load', file=path) as info:
+        df = pd.read_csv(path)
+        info['rows'] = len(df)
+    return df
+
+
+def _prepare(raw, renames, date_columns, dayfirst, date_format, label):
+    with span('normalize_columns', cat='normalize', rows=len(raw)):
+        df = normalize_columns(raw, renames)
+    with span('parse_dates', cat='normalize', rows=len(df)):
+        df = parse_dates(df, date_columns, dayfirst, date_format, label)
+    with span('compact_dtypes', cat='normalize', rows=len(df)):
+        return compact_dtypes(df)
+
+
+# ---- public loaders ----
+
+def prepare_sales(raw, dayfirst=False, date_format=None, label='sales'):
+    # Raw sales rows (as read from CSV) -> normalized sales frame
+    return _prepare(raw, SALES_RENAMES, SALES_DATE_COLUMNS, dayfirst, date_format, label)
+
+
+def prepare_stock(raw, dayfirst=False, date_format=None, label='stock'):
+    return _prepare(raw, None, STOCK_DATE_COLUMNS, dayfirst, date_format, label)
+
+
+def load_sales(path='sales.csv', dayfirst=False, use_cache=True):
+    def build():
+        return prepare_sales(read_csv(path), dayfirst=dayfirst, label=path)
+    return _load(path, build, use_cache, dayfirst=dayfirst)
+
+
+def load_stock(path='stock.csv', dayfirst=False, use_cache=True):
+    def build():
+        return prepare_stock(read_csv(path), dayfirst=dayfirst, label=path)
+    return _load(path, build, use_cache, dayfirst=dayfirst)
+
+
+def load_products(path='products.csv', use_cache=True):
+    def build():
+        return compact_dtypes(normalize_columns(read_csv(path)))
+    return _load(path, build, use_cache)
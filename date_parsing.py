@@ -0,0 +1,133 @@
+# date_parsing.py
+# One way to read dates for every script.
+#
+# The format is detected once per file (over the distinct values of all its
+# date columns together), only the distinct strings are parsed, and the
+# results are mapped back to the rows through the factorized codes. On
+# history with millions of rows but a few hundred days that is a few
+# hundred parses instead of millions.
+#
+# Detection tries DATE_FORMATS and keeps the ones every value fits. When a
+# file can't tell month-first from day-first (every day <= 12) month-first
+# wins, unless the caller asks for dayfirst; a file that *can* tell is read
+# the way its values say, whatever the caller asked. Values that don't all
+# fit one format raise MixedDateFormatsError instead of quietly turning
+# into NaT. Blank cells and MISSING_TOKENS are the only values read as NaT.
+
+import numpy as np
+import pandas as pd
+
+# Candidate formats; month-first before day-first (the tie-break)
+DATE_FORMATS = [
+    '%Y-%m-%d',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y/%m/%d',
+    '%m/%d/%Y',
+    '%m/%d/%Y %H:%M',
+    '%m/%d/%Y %H:%M:%S',
+    '%m/%d/%y',
+    '%m-%d-%Y',
+    '%d/%m/%Y',
+    '%d/%m/%Y %H:%M',
+    '%d/%m/%Y %H:%M:%S',
+    '%d/%m/%y',
+    '%d-%m-%Y',
+    '%d.%m.%Y',
+    'ISO8601',
+]
+DAY_FIRST_FORMATS = {fmt for fmt in DATE_FORMATS if fmt.startswith('%d')}
+MISSING_TOKENS = {'', 'nan', 'nat', 'none', 'null', 'n/a', 'na'}
+EXAMPLES = 3
+SNIFF_CHUNK_ROWS = 1_000_000
+
+
+class MixedDateFormatsError(ValueError):
+    pass
+
+
+def _fits(values, fmt):
+    return np.asarray(pd.to_datetime(values, format=fmt, errors='coerce').notna())
+
+
+def detect_format(values, dayfirst=False, label='dates'):
+    # values: distinct non-missing date strings -> the one format they all fit
+    values = pd.Index(values)
+    if len(values) == 0:
+        return None
+    fitting = [fmt for fmt in DATE_FORMATS if _fits(values, fmt).all()]
+    if fitting:
+        preferred = [fmt for fmt in fitting if (fmt in DAY_FIRST_FORMATS) == dayfirst]
+        return (preferred or fitting)[0]
+
+    # No single format: say which values fit what, so the file can be fixed
+    examples = []
+    unmatched = np.ones(len(values), dtype=bool)
+    for fmt in DATE_FORMATS:
+        hit = _fits(values, fmt) & unmatched
+        if hit.any():
+            examples.append(f"{list(values[hit][:EXAMPLES])} fit {fmt}")
+            unmatched &= ~hit
+    if unmatched.any():
+        examples.append(f"{list(values[unmatched][:EXAMPLES])} fit no known format")
+    raise MixedDateFormatsError(f"{label}: no single date format fits every value ({'; '.join(examples)})")
+
+
+def _distinct(series):
+    # (codes, cleaned distinct strings) with missing values coded -1
+    codes, uniques = pd.factorize(series)
+    cleaned = pd.Index(uniques.astype(str)).str.strip()
+    missing = cleaned.str.lower().isin(MISSING_TOKENS)
+    if missing.any():
+        remap = np.where(missing, -1, np.cumsum(~missing) - 1)
+        codes = np.where(codes >= 0, remap[np.maximum(codes, 0)], -1)
+        cleaned = cleaned[~missing]
+    return codes, cleaned
+
+
+def _from_codes(codes, parsed, index, name):
+    out = np.full(len(codes), np.datetime64('NaT'), dtype=parsed.dtype if len(parsed) else 'datetime64[us]')
+    hit = codes >= 0
+    out[hit] = parsed.to_numpy()[codes[hit]]
+    return pd.Series(out, index=index, name=name)
+
+
+def parse_date_columns(df, columns, dayfirst=False, date_format=None, label='dates'):
+    # Parse df's date `columns` in place with one format for all of them.
+    # Returns the format used (pass it back in as date_format to read more
+    # rows of the same file the same way, e.g. chunks or appended lines).
+    todo = [col for col in columns if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col])]
+    if not todo:
+        return date_format
+    distinct = {col: _distinct(df[col]) for col in todo}
+    if date_format is None:
+        values = pd.Index(np.unique(np.concatenate([np.asarray(cleaned, dtype=object)
+                                                    for _, cleaned in distinct.values()])))
+        date_format = detect_format(values, dayfirst, label)
+    for col, (codes, cleaned) in distinct.items():
+        parsed = pd.to_datetime(cleaned, format=date_format, errors='coerce') if date_format else pd.DatetimeIndex([])
+        bad = parsed.isna() if len(parsed) else np.zeros(0, dtype=bool)
+        if bad.any():
+            raise MixedDateFormatsError(f"{label}: {col} values {list(cleaned[bad][:EXAMPLES])} "
+                                        f"don't fit the file's format {date_format}")
+        df[col] = _from_codes(codes, parsed, df.index, col)
+    return date_format
+
+
+def sniff_date_format(path, columns, dayfirst=False, normalize=None, chunksize=SNIFF_CHUNK_ROWS):
+    # Date format of a whole CSV, reading only its date columns (in chunks,
+    # keeping just the distinct values). Callers that read the file in
+    # pieces (chunks, appended lines) pass this in as date_format, so a
+    # first piece that happens to fit both month- and day-first can't pick
+    # the wrong one.
+    header = pd.read_csv(path, nrows=0)
+    names = list(header.columns)
+    normalized = normalize(header).columns if normalize else names
+    usecols = [name for name, norm in zip(names, normalized) if norm in columns]
+    if not usecols:
+        return None
+    values = pd.Index([], dtype=object)
+    for chunk in pd.read_csv(path, usecols=usecols, dtype=str, chunksize=chunksize):
+        for col in usecols:
+            _, cleaned = _distinct(chunk[col])
+            values = values.union(pd.Index(np.asarray(cleaned, dtype=object)))
+    return detect_format(values, dayfirst, label=path)
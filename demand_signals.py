@@ -0,0 +1,311 @@
+# demand_signals.py
+# External demand signals per product (social buzz, search volume, price),
+# fetched concurrently with asyncio from a pluggable source.
+#
+# Sources:
+#   HttpSource  POST {"product_ids": [...]} to a URL, which answers
+#               {"signals": [{"product_id": ..., "social_buzz": ..., ...}]}
+#   FileSource  a CSV with product_id + any of SIGNAL_COLUMNS
+# make_source() picks one from a URL / path.
+#
+# Products are requested in batches of BATCH_SIZE, at most CONCURRENCY
+# batches in flight and no more than RATE_PER_SECOND requests per second.
+# Responses are cached under .cache/ per source with the time they were
+# fetched; a product fetched less than TTL_SECONDS ago isn't asked for again.
+# A batch that times out or fails (after RETRIES) falls back to the cached
+# values however old they are. signal_status says where each row came from:
+#   fetched   just fetched
+#   cached    still fresh in the cache, not requested
+#   stale     not fetched this time (request failed / source doesn't know
+#             the product), older cached value used
+#   missing   not fetched and nothing cached (signals are NaN)
+#
+# 100k products = 200 requests of 500, a few seconds at the default rate.
+#
+#   python demand_signals.py --serve 8766                 # mock signal server
+#   python demand_signals.py --source http://127.0.0.1:8766/signals
+#   python demand_signals.py --source signals.csv --out demand_signals.csv
+#
+# social_trends.py --signals <source> uses these for social_buzz.
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import urllib.request
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from data_loader import cache_file, normalize_columns, read_cached_frame, write_cached_frame
+
+SIGNAL_COLUMNS = ['social_buzz', 'search_volume', 'price']
+BATCH_SIZE = 500
+CONCURRENCY = 8
+RATE_PER_SECOND = 50.0
+TIMEOUT_SECONDS = 5.0
+RETRIES = 1
+TTL_SECONDS = 6 * 3600
+
+# Errors that make a batch fall back to the cache (TimeoutError is an OSError)
+FETCH_ERRORS = (OSError, ValueError, KeyError, TypeError)
+
+
+def product_keys(values):
+    # Product ids as strings, the same for 12, 12.0 and '12'
+    values = pd.Series(np.asarray(values))
+    if pd.api.types.is_float_dtype(values) and (values.dropna() % 1 == 0).all():
+        values = values.astype('Int64')
+    return values.astype(str).to_numpy(dtype=object)
+
+
+# ---- sources ----
+
+class HttpSource:
+
+    def __init__(self, url, timeout=TIMEOUT_SECONDS):
+        self.url = url
+        self.name = url
+        self.timeout = timeout
+
+    def fetch(self, keys):
+        # Blocking; run on the fetcher's thread pool
+        body = json.dumps({'product_ids': list(keys)}).encode('utf-8')
+        request = urllib.request.Request(self.url, data=body, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.load(response)['signals']
+
+
+class FileSource:
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.abspath(path)
+        self._records = None
+        self._lock = threading.Lock()
+
+    def fetch(self, keys):
+        with self._lock:  # read the file once, whichever batch comes first
+            if self._records is None:
+                df = normalize_columns(pd.read_csv(self.path))
+                df['product_id'] = product_keys(df['product_id'])
+                df = df[['product_id'] + [c for c in SIGNAL_COLUMNS if c in df.columns]]
+                self._records = df.drop_duplicates('product_id', keep='last').set_index('product_id', drop=False)
+        found = self._records.reindex(pd.Index(keys)).dropna(subset=['product_id'])
+        return found.to_dict('records')
+
+
+def make_source(spec, timeout=TIMEOUT_SECONDS):
+    if spec.startswith(('http://', 'https://')):
+        return HttpSource(spec, timeout)
+    return FileSource(spec)
+
+
+# ---- cache ----
+
+def _cache_path(source):
+    return cache_file('demand_signals-' + hashlib.sha1(source.name.encode('utf-8')).hexdigest()[:16])
+
+
+def _empty_signals():
+    return pd.DataFrame({'product_id': pd.Series(dtype=object),
+                         **{c: pd.Series(dtype=float) for c in SIGNAL_COLUMNS},
+                         'fetched_at': pd.Series(dtype=float)})
+
+
+def read_signal_cache(source):
+    path = _cache_path(source)
+    if not os.path.exists(path):
+        return _empty_signals()
+    cached = read_cached_frame(path)
+    cached['product_id'] = cached['product_id'].astype(object)
+    return cached
+
+
+def write_signal_cache(source, cached):
+    write_cached_frame(cached, _cache_path(source))
+
+
+# ---- fetching ----
+
+class RateLimiter:
+    # Spaces requests at least 1 / rate seconds apart (no limit if rate is falsy)
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_slot = 0.0
+
+    async def wait(self):
+        now = time.monotonic()
+        slot = max(now, self.next_slot)
+        self.next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+async def _fetch_batches(source, keys, batch_size, concurrency, rate, timeout, retries):
+    # -> (records, keys of failed batches, requests made)
+    loop = asyncio.get_running_loop()
+    limiter = RateLimiter(rate)
+    slots = asyncio.Semaphore(concurrency)
+    requests = 0
+
+    async def fetch(batch):
+        nonlocal requests
+        async with slots:
+            for attempt in range(retries + 1):
+                await limiter.wait()
+                requests += 1
+                try:
+                    return await asyncio.wait_for(loop.run_in_executor(pool, source.fetch, batch), timeout), None
+                except FETCH_ERRORS:
+                    if attempt == retries:
+                        return [], batch
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = await asyncio.gather(*(fetch(keys[i:i + batch_size]) for i in range(0, len(keys), batch_size)))
+    records = [record for found, _ in results for record in found]
+    failed = [key for _, batch in results if batch is not None for key in batch]
+    return records, failed, requests
+
+
+async def fetch_signals(products, source, ttl=TTL_SECONDS, batch_size=BATCH_SIZE, concurrency=CONCURRENCY,
+                        rate=RATE_PER_SECOND, timeout=TIMEOUT_SECONDS, retries=RETRIES, now=None):
+    # Signals for `products` (in that order): product_id, SIGNAL_COLUMNS,
+    # fetched_at, signal_status. Counts per status are in .attrs['signal_stats'].
+    now = time.time() if now is None else now
+    keys = product_keys(products)
+    cached = read_signal_cache(source).drop_duplicates('product_id', keep='last').set_index('product_id')
+    known = cached.reindex(pd.Index(keys))
+    fresh = (now - known['fetched_at'] < ttl).to_numpy()
+    wanted = pd.unique(keys[~fresh & pd.notna(np.asarray(products))])
+
+    records, failed, requests = await _fetch_batches(source, list(wanted), batch_size, concurrency,
+                                                     rate, timeout, retries)
+    fetched = pd.DataFrame.from_records(records, columns=['product_id'] + SIGNAL_COLUMNS)
+    fetched['product_id'] = product_keys(fetched['product_id'])
+    fetched = fetched.drop_duplicates('product_id', keep='last').set_index('product_id')
+    fetched[SIGNAL_COLUMNS] = fetched[SIGNAL_COLUMNS].apply(pd.to_numeric, errors='coerce')
+    fetched['fetched_at'] = now
+
+    if len(fetched):
+        cached = pd.concat([cached.drop(fetched.index, errors='ignore'), fetched])
+        write_signal_cache(source, cached.rename_axis('product_id').reset_index())
+
+    signals = cached.reindex(pd.Index(keys))
+    status = np.select([pd.Index(keys).isin(fetched.index), fresh, signals['fetched_at'].notna().to_numpy()],
+                       ['fetched', 'cached', 'stale'], 'missing')
+
+    result = signals[SIGNAL_COLUMNS + ['fetched_at']].reset_index(drop=True)
+    result.insert(0, 'product_id', np.asarray(products))
+    result['signal_status'] = status
+    stats = pd.Series(status).value_counts().to_dict()
+    stats.update(requests=requests, failed_products=len(failed))
+    result.attrs['signal_stats'] = stats
+    return result
+
+
+def load_signals(products, source, **options):
+    # fetch_signals() from synchronous code; source may be a URL / path
+    if isinstance(source, str):
+        source = make_source(source, options.get('timeout', TIMEOUT_SECONDS))
+    return asyncio.run(fetch_signals(products, source, **options))
+
+
+# ---- mock server ----
+
+def mock_signals(keys):
+    # Stable made-up signals per product id (same scale as the old random buzz)
+    records = []
+    for key in keys:
+        h = zlib.crc32(str(key).encode('utf-8'))
+        records.append({'product_id': key, 'social_buzz': 10 + h % 90,
+                        'search_volume': (h >> 8) % 5000, 'price': round(1 + (h >> 16) % 20000 / 100, 2)})
+    return records
+
+
+def make_mock_handler(latency=0.0, fail_rate=0.0, verbose=False):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            try:
+                keys = json.loads(self.rfile.read(length))['product_ids']
+            except (ValueError, KeyError):
+                return self._reply(400, {'error': 'expected {"product_ids": [...]}'})
+            time.sleep(latency)
+            if random.random() < fail_rate:
+                return self._reply(503, {'error': 'simulated failure'})
+            self._reply(200, {'signals': mock_signals(keys)})
+
+        def _reply(self, status, body):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            if verbose:
+                super().log_message(format, *args)
+
+    return Handler
+
+
+def serve_mock(host='127.0.0.1', port=8766, latency=0.0, fail_rate=0.0, verbose=False):
+    server = ThreadingHTTPServer((host, port), make_mock_handler(latency, fail_rate, verbose))
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch external demand signals per product (or serve mock ones)")
+    parser.add_argument('--source', help="signal URL (http://...) or CSV path")
+    parser.add_argument('--products', default='product_rankings.csv',
+                        help="CSV whose product_id column lists the products to fetch")
+    parser.add_argument('--out', default='demand_signals.csv')
+    parser.add_argument('--ttl', type=float, default=TTL_SECONDS, help="seconds a cached signal stays fresh")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY)
+    parser.add_argument('--rate', type=float, default=RATE_PER_SECOND, help="max requests per second")
+    parser.add_argument('--timeout', type=float, default=TIMEOUT_SECONDS, help="seconds per request")
+    parser.add_argument('--serve', type=int, metavar='PORT', help="run the mock signal server instead")
+    parser.add_argument('--latency', type=float, default=0.0, help="mock server: seconds per response")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="mock server: share of requests that fail")
+    args = parser.parse_args()
+
+    if args.serve is not None:
+        server = serve_mock(port=args.serve, latency=args.latency, fail_rate=args.fail_rate)
+        print(f"mock signals on http://127.0.0.1:{server.server_port}/signals")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return
+    if not args.source:
+        parser.error("--source is required (or --serve PORT)")
+
+    products = normalize_columns(pd.read_csv(args.products))['product_id'].dropna().unique()
+    start = time.perf_counter()
+    signals = load_signals(products, args.source, ttl=args.ttl, batch_size=args.batch_size,
+                           concurrency=args.concurrency, rate=args.rate, timeout=args.timeout)
+    signals.to_csv(args.out, index=False)
+    print(f"{args.out}: {len(signals):,} products in {time.perf_counter() - start:.2f}s "
+          f"{signals.attrs['signal_stats']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+# event_stream.py
+# Live stock levels from a stream of sale / receipt events.
+#
+# Starts from stock.csv (summed per store x product), then applies events as
+# they arrive and re-checks the stock status (rules.stock_status_labels:
+# REORDER_LEVEL / OVERSTOCK_THRESHOLD) only for the keys an event touched.
+# Whenever a key's status changes an alert is printed as a JSON line.
+#
+# Event lines (CSV or JSON, mixed is fine):
+#   sale,3,17,2                      type, store_id, product_id, qty
+#   {"type": "receipt", "store_id": 3, "product_id": 17, "qty": 40}
+#   sale,S01,P17,2                   text ids work too
+# Ids are matched on data_loader.id_key (3, 3.0 and '3' are one store);
+# alerts and the stock table show the ids as stock.csv has them (whole
+# numbers as ints), or as the event wrote them for keys stock.csv lacks.
+#
+# Sources: a file that keeps growing (--tail, like `tail -f`), stdin
+# (--stdin) or a local TCP socket taking one event per line (--listen).
+# Events are applied in small batches (up to BATCH_EVENTS, or whatever
+# arrived within FLUSH_SECONDS), so an alert shows up well under a second
+# after the sale.
+#
+# Shelves can't go below zero: each event is applied in arrival order with
+# the zero floor after every one (a sale of 10 on a shelf of 5 leaves 0,
+# a receipt of 20 after it makes 20). Within a batch that is computed per
+# key from the running sum of its events, so the levels are the same
+# however the stream happens to be cut into batches.
+#
+#   python event_stream.py --tail events.log --alerts-out live_alerts.jsonl
+#   python event_stream.py --listen 127.0.0.1:9009
+#   python event_stream.py --bench 1000000
+
+import argparse
+import json
+import os
+import queue
+import socketserver
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_loader import id_key, load_stock
+from rules import reorder_suggestions, stock_status_labels
+
+EVENT_SIGN = {'sale': -1.0, 'receipt': 1.0}
+BATCH_EVENTS = 20000
+FLUSH_SECONDS = 0.1
+TAIL_POLL_SECONDS = 0.2
+
+
+def parse_event(line):
+    # -> (signed qty, store key, product key) or None for a bad line
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        if line[0] == '{':
+            event = json.loads(line)
+            kind, store, product, qty = event['type'], event['store_id'], event['product_id'], event['qty']
+        else:
+            kind, store, product, qty = line.split(',')[:4]
+        store, product = id_key(store), id_key(product)
+        if store is None or product is None:
+            return None
+        return EVENT_SIGN[kind.strip().lower()] * float(qty), store, product
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+def _id_labels(values):
+    # Distinct ids (codes into them, -1 for missing) as plain Python values;
+    # whole-number floats (ids with gaps in the file) become ints again
+    codes, labels = pd.factorize(np.asarray(values), sort=True)
+    labels = np.asarray(labels)
+    if labels.dtype.kind == 'f' and np.array_equal(labels, np.floor(labels)):
+        labels = labels.astype('int64')
+    return codes, labels.tolist()
+
+
+class LiveStock:
+    # Stock level + status per (store_id, product_id), updated in place.
+    # slots is keyed on id_key strings; keys holds the ids to show per slot.
+
+    def __init__(self, stock):
+        store_code, store_labels = _id_labels(stock['store_id'])
+        product_code, product_labels = _id_labels(stock['product_id'])
+        store_keys = np.array([id_key(label) for label in store_labels] + [None], dtype=object)
+        product_keys = np.array([id_key(label) for label in product_labels] + [None], dtype=object)
+        levels = pd.DataFrame({'store': store_keys[store_code], 'product': product_keys[product_code],
+                               'store_code': store_code, 'product_code': product_code,
+                               'stock_level': stock['stock_level'].to_numpy(dtype=float)})
+        levels = levels.dropna(subset=['store', 'product']).sort_values(['store_code', 'product_code'], kind='stable')
+        levels = levels.groupby(['store', 'product'], sort=False).agg(
+            store_code=('store_code', 'first'), product_code=('product_code', 'first'),
+            stock_level=('stock_level', 'sum'))
+
+        self.keys = [(store_labels[s], product_labels[p])
+                     for s, p in zip(levels['store_code'], levels['product_code'])]
+        self.slots = {key: i for i, key in enumerate(levels.index)}
+        self.size = len(self.keys)
+        self.level = np.zeros(max(16, self.size))
+        self.level[:self.size] = levels['stock_level'].to_numpy()
+        self.status = np.empty(len(self.level), dtype=object)
+        self.status[:self.size] = stock_status_labels(pd.Series(self.level[:self.size])).to_numpy()
+        self.events = 0
+        self.bad_lines = 0
+
+    def _new_slot(self, key):
+        # A key stock.csv doesn't have; shown as the event's ids
+        if self.size == len(self.level):
+            self.level = np.concatenate([self.level, np.zeros(len(self.level))])
+            self.status = np.concatenate([self.status, np.empty(len(self.status), dtype=object)])
+        slot = self.size
+        self.slots[key] = slot
+        self.keys.append(key)
+        self.level[slot] = 0.0
+        self.status[slot] = 'out_of_stock'
+        self.size += 1
+        return slot
+
+    def apply_lines(self, lines):
+        parsed = [event for event in map(parse_event, lines) if event is not None]
+        self.bad_lines += sum(1 for line in lines if line.strip()) - len(parsed)
+        return self.apply(parsed)
+
+    def apply(self, events):
+        # events: [(signed qty, store key, product key), ...] (keys as
+        # parse_event gives them) -> list of alerts
+        if not events:
+            return []
+        slots_of = self.slots
+        slots = np.fromiter((slots_of.get((store, product)) if (store, product) in slots_of
+                             else self._new_slot((store, product)) for _, store, product in events),
+                            dtype=np.int64, count=len(events))
+        deltas = np.fromiter((qty for qty, _, _ in events), dtype=float, count=len(events))
+        self.events += len(events)
+
+        # Events per key in arrival order. With the floor after every event
+        # a key ends at  total + max(start, -lowest running sum)
+        order = np.argsort(slots, kind='stable')
+        slots, deltas = slots[order], deltas[order]
+        changed, first, counts = np.unique(slots, return_index=True, return_counts=True)
+        running = np.cumsum(deltas)
+        running -= np.repeat(running[first] - deltas[first], counts)
+        total = np.add.reduceat(deltas, first)
+        lowest = np.minimum.reduceat(running, first)
+        self.level[changed] = total + np.maximum(self.level[changed], -lowest)
+
+        # Only the keys touched by this batch are re-checked
+        level = pd.Series(self.level[changed])
+        status = stock_status_labels(level).to_numpy()
+        moved = status != self.status[changed]
+        if not moved.any():
+            return []
+
+        previous = self.status[changed][moved]
+        self.status[changed] = status
+        moved_slots = changed[moved]
+        suggestion = reorder_suggestions(level[moved], pd.Series(status[moved], index=level.index[moved]),
+                                         as_int=True).to_numpy()
+        return [{'store_id': self.keys[slot][0], 'product_id': self.keys[slot][1],
+                 'stock_level': float(self.level[slot]), 'status': status[moved][i],
+                 'previous_status': previous[i], 'reorder_suggestion': int(suggestion[i])}
+                for i, slot in enumerate(moved_slots)]
+
+    def frame(self):
+        return pd.DataFrame({
+            'store_id': [key[0] for key in self.keys],
+            'product_id': [key[1] for key in self.keys],
+            'stock_level': self.level[:self.size],
+            'status': self.status[:self.size],
+        })
+
+
+# ---- sources: each pushes lists of lines into a queue, None at the end ----
+
+def tail_source(path, out, stop, from_start=False):
+    pos = 0 if from_start or not os.path.exists(path) else os.path.getsize(path)
+    pending = ''
+    while not stop.is_set():
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size < pos:
+            pos, pending = 0, ''  # file was truncated / replaced
+        if size > pos:
+            with open(path) as f:
+                f.seek(pos)
+                data = f.read()
+                pos = f.tell()
+            lines = (pending + data).split('\n')
+            pending = lines.pop()  # keep a half-written last line for later
+            if lines:
+                out.put(lines)
+        else:
+            stop.wait(TAIL_POLL_SECONDS)
+
+
+def stdin_source(out, stop, batch=BATCH_EVENTS):
+    lines = []
+    for line in sys.stdin:
+        lines.append(line)
+        if len(lines) >= batch:
+            out.put(lines)
+            lines = []
+    if lines:
+        out.put(lines)
+    out.put(None)
+
+
+def socket_source(host, port, out, stop):
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            lines = []
+            for raw in self.rfile:
+                lines.append(raw.decode('utf-8', 'replace'))
+                if len(lines) >= BATCH_EVENTS:
+                    out.put(lines)
+                    lines = []
+            if lines:
+                out.put(lines)
+
+    server = socketserver.ThreadingTCPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stop.wait()
+    server.shutdown()
+
+
+def consume(live, lines_queue, on_alerts, stop):
+    # Apply whatever has arrived, at most every FLUSH_SECONDS
+    while not stop.is_set():
+        try:
+            chunk = lines_queue.get(timeout=FLUSH_SECONDS)
+        except queue.Empty:
+            continue
+        if chunk is None:
+            return
+        lines = list(chunk)
+        while len(lines) < BATCH_EVENTS:
+            try:
+                chunk = lines_queue.get_nowait()
+            except queue.Empty:
+                break
+            if chunk is None:
+                on_alerts(live.apply_lines(lines))
+                return
+            lines.extend(chunk)
+        on_alerts(live.apply_lines(lines))
+
+
+def synthetic_events(live, n_events, seed=42):
+    # Random sale / receipt lines over the existing keys (mostly sales)
+    rng = np.random.default_rng(seed)
+    keys = live.keys
+    pick = rng.integers(0, len(keys), size=n_events)
+    kinds = np.where(rng.random(n_events) < 0.9, 'sale', 'receipt')
+    qty = np.where(kinds == 'sale', rng.integers(1, 4, size=n_events), rng.integers(10, 60, size=n_events))
+    return [f"{k},{keys[i][0]},{keys[i][1]},{q}" for k, i, q in zip(kinds, pick, qty)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply sale / receipt events to live stock and alert on status changes")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--tail', metavar='PATH', help="follow a growing event file")
+    source.add_argument('--stdin', action='store_true', help="read events from stdin")
+    source.add_argument('--listen', metavar='HOST:PORT', help="accept events on a local TCP socket")
+    source.add_argument('--bench', type=int, metavar='N', help="time N synthetic events and exit")
+    parser.add_argument('--from-start', action='store_true', help="with --tail, also apply lines already in the file")
+    parser.add_argument('--alerts-out', help="append alerts here (JSON lines) instead of stdout")
+    parser.add_argument('--stock-out', help="write the live stock table here on exit")
+    args = parser.parse_args()
+
+    live = LiveStock(load_stock())
+
+    if args.bench:
+        lines = synthetic_events(live, args.bench)
+        start = time.perf_counter()
+        alerts = 0
+        for i in range(0, len(lines), BATCH_EVENTS):
+            alerts += len(live.apply_lines(lines[i:i + BATCH_EVENTS]))
+        seconds = time.perf_counter() - start
+        print(f"{live.events} events in {seconds:.2f}s ({live.events / seconds:,.0f} events/s), "
+              f"{alerts} status changes over {live.size} keys")
+        return
+
+    alerts_file = open(args.alerts_out, 'a') if args.alerts_out else sys.stdout
+
+    def on_alerts(alerts):
+        for alert in alerts:
+            alerts_file.write(json.dumps(alert) + '\n')
+        if alerts:
+            alerts_file.flush()
+
+    lines_queue = queue.Queue()
+    stop = threading.Event()
+    if args.tail:
+        target, target_args = tail_source, (args.tail, lines_queue, stop, args.from_start)
+    elif args.stdin:
+        target, target_args = stdin_source, (lines_queue, stop)
+    else:
+        host, port = args.listen.rsplit(':', 1)
+        target, target_args = socket_source, (host, int(port), lines_queue, stop)
+    threading.Thread(target=target, args=target_args, daemon=True).start()
+
+    try:
+        consume(live, lines_queue, on_alerts, stop)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        print(f"[events] {live.events} applied, {live.bad_lines} bad lines skipped", file=sys.stderr)
+        if args.stock_out:
+            live.frame().to_csv(args.stock_out, index=False)
+        if alerts_file is not sys.stdout:
+            alerts_file.close()
+
+
+if __name__ == '__main__':
+    main()
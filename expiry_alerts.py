@@ -1,36 +1,62 @@
-import pandas as pd
-from datetime import datetime
-
-# Load stock file
-stock = pd.read_csv('stock.csv')
-
-# Normalize columns
-stock.columns = [c.lower().strip() for c in stock.columns]
-
-# Convert expiry_date to datetime
-stock['expiry_date'] = pd.to_datetime(stock['expiry_date'], errors='coerce')
-
-# Calculate days left
-today = pd.Timestamp.today().normalize()
-stock['days_left'] = (stock['expiry_date'] - today).dt.days
-
-# Create expiry status
-def expiry_status(days):
-    if pd.isna(days):
-        return "unknown"
-    if days < 0:
-        return "expired"
-    if days <= 7:
-        return "expiring_soon"
-    return "safe"
-
-stock['expiry_status'] = stock['days_left'].apply(expiry_status)
-
-# Select final columns
-expiry_alerts = stock[['store_id','product_id','stock_level','expiry_date',
-                       'days_left','expiry_status']]
-
-expiry_alerts.to_csv('expiry_alerts.csv', index=False)
-
-print("expiry_alerts.csv generated successfully!")
-print(expiry_alerts.head(30).to_string(index=False))
\ No newline at end of file
+import argparse
+
+import numpy as np
+
+from data_loader import load_sales, load_stock
+from expiry_index import ExpiryIndex, as_of_date, load_expiry_index, lot_velocity, store_velocity
+from instrumentation import span
+from rules import expiry_status_labels, fefo_status_labels
+
+
+def build_expiry_alerts(stock, sales=None, as_of=None, index=None):
+    expiry_alerts = stock[['store_id','product_id','stock_level','expiry_date']].copy()
+
+    # Calculate days left
+    today = as_of_date(as_of)
+    with span('label expiry status', cat='label', rows=len(stock)):
+        expiry_alerts['days_left'] = (expiry_alerts['expiry_date'] - today).dt.days
+
+        # Create expiry status (vectorized rule, see rules.py)
+        expiry_alerts['expiry_status'] = expiry_status_labels(expiry_alerts['days_left'])
+
+    # Units that will still be on the shelf at expiry if every store sells
+    # its lots first-expired-first-out at its average rate
+    if sales is not None:
+        if index is None:
+            with span('build expiry index', cat='aggregate', rows=len(stock)):
+                index = ExpiryIndex.from_stock(stock)
+        with span('aggregate store velocity', cat='aggregate', rows=len(sales)):
+            velocity = store_velocity(sales)
+            lot_rate = lot_velocity(index, velocity)
+        with span('fefo depletion', cat='aggregate', rows=len(index)):
+            _, unsold = index.fefo(lot_rate, today)
+        rate = np.full(len(stock), np.nan)
+        expected_unsold = np.full(len(stock), np.nan)
+        rate[index.lot_row] = lot_rate
+        expected_unsold[index.lot_row] = unsold
+        expiry_alerts['avg_daily_sale'] = rate
+        expiry_alerts['expected_unsold'] = expected_unsold
+        with span('label fefo status', cat='label', rows=len(stock)):
+            expiry_alerts['fefo_status'] = fefo_status_labels(expiry_alerts['days_left'],
+                                                              expiry_alerts['expected_unsold'])
+    return expiry_alerts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Expiry status per stock lot")
+    parser.add_argument('--as-of', help="date to count days left from (default: today)")
+    args = parser.parse_args()
+
+    # Load stock file (normalized, dates parsed, cached by data_loader)
+    stock = load_stock()
+    sales = load_sales()
+
+    expiry_alerts = build_expiry_alerts(stock, sales, args.as_of, index=load_expiry_index())
+    expiry_alerts.to_csv('expiry_alerts.csv', index=False)
+
+    print("expiry_alerts.csv generated successfully!")
+    print(expiry_alerts.head(30).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+# expiry_index.py
+# Persistent expiry index over stock lots (one stock.csv row = one lot).
+#
+# Lots are kept as NumPy arrays sorted by (store, expiry day), so each store's
+# lots form one contiguous slice with its days in order (a day bucket is a
+# run inside that slice). "What expires in the next N days at store S" is
+# two searchsorted calls on the slice; a second by-day order answers the
+# same question across all stores. The index is saved as .npz in .cache/,
+# keyed by stock.csv's mtime/size, so it's only rebuilt when the file changes.
+# Store and product ids are kept as they are in the file (factorized into
+# codes), so text ids work and numbers don't turn into floats.
+#
+# FEFO (first-expired-first-out): with a sales velocity per (store, product),
+# every lot is assumed to sell in expiry order, which tells us how many units
+# of each lot are still on the shelf when it expires.
+#
+#   python expiry_index.py --days 7 --store 3 --as-of 2025-05-01
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_loader import derived_cache_file, drop_stale_derived, load_stock
+
+INDEX_NAME = 'expiry_index'
+ARRAYS = ['stores', 'products', 'lot_store', 'lot_day', 'lot_row', 'lot_product', 'lot_qty']
+
+
+def as_of_date(as_of=None):
+    # The one "today" used by every expiry check (default: the real today)
+    return pd.Timestamp(as_of if as_of is not None else pd.Timestamp.today()).normalize()
+
+
+def day_number(date):
+    return int((pd.Timestamp(date) - pd.Timestamp(0)).days)
+
+
+def _storable(values):
+    # Object / string ids as fixed-width unicode, so np.load needs no pickle
+    values = np.asarray(values)
+    return values.astype(str) if values.dtype.kind in 'OTU' else values
+
+
+def _labels(values, codes):
+    # Ids for codes, NaN where the code is -1 (missing id)
+    return pd.api.extensions.take(values, codes, allow_fill=True)
+
+
+class ExpiryIndex:
+
+    def __init__(self, stores, products, lot_store, lot_day, lot_row, lot_product, lot_qty):
+        # Lot arrays must already be sorted by (lot_store, lot_day)
+        self.stores = stores            # store_id values, sorted
+        self.products = products        # product_id values, sorted
+        self.lot_store = lot_store      # position in `stores`
+        self.lot_day = lot_day          # expiry as days since 1970-01-01
+        self.lot_row = lot_row          # row number in the stock frame
+        self.lot_product = lot_product  # position in `products` (-1: no product_id)
+        self.lot_qty = lot_qty
+        self.store_start = np.searchsorted(lot_store, np.arange(len(stores) + 1))
+        self.by_day = np.argsort(lot_day, kind='stable')
+        self.day_sorted = lot_day[self.by_day]
+
+    @classmethod
+    def from_stock(cls, stock):
+        # Lots without a store or expiry date can't be indexed and are left out
+        store, stores = pd.factorize(np.asarray(stock['store_id']), sort=True)
+        product, products = pd.factorize(np.asarray(stock['product_id']), sort=True)
+        expiry = stock['expiry_date']
+        keep = (store >= 0) & expiry.notna().to_numpy()
+        rows = np.flatnonzero(keep)
+
+        lot_store = store[keep].astype('int32')
+        lot_day = (expiry[keep] - pd.Timestamp(0)).dt.days.to_numpy().astype('int32')
+        order = np.lexsort((lot_day, lot_store))
+        return cls(_storable(stores), _storable(products), lot_store[order], lot_day[order],
+                   rows[order].astype('int64'), product[keep][order].astype('int32'),
+                   np.nan_to_num(stock['stock_level'].to_numpy(dtype=float)[keep][order]))
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, **{name: getattr(self, name) for name in ARRAYS})
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(*[data[name] for name in ARRAYS])
+
+    def __len__(self):
+        return len(self.lot_day)
+
+    # ---- queries ----
+
+    def expiring(self, days, as_of=None, store=None, include_expired=False):
+        # Lot positions expiring between as_of and as_of + days (inclusive),
+        # earliest first. include_expired also returns lots already past.
+        today = day_number(as_of_date(as_of))
+        if store is None:
+            day_sorted, offset, order = self.day_sorted, 0, self.by_day
+        else:
+            pos = pd.Index(self.stores).get_indexer([store])[0]
+            if pos < 0:
+                return np.zeros(0, dtype='int64')
+            lo, hi = self.store_start[pos], self.store_start[pos + 1]
+            day_sorted, offset, order = self.lot_day[lo:hi], lo, None
+        # Keys in the array's dtype, so searchsorted doesn't convert the array
+        first = 0 if include_expired else np.searchsorted(day_sorted, day_sorted.dtype.type(today), side='left')
+        last = np.searchsorted(day_sorted, day_sorted.dtype.type(today + days), side='right')
+        if order is None:
+            return np.arange(offset + first, offset + last)
+        return order[first:last]
+
+    def rows(self, positions):
+        # Stock row numbers for lot positions, in stock file order
+        return np.sort(self.lot_row[positions])
+
+    def lots(self, positions):
+        return pd.DataFrame({
+            'store_id': self.stores[self.lot_store[positions]],
+            'product_id': _labels(self.products, self.lot_product[positions]),
+            'stock_level': self.lot_qty[positions],
+            'expiry_date': pd.Timestamp(0) + pd.to_timedelta(self.lot_day[positions], unit='D'),
+        })
+
+    # ---- FEFO ----
+
+    def fefo(self, velocity, as_of=None):
+        # velocity: units/day per lot (aligned with the lot arrays). Returns
+        # (expected_sold, expected_unsold) per lot when each (store, product)
+        # sells its lots in expiry order at that rate until they expire.
+        days_to_sell = np.maximum(0, self.lot_day - day_number(as_of_date(as_of))).astype(float)
+        rate = np.nan_to_num(np.asarray(velocity, dtype=float))
+
+        # Group lots by (store, product); rank them by expiry inside each group
+        order = np.lexsort((self.lot_day, self.lot_product, self.lot_store))
+        group_key = np.stack([self.lot_store[order], self.lot_product[order]])
+        new_group = np.r_[True, (np.diff(group_key, axis=1) != 0).any(axis=0)]
+        group = np.cumsum(new_group) - 1
+        starts = np.flatnonzero(new_group)
+        rank = np.arange(len(order)) - starts[group]
+
+        # One pass per lot rank, vectorized across all groups: a lot sells
+        # whatever demand is left once the earlier lots are used up
+        sold = np.zeros(len(order))
+        used = np.zeros(len(starts))
+        for r in range(int(rank.max()) + 1 if len(rank) else 0):
+            at = np.flatnonzero(rank == r)
+            lots, groups = order[at], group[at]
+            demand = rate[lots] * days_to_sell[lots]
+            take = np.clip(demand - used[groups], 0, self.lot_qty[lots])
+            sold[lots] = take
+            used[groups] += take
+        return sold, self.lot_qty - sold
+
+
+def store_velocity(sales):
+    # Average units sold per day for each (store, product): total sold over
+    # the days it has sales on, the same rate as store_alerts' avg_daily_sales
+    keys = pd.DataFrame({'store_id': np.asarray(sales['store_id']),
+                         'product_id': np.asarray(sales['product_id']),
+                         'quantity': sales['quantity'].to_numpy(),
+                         'date': sales['date'].to_numpy()})
+    stats = keys.groupby(['store_id', 'product_id']).agg(
+        total_sold=('quantity', 'sum'), days_observed=('date', 'nunique'))
+    return stats['total_sold'] / stats['days_observed']
+
+
+def lot_velocity(index, velocity):
+    # Per-lot rate from a (store_id, product_id) -> units/day Series
+    lot_keys = pd.MultiIndex.from_arrays([index.stores[index.lot_store],
+                                          _labels(index.products, index.lot_product)])
+    return velocity.reindex(lot_keys).to_numpy()
+
+
+def load_expiry_index(path='stock.csv', dayfirst=False, use_cache=True):
+    if not use_cache:
+        return ExpiryIndex.from_stock(load_stock(path, dayfirst=dayfirst, use_cache=False))
+    cache_path = derived_cache_file(path, INDEX_NAME, '.npz', dayfirst=dayfirst)
+    if os.path.exists(cache_path):
+        try:
+            return ExpiryIndex.load(cache_path)
+        except Exception:
+            pass  # unreadable index: rebuild it below
+    index = ExpiryIndex.from_stock(load_stock(path, dayfirst=dayfirst))
+    try:
+        index.save(cache_path)
+        drop_stale_derived(path, INDEX_NAME, '.npz', cache_path)
+    except OSError:
+        pass  # read-only folder: still return the index
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the expiry index")
+    parser.add_argument('--days', type=int, default=7, help="expiring within this many days")
+    parser.add_argument('--store', help="only this store_id")
+    parser.add_argument('--as-of', help="date to count from (default: today)")
+    parser.add_argument('--include-expired', action='store_true')
+    args = parser.parse_args()
+
+    index = load_expiry_index()
+    store = args.store
+    if store is not None and index.stores.dtype.kind in 'iuf':
+        store = index.stores.dtype.type(store)
+    start = time.perf_counter()
+    positions = index.expiring(args.days, args.as_of, store, args.include_expired)
+    micros = (time.perf_counter() - start) * 1e6
+
+    print(f"{len(positions)} of {len(index)} lots expire within {args.days} days of "
+          f"{as_of_date(args.as_of).date()} (query {micros:.0f} us)")
+    print(index.lots(positions).head(30).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+# features.py
+# One product feature table for the scoring stages.
+#
+# social_trends.py and buying_recommendations.py both need, per product, the
+# sales ranking, the 30-day forecast / stock and the movement label. Instead
+# of each stage merging the three frames again, the table is built once with
+# a single indexed join on product_id (rankings order, like the old left
+# merges) and the stages look rows up in it by index. social_trends adds its
+# trend columns to the same table, and that is what social_trends.csv holds.
+
+import pandas as pd
+
+KEY = 'product_id'
+
+
+def _indexed(df, columns=None):
+    df = df if columns is None else df[[KEY] + columns]
+    return df.set_index(KEY)
+
+
+def product_features(rankings, future, ai_alerts):
+    # rankings + forecast summary + movement, one row per ranked product
+    features = _indexed(rankings).join([_indexed(future), _indexed(ai_alerts, ['movement'])], how='left')
+    return features.reset_index()
+
+
+def lookup(frame, features, columns):
+    # `columns` of the feature table for every row of `frame` (by product_id,
+    # keeping frame's rows and order); NaN for products not in the table
+    found = _indexed(features, columns).reindex(frame[KEY].to_numpy())
+    found.index = frame.index
+    return pd.concat([frame, found], axis=1)
@@ -0,0 +1,195 @@
+# forecast_store.py
+# Run-length storage of the daily forecast.
+#
+# future_prediction_daily.csv has a row per product per future day, but most
+# forecasts are flat (the moving average repeats one level for 30 days), so
+# nearly all of those rows repeat the row before. ForecastSegments keeps one
+# (product, start, end, value) segment per run of equal daily values instead:
+# a flat forecast is a single segment, and a trend is still far smaller than
+# its CSV. Segments are sorted by product, then start; start / end are day
+# offsets into `dates` (end exclusive) and values are the rounded daily
+# forecast_qty, so expanding them gives exactly the rows of the CSV.
+#
+# Saved as plain arrays in an .npz file (future_prediction_segments.npz, no
+# pickles). Readers ask for the products and dates they need and only those
+# rows are expanded:
+#
+#   segments = ForecastSegments.open()
+#   segments.daily(products=['P1'], start='2024-02-01', end='2024-02-07')
+#   segments.by_date()            # total per day, computed on the segments
+#   segments.totals(end=...)      # units per product over a date range
+#
+#   python forecast_store.py                            # summary
+#   python forecast_store.py --csv out.csv --products P1 P2 --start 2024-02-01
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+SEGMENTS_FILE = 'future_prediction_segments.npz'
+DAILY_FILE = 'future_prediction_daily.csv'
+STORE_VERSION = 1
+
+# Products expanded at a time when writing the whole daily CSV
+CSV_BATCH_PRODUCTS = 20000
+
+
+def _storable(values):
+    # Object / string arrays as fixed-width unicode, so np.load needs no pickle
+    values = np.asarray(values)
+    return values.astype(str) if values.dtype.kind in 'OTU' else values
+
+
+class ForecastSegments:
+
+    def __init__(self, products, dates, product, start, end, value):
+        self.products = np.asarray(products)
+        self.dates = pd.DatetimeIndex(dates)
+        self.product = np.asarray(product)
+        self.start = np.asarray(start)
+        self.end = np.asarray(end)
+        self.value = np.asarray(value)
+
+    @classmethod
+    def from_paths(cls, products, dates, daily_value):
+        # products x days matrix of daily values -> one segment per run
+        daily_value = np.asarray(daily_value).reshape(len(products), len(dates))
+        n_days = daily_value.shape[1]
+        change = np.ones(daily_value.shape, dtype=bool)
+        change[:, 1:] = daily_value[:, 1:] != daily_value[:, :-1]
+        product, start = np.nonzero(change)
+        # A run ends where the next one of the same product starts, or at n_days
+        end = np.append(start[1:], n_days)
+        last = np.append(product[1:] != product[:-1], True)
+        end[last] = n_days
+        return cls(products, dates, product.astype(np.int32), start.astype(np.int32),
+                   end.astype(np.int32), daily_value[product, start])
+
+    def __len__(self):
+        return len(self.value)
+
+    @property
+    def n_rows(self):
+        # Rows of the equivalent daily CSV
+        return len(self.products) * len(self.dates)
+
+    # ---- files ----
+
+    def save(self, path=SEGMENTS_FILE):
+        # Written to a temporary file and renamed, so readers never see half a file
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, version=np.array(STORE_VERSION), products=_storable(self.products),
+                     dates=self.dates.to_numpy(), product=self.product, start=self.start,
+                     end=self.end, value=self.value)
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def open(cls, path=SEGMENTS_FILE):
+        with np.load(path, allow_pickle=False) as data:
+            if int(data['version']) != STORE_VERSION:
+                raise ValueError(f"{path}: forecast segments version {int(data['version'])}, "
+                                 f"expected {STORE_VERSION}; rerun future_prediction.py")
+            return cls(data['products'], data['dates'], data['product'], data['start'],
+                       data['end'], data['value'])
+
+    # ---- lazy expansion ----
+
+    def _day_range(self, start=None, end=None):
+        # [lo, hi) day offsets for dates start..end (both inclusive, None = open)
+        lo = 0 if start is None else int(self.dates.searchsorted(pd.Timestamp(start), side='left'))
+        hi = len(self.dates) if end is None else int(self.dates.searchsorted(pd.Timestamp(end), side='right'))
+        return lo, max(lo, hi)
+
+    def _select(self, products=None, start=None, end=None):
+        # Segments of `products` overlapping the date range, clipped to it
+        lo, hi = self._day_range(start, end)
+        keep = (self.start < hi) & (self.end > lo)
+        if products is not None:
+            codes = pd.Index(self.products).get_indexer(pd.Index(np.atleast_1d(products)))
+            keep &= np.isin(self.product, codes[codes >= 0])
+        return (self.product[keep], np.maximum(self.start[keep], lo),
+                np.minimum(self.end[keep], hi), self.value[keep])
+
+    def daily(self, products=None, start=None, end=None):
+        # Daily rows (product_id, date, forecast_qty) for the products and
+        # dates asked for, in the daily CSV's order; None means all
+        product, seg_start, seg_end, value = self._select(products, start, end)
+        lengths = seg_end - seg_start
+        first_row = np.cumsum(lengths) - lengths
+        day = np.repeat(seg_start, lengths) + np.arange(lengths.sum()) - np.repeat(first_row, lengths)
+        return pd.DataFrame({
+            'product_id': self.products[np.repeat(product, lengths)],
+            'date': self.dates[day],
+            'forecast_qty': np.repeat(value, lengths),
+        })
+
+    def by_date(self, products=None, start=None, end=None):
+        # Total forecast per day, summed on the segments (no expansion)
+        product, seg_start, seg_end, value = self._select(products, start, end)
+        lo, hi = self._day_range(start, end)
+        steps = np.zeros(len(self.dates) + 1)
+        np.add.at(steps, seg_start, value)
+        np.add.at(steps, seg_end, -value)
+        totals = np.cumsum(steps)[lo:hi]
+        return pd.DataFrame({'date': self.dates[lo:hi], 'forecast_qty': np.round(totals, 6)})
+
+    def totals(self, products=None, start=None, end=None):
+        # Forecast units per product over the date range (sum of daily values)
+        product, seg_start, seg_end, value = self._select(products, start, end)
+        sums = np.bincount(product, weights=value * (seg_end - seg_start), minlength=len(self.products))
+        totals = pd.Series(sums, index=pd.Index(self.products, name='product_id'), name='forecast_qty')
+        return totals if products is None else totals.reindex(pd.unique(np.atleast_1d(products)), fill_value=0.0)
+
+    def to_csv(self, path=DAILY_FILE, products=None, start=None, end=None, batch_products=CSV_BATCH_PRODUCTS):
+        # The daily CSV, expanded a batch of products at a time
+        wanted = self.products if products is None else np.atleast_1d(products)
+        for i in range(0, max(len(wanted), 1), batch_products):
+            self.daily(wanted[i:i + batch_products], start, end).to_csv(
+                path, index=False, mode='w' if i == 0 else 'a', header=i == 0)
+        return path
+
+
+def load_forecast_daily(segments_path=SEGMENTS_FILE, csv_path=DAILY_FILE):
+    # ForecastSegments from the segments file, or from the daily CSV written
+    # by older runs; None if neither exists
+    if os.path.exists(segments_path):
+        return ForecastSegments.open(segments_path)
+    if not os.path.exists(csv_path):
+        return None
+    daily = pd.read_csv(csv_path)
+    daily.columns = [c.lower().strip() for c in daily.columns]
+    products, product = np.unique(daily['product_id'].to_numpy(), return_inverse=True)
+    dates, day = np.unique(pd.to_datetime(daily['date']).to_numpy(), return_inverse=True)
+    grid = np.zeros((len(products), len(dates)))
+    grid[product, day] = daily['forecast_qty'].to_numpy()
+    return ForecastSegments.from_paths(products, dates, grid)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect / expand the run-length daily forecast")
+    parser.add_argument('--segments', default=SEGMENTS_FILE)
+    parser.add_argument('--csv', metavar='PATH', help="write the daily rows asked for to this CSV")
+    parser.add_argument('--products', nargs='+', metavar='PRODUCT')
+    parser.add_argument('--start', help="first date (inclusive)")
+    parser.add_argument('--end', help="last date (inclusive)")
+    args = parser.parse_args()
+
+    segments = ForecastSegments.open(args.segments)
+    products = args.products
+    if products is not None and segments.products.dtype.kind in 'iuf':
+        products = np.asarray(products).astype(segments.products.dtype)
+    print(f"{len(segments.products):,} products x {len(segments.dates)} days = {segments.n_rows:,} daily rows "
+          f"in {len(segments):,} segments ({os.path.getsize(args.segments) / 1e6:.2f} MB)")
+    if args.csv:
+        segments.to_csv(args.csv, products, args.start, args.end)
+        print(f"{args.csv} written")
+    else:
+        print(segments.daily(products, args.start, args.end).head(20).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,335 @@
+# forecasting.py
+# Batched demand forecasting used by future_prediction.py
+# Every product is forecast at once: daily totals are laid out as a
+# products x dates matrix and each model works on whole blocks of rows with
+# NumPy, so there is no Python loop per product.
+#
+# Models (MODELS registry):
+#   moving_average  mean of the last 7 observed days, repeated (the default)
+#   exp_smoothing   Holt's linear method with a damped trend
+#   seasonal_naive  mean of the last few same-weekday days
+# Model 'auto' backtests every model on the most recent days and picks the
+# one with the lowest error per product.
+#
+# Products are processed in batches of BATCH_PRODUCTS rows so memory stays
+# flat for very large catalogues; batches can run on a process pool.
+#
+# hierarchical_forecast() forecasts every store x product pair the same way
+# and reconciles the store, product and chain levels (see below).
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from forecast_store import ForecastSegments
+from instrumentation import span
+
+TRAILING_DAYS = 7
+BATCH_PRODUCTS = 20000
+
+# exp_smoothing parameters
+SMOOTHING_ALPHA = 0.3
+SMOOTHING_BETA = 0.1
+TREND_DAMPING = 0.9
+
+# seasonal_naive: number of past same-weekday days to average
+SEASONAL_WEEKS = 4
+
+# model selection: compare models on the last few history dates
+BACKTEST_DAYS = 7
+MIN_FIT_DATES = 2
+
+
+def daily_totals(sales):
+    # Daily totals per product (sorted by product_id, date)
+    return sales.groupby(['product_id', 'date'], as_index=False).agg(
+        daily_qty=('quantity', 'sum')
+    )
+
+
+def trailing_mean(daily, window=TRAILING_DAYS):
+    # Mean of the last `window` observed days per product.
+    # If a product has fewer days, the mean of what it has.
+    recent = daily.sort_values(['product_id', 'date'], kind='mergesort')
+    recent = recent.groupby('product_id').tail(window)
+    return recent.groupby('product_id')['daily_qty'].mean().fillna(0.0)
+
+
+# ---- demand matrix ----
+
+def demand_matrix(daily, products, dates):
+    # Y[i, j] = units of products[i] sold on dates[j] (0 when there is no row),
+    # observed[i, j] = the product had a sales row that day
+    rows = np.searchsorted(products, daily['product_id'].to_numpy())
+    cols = dates.get_indexer(daily['date'])
+    Y = np.zeros((len(products), len(dates)))
+    observed = np.zeros(Y.shape, dtype=bool)
+    Y[rows, cols] = daily['daily_qty'].to_numpy(dtype=float)
+    observed[rows, cols] = True
+    return Y, observed
+
+
+# ---- models ----
+# Every model gets a block of products at once:
+#   Y, observed  products x history dates (see demand_matrix)
+#   dates        history dates: every date on which anything was sold
+#   future       dates to forecast
+# and returns a products x len(future) array of daily forecasts.
+
+def moving_average(Y, observed, dates, future, window=TRAILING_DAYS):
+    # Same numbers as trailing_mean: only days the product has a row count
+    from_right = np.cumsum(observed[:, ::-1], axis=1)[:, ::-1]
+    recent = observed & (from_right <= window)
+    count = recent.sum(axis=1)
+    total = np.where(recent, Y, 0.0).sum(axis=1)
+    level = np.divide(total, count, out=np.zeros(len(Y)), where=count > 0)
+    return np.repeat(level[:, None], len(future), axis=1)
+
+
+def exp_smoothing(Y, observed, dates, future,
+                  alpha=SMOOTHING_ALPHA, beta=SMOOTHING_BETA, phi=TREND_DAMPING):
+    # Holt's method, one time step for all products at a time. Each product
+    # starts at its first observed day, so a late launch isn't a long run of
+    # zeros pulling the level down.
+    n, t_len = Y.shape
+    first = np.where(observed.any(axis=1), observed.argmax(axis=1), t_len)
+    level = np.zeros(n)
+    trend = np.zeros(n)
+    for t in range(t_len):
+        prev = level
+        smoothed = alpha * Y[:, t] + (1 - alpha) * (prev + phi * trend)
+        level = np.where(t == first, Y[:, t], np.where(t > first, smoothed, 0.0))
+        trend = np.where(t > first, beta * (level - prev) + (1 - beta) * phi * trend, 0.0)
+
+    # Forecast steps are measured in typical gaps between history dates
+    gap = np.median(np.diff(dates.to_numpy()).astype('timedelta64[D]').astype(float)) if len(dates) > 1 else 1.0
+    steps = (future - dates[-1]).days.to_numpy() / max(gap, 1.0)
+    damped = phi * (1 - phi ** steps) / (1 - phi)
+    return np.maximum(0.0, level[:, None] + damped[None, :] * trend[:, None])
+
+
+def seasonal_naive(Y, observed, dates, future, weeks=SEASONAL_WEEKS):
+    # Mean of the last `weeks` days with the same weekday. Weekdays missing
+    # from the history use the mean of the last `weeks` * 7 dates.
+    fallback = Y[:, -weeks * 7:].mean(axis=1)
+    weekday = dates.dayofweek.to_numpy()
+    profile = np.empty((len(Y), 7))
+    for day in range(7):
+        cols = np.flatnonzero(weekday == day)[-weeks:]
+        profile[:, day] = Y[:, cols].mean(axis=1) if len(cols) else fallback
+    return profile[:, future.dayofweek.to_numpy()]
+
+
+MODELS = {
+    'moving_average': moving_average,
+    'exp_smoothing': exp_smoothing,
+    'seasonal_naive': seasonal_naive,
+}
+MODEL_NAMES = list(MODELS)
+
+
+def backtest_errors(Y, observed, dates, holdout=BACKTEST_DAYS):
+    # Mean absolute error per product (rows) and model (columns) when each
+    # model is fit without the last `holdout` dates and asked to predict them.
+    # None if the history is too short to hold anything out.
+    holdout = min(holdout, len(dates) - MIN_FIT_DATES)
+    if holdout < 1:
+        return None
+    cut = len(dates) - holdout
+    actual = Y[:, cut:]
+    return np.column_stack([
+        np.abs(model(Y[:, :cut], observed[:, :cut], dates[:cut], dates[cut:]) - actual).mean(axis=1)
+        for model in MODELS.values()
+    ])
+
+
+def forecast_block(daily, products, dates, future, model='moving_average'):
+    # Forecast one batch of products; returns (paths, chosen model index)
+    Y, observed = demand_matrix(daily, products, dates)
+    if model != 'auto':
+        chosen = np.full(len(products), MODEL_NAMES.index(model))
+        return MODELS[model](Y, observed, dates, future), chosen
+
+    errors = backtest_errors(Y, observed, dates)
+    # Ties go to the earlier model in MODELS, so moving_average wins them
+    chosen = np.zeros(len(products), dtype=int) if errors is None else errors.argmin(axis=1)
+    paths = np.empty((len(products), len(future)))
+    for i, fit in enumerate(MODELS.values()):
+        rows = chosen == i
+        if rows.any():
+            paths[rows] = fit(Y[rows], observed[rows], dates, future)
+    return paths, chosen
+
+
+def _check_model(model):
+    if model != 'auto' and model not in MODELS:
+        raise ValueError(f"unknown forecasting model {model!r}; choose from {MODEL_NAMES + ['auto']}")
+
+
+def _prepare(daily, n_days):
+    # -> (daily sorted by product_id / date, products, history dates, future dates)
+    daily = daily.dropna(subset=['product_id', 'date'])
+    daily = daily.sort_values(['product_id', 'date'], kind='mergesort')
+    products = np.unique(daily['product_id'].to_numpy())
+    dates = pd.DatetimeIndex(np.unique(daily['date'].to_numpy()))
+    last_date = dates[-1] if len(dates) else pd.NaT
+    future = pd.date_range(last_date + pd.Timedelta(days=1), periods=n_days, freq='D')
+    return daily, products, dates, future
+
+
+def forecast_batches(daily, products, dates, future, model, batch_size=BATCH_PRODUCTS, workers=1):
+    # (paths, chosen) per batch of batch_size products, in product order, so
+    # callers can reduce each batch instead of keeping every path
+    # Rows of each batch of products are one contiguous slice of `daily`
+    starts = products[::batch_size]
+    bounds = np.append(np.searchsorted(daily['product_id'].to_numpy(), starts), len(daily))
+    jobs = [(daily.iloc[bounds[i]:bounds[i + 1]], products[i * batch_size:(i + 1) * batch_size], dates, future, model)
+            for i in range(len(starts))]
+
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            yield from pool.map(forecast_block, *zip(*jobs))
+    else:
+        for job in jobs:
+            yield forecast_block(*job)
+
+
+def forecast_products(daily, n_days, model='moving_average', batch_size=BATCH_PRODUCTS, workers=1):
+    # -> (products, future dates, products x n_days forecasts, model name per product)
+    _check_model(model)
+    with span('prepare demand', cat='aggregate', rows=len(daily)):
+        daily, products, dates, future = _prepare(daily, n_days)
+    with span(f'forecast {model}', cat='forecast', rows=len(products)):
+        results = list(forecast_batches(daily, products, dates, future, model, batch_size, workers))
+
+    paths = np.concatenate([p for p, _ in results]) if results else np.zeros((0, n_days))
+    chosen = np.concatenate([c for _, c in results]) if results else np.zeros(0, dtype=int)
+    return products, future, paths, np.array(MODEL_NAMES)[chosen]
+
+
+# ---- output frames ----
+
+def _round2(values):
+    # Round like the scalar code did (Python round, not NumPy's), once per distinct value
+    distinct, inverse = np.unique(values, return_inverse=True)
+    rounded = np.array([round(float(v), 2) for v in distinct])
+    return rounded[inverse].reshape(np.shape(values))
+
+
+def forecast_frames(products, future, paths, stock):
+    n_days = len(future)
+    # A flat forecast totals as level x days, like the old single-number forecast
+    flat = (paths == paths[:, :1]).all(axis=1)
+    total = np.where(flat, paths[:, 0] * n_days, paths.sum(axis=1)) if n_days else np.zeros(len(products))
+    daily_value = _round2(paths)
+    total_value = _round2(total)
+
+    # Current stock summed across stores, 0 for products not in stock.csv
+    with span('aggregate forecast stock', cat='aggregate', rows=len(stock)):
+        cur_stock = stock.groupby('product_id')['stock_level'].sum()
+        cur_stock = cur_stock.reindex(products, fill_value=0).to_numpy()
+
+    suggested = np.maximum(0, np.ceil(total_value - cur_stock)).astype(int)
+
+    # Daily forecast: every product x every future date, stored as runs of
+    # equal values (forecast_store.py) instead of one row per day
+    with span('forecast segments', cat='aggregate', rows=len(products)):
+        segments = ForecastSegments.from_paths(products, future, daily_value)
+
+    df_summary = pd.DataFrame({
+        'product_id': products,
+        'forecast_next_30': total_value,
+        'current_stock': cur_stock.astype(int),
+        'suggested_additional_stock': suggested,
+    })
+    return segments, df_summary
+
+
+def batch_forecast(daily, stock, n_days, model='moving_average', batch_size=BATCH_PRODUCTS, workers=1):
+    products, future, paths, _ = forecast_products(daily, n_days, model, batch_size, workers)
+    return forecast_frames(products, future, paths, stock)
+
+
+# ---- store x product (hierarchical) ----
+# Every store x product pair with sales is its own series, forecast with the
+# same batched models (a series is just a row of the demand matrix), and the
+# levels are made to add up:
+#   bottom_up      product = sum of its stores, chain = sum of products
+#   proportional   products are forecast on their own totals and split
+#                  across stores in proportion to the store forecasts
+# Batches are reduced as they come back, so only one batch of series paths
+# is in memory at a time.
+
+RECONCILE_METHODS = ['bottom_up', 'proportional']
+
+
+def store_daily_totals(sales):
+    # Daily totals per store and product (rows without a store are dropped)
+    daily = sales.dropna(subset=['store_id', 'product_id', 'date'])
+    return daily.groupby(['store_id', 'product_id', 'date'], as_index=False, observed=True).agg(
+        daily_qty=('quantity', 'sum')
+    )
+
+
+def _series(daily):
+    # -> (daily with product_id replaced by a series code, (store_id, product_id) per code)
+    groups = daily.groupby(['store_id', 'product_id'], sort=True, observed=True)
+    codes = groups.ngroup().to_numpy()
+    pairs = groups.size().index.to_frame(index=False)
+    series_daily = pd.DataFrame({'product_id': codes, 'date': daily['date'].to_numpy(),
+                                 'daily_qty': daily['daily_qty'].to_numpy()})
+    return series_daily, pairs
+
+
+def hierarchical_forecast(sales, stock, n_days, model='moving_average', method='bottom_up',
+                          batch_size=BATCH_PRODUCTS, workers=1):
+    # -> (product segments, product summary, store summary, chain daily forecast).
+    # The product outputs have forecast_frames' schema; the store summary
+    # has the same columns per store_id x product_id.
+    _check_model(model)
+    if method not in RECONCILE_METHODS:
+        raise ValueError(f"unknown reconciliation {method!r}; choose from {RECONCILE_METHODS}")
+    with span('aggregate store daily totals', cat='aggregate', rows=len(sales)):
+        daily = store_daily_totals(sales)
+        series_daily, pairs = _series(daily)
+        series_daily, series, dates, future = _prepare(series_daily, n_days)
+    products, product_of = np.unique(pairs['product_id'].to_numpy(), return_inverse=True)
+
+    # Bottom level, one batch of series at a time
+    series_total = np.zeros(len(series))
+    product_paths = np.zeros((len(products), n_days))
+    offset = 0
+    with span(f'forecast store series {model}', cat='forecast', rows=len(series)):
+        for paths, _ in forecast_batches(series_daily, series, dates, future, model, batch_size, workers):
+            rows = slice(offset, offset + len(paths))
+            series_total[rows] = paths.sum(axis=1)
+            np.add.at(product_paths, product_of[rows], paths)
+            offset += len(paths)
+
+    if method == 'proportional':
+        product_daily = daily.groupby(['product_id', 'date'], as_index=False, observed=True)['daily_qty'].sum()
+        top_products, _, top_paths, _ = forecast_products(product_daily, n_days, model, batch_size, workers)
+        product_paths = top_paths[pd.Index(top_products).get_indexer(products)]
+        # Store share of its product: its own forecast, or an even split
+        # when no store of the product forecasts anything
+        bottom = np.bincount(product_of, weights=series_total, minlength=len(products))
+        n_stores = np.bincount(product_of, minlength=len(products))
+        share = np.where(bottom[product_of] > 0, series_total / np.maximum(bottom, 1e-300)[product_of],
+                         1.0 / n_stores[product_of])
+        series_total = product_paths.sum(axis=1)[product_of] * share
+
+    segments, product_summary = forecast_frames(products, future, product_paths, stock)
+
+    # Per store: pairs with sales, plus stocked pairs without any (forecast 0)
+    with span('merge store forecast stock', cat='aggregate', rows=len(stock)):
+        store_stock = stock.groupby(['store_id', 'product_id'], observed=True)['stock_level'].sum()
+        store_summary = pairs.assign(forecast_next_30=np.round(series_total, 2)).merge(
+            store_stock.rename('current_stock').reset_index(), on=['store_id', 'product_id'], how='outer')
+    store_summary['forecast_next_30'] = store_summary['forecast_next_30'].fillna(0.0)
+    store_summary['current_stock'] = store_summary['current_stock'].fillna(0).astype(int)
+    store_summary['suggested_additional_stock'] = np.maximum(
+        0, np.ceil(store_summary['forecast_next_30'] - store_summary['current_stock'])).astype(int)
+
+    chain = pd.DataFrame({'date': future, 'forecast_qty': np.round(product_paths.sum(axis=0), 2)})
+    return segments, product_summary, store_summary, chain
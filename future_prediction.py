@@ -1,95 +1,94 @@
 # future_prediction.py
 # Simple & safe forecasting (no errors)
 
-import pandas as pd
-import numpy as np
-
-N_DAYS_FORECAST = 30
-
-# Load files
-sales = pd.read_csv('sales.csv')
-stock = pd.read_csv('stock.csv')
-
-# Normalize column names
-sales.columns = [c.lower().strip() for c in sales.columns]
-stock.columns = [c.lower().strip() for c in stock.columns]
-
-# Rename qty_sold → quantity
-if 'qty_sold' in sales.columns:
-    sales = sales.rename(columns={'qty_sold': 'quantity'})
+import argparse
 
-# Rename product column if needed
-if 'product' in sales.columns and 'product_id' not in sales.columns:
-    sales = sales.rename(columns={'product': 'product_id'})
-if 'product' in stock.columns and 'product_id' not in stock.columns:
-    stock = stock.rename(columns={'product': 'product_id'})
-
-# Parse date
-sales['date'] = pd.to_datetime(sales['date'], errors='coerce')
-
-# Daily totals per product
-daily = sales.groupby(['product_id', 'date'], as_index=False).agg(
-    daily_qty=('quantity', 'sum')
-)
-
-products = sorted(daily['product_id'].unique())
+import pandas as pd
 
-forecast_rows = []
-summary_rows = []
+from data_loader import load_sales, load_stock
+from forecast_store import DAILY_FILE, SEGMENTS_FILE
+from instrumentation import span
+from forecasting import (MODEL_NAMES, RECONCILE_METHODS, TRAILING_DAYS, batch_forecast, daily_totals,
+                         forecast_frames, forecast_products, hierarchical_forecast)
+from streaming import TrailingDaily, report, stream_sales
 
-# Get max date in data
-last_date = daily['date'].max()
+N_DAYS_FORECAST = 30
+STORE_SUMMARY_FILE = 'future_prediction_store_summary.csv'
 
-# Create future dates list
-future_dates = [(last_date + pd.Timedelta(days=i)).date() for i in range(1, N_DAYS_FORECAST + 1)]
+# Non-default models look further back than the moving average when streaming
+STREAM_HISTORY_DAYS = 56
 
-for pid in products:
 
-    # Get past data for this product
-    dfp = daily[daily['product_id'] == pid].copy().sort_values('date')
+def predict_future(sales, stock, model='moving_average'):
+    # Daily totals per product
+    with span('aggregate daily totals', cat='aggregate', rows=len(sales)):
+        daily = daily_totals(sales)
 
     # --- Simple forecast method ---
-    # Use last 7 days average. If not enough days, use available average.
-    if len(dfp) >= 7:
-        forecast_value = dfp['daily_qty'].tail(7).mean()
+    # Use last 7 days average per product (or all days if fewer), repeated for
+    # every future day. All products are forecast in one batch.
+    # Other models (or 'auto', best model per product) via forecasting.MODELS.
+    return batch_forecast(daily, stock, N_DAYS_FORECAST, model=model)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="30-day demand forecast per product")
+    parser.add_argument('--chunksize', type=int,
+                        help="stream sales.csv in chunks of this many rows (bounded memory)")
+    parser.add_argument('--model', default='moving_average', choices=MODEL_NAMES + ['auto'],
+                        help="forecasting model; 'auto' picks the best backtested model per product")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="fit product batches on this many processes")
+    parser.add_argument('--hierarchical', choices=RECONCILE_METHODS,
+                        help=f"forecast every store x product and reconcile to product / chain totals "
+                             f"(also writes {STORE_SUMMARY_FILE})")
+    parser.add_argument('--daily-csv', action='store_true',
+                        help=f"also expand the forecast to {DAILY_FILE} (one row per product per day)")
+    args = parser.parse_args()
+    if args.hierarchical and args.chunksize:
+        parser.error("--hierarchical needs the full sales history (no --chunksize)")
+
+    # Load files (normalized, parsed and cached by data_loader)
+    stock = load_stock()
+    if args.hierarchical:
+        # Product summary / segments are the reconciled store forecasts
+        segments, df_summary, df_stores, chain = hierarchical_forecast(
+            load_sales(), stock, N_DAYS_FORECAST, args.model, args.hierarchical, workers=args.workers)
+        df_stores.to_csv(STORE_SUMMARY_FILE, index=False)
+        print(f"{STORE_SUMMARY_FILE} created ({len(df_stores):,} store x product rows, "
+              f"{args.hierarchical} reconciliation)")
+        print(f"chain forecast: {chain['forecast_qty'].sum():,.2f} units over {len(chain)} days")
     else:
-        forecast_value = dfp['daily_qty'].mean()
-
-    # If NaN -> set to 0
-    if pd.isna(forecast_value):
-        forecast_value = 0.0
-
-    # Store daily forecast
-    for fd in future_dates:
-        forecast_rows.append({
-            'product_id': pid,
-            'date': fd,
-            'forecast_qty': round(float(forecast_value), 2)
-        })
-
-    # Total forecast next 30 days
-    total_30 = round(float(forecast_value * N_DAYS_FORECAST), 2)
-
-    # Current stock
-    cur_stock = stock[stock['product_id'] == pid]['stock_level'].sum()
-
-    # Suggested additional stock
-    suggested = max(0, int(np.ceil(total_30 - cur_stock)))
-
-    summary_rows.append({
-        'product_id': pid,
-        'forecast_next_30': total_30,
-        'current_stock': int(cur_stock),
-        'suggested_additional_stock': suggested
-    })
-
-# Convert to DataFrames
-df_forecast = pd.DataFrame(forecast_rows)
-df_summary = pd.DataFrame(summary_rows)
-
-# Save files
-df_forecast.to_csv('future_prediction_daily.csv', index=False)
-df_summary.to_csv('future_prediction_summary.csv', index=False)
-
-print("future_prediction_daily.csv and future_prediction_summary.csv created successfully!")
-print(df_summary.head(20).to_string(index=False))
\ No newline at end of file
+        if args.chunksize:
+            # Only the last few days per product are needed for the forecast
+            window = TRAILING_DAYS if args.model == 'moving_average' else STREAM_HISTORY_DAYS
+            recent = TrailingDaily(window)
+            rows = stream_sales([recent], 'sales.csv', args.chunksize)
+            daily = recent.result()
+            report('future_prediction', rows, args.chunksize)
+        else:
+            daily = daily_totals(load_sales())
+
+        products, future, paths, models = forecast_products(
+            daily, N_DAYS_FORECAST, args.model, workers=args.workers)
+        segments, df_summary = forecast_frames(products, future, paths, stock)
+
+    # Save files (the daily forecast as run-length segments, see forecast_store.py)
+    segments.save(SEGMENTS_FILE)
+    df_summary.to_csv('future_prediction_summary.csv', index=False)
+
+    print(f"{SEGMENTS_FILE} ({len(segments):,} segments for {segments.n_rows:,} daily rows) "
+          "and future_prediction_summary.csv created successfully!")
+    if args.daily_csv:
+        segments.to_csv(DAILY_FILE)
+        print(f"{DAILY_FILE} created")
+    if args.model == 'auto' and not args.hierarchical:
+        df_models = pd.DataFrame({'product_id': products, 'model': models})
+        df_models.to_csv('future_prediction_models.csv', index=False)
+        print("future_prediction_models.csv created (model picked per product):")
+        print(df_models['model'].value_counts().to_string())
+    print(df_summary.head(20).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
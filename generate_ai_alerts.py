@@ -4,88 +4,81 @@
 # stock.csv has columns: date, store_id, product_id, stock_level, expiry_date
 # Option 2 settings: REORDER_LEVEL = 10, OVERSTOCK_THRESHOLD = 60
 
+import argparse
+
 import pandas as pd
 
-REORDER_LEVEL = 10
-OVERSTOCK_THRESHOLD = 60
-
-# --- Load files ---
-sales = pd.read_csv('sales.csv')
-stock = pd.read_csv('stock.csv')
-
-# Normalize column names
-sales.columns = [c.lower().strip() for c in sales.columns]
-stock.columns = [c.lower().strip() for c in stock.columns]
-
-# Ensure product column is product_id
-if 'product' in sales.columns and 'product_id' not in sales.columns:
-    sales = sales.rename(columns={'product': 'product_id'})
-if 'product' in stock.columns and 'product_id' not in stock.columns:
-    stock = stock.rename(columns={'product': 'product_id'})
-
-# Rename qty_sold -> quantity for calculations
-if 'qty_sold' in sales.columns:
-    sales = sales.rename(columns={'qty_sold': 'quantity'})
-
-# If sales has date, parse it; otherwise create a single date
-if 'date' in sales.columns:
-    sales['date'] = pd.to_datetime(sales['date'])
-else:
-    sales['date'] = pd.Timestamp.today().normalize()
-
-# --- Aggregate sales: average daily sales per product (across all stores) ---
-avg_daily = sales.groupby('product_id').agg(
-    total_sold=('quantity', 'sum'),
-    days_observed=('date', lambda x: x.nunique())
-).reset_index()
-avg_daily['avg_daily_sales'] = (avg_daily['total_sold'] / avg_daily['days_observed']).round(2)
-
-# --- Aggregate stock: sum stock_level across stores per product ---
-if 'stock_level' not in stock.columns:
-    raise SystemExit("stock.csv must contain column named 'stock_level' (you have: {})".format(list(stock.columns)))
-
-stock_agg = stock.groupby('product_id').agg(
-    current_stock=('stock_level', 'sum')
-).reset_index()
-
-# --- Merge stock + avg sales ---
-alerts = pd.merge(stock_agg, avg_daily[['product_id', 'avg_daily_sales']], on='product_id', how='left')
-
-# --- Movement label ---
-def movement_label(avg):
-    if pd.isna(avg):
-        return 'unknown'
-    if avg >= 10:
-        return 'fast-moving'
-    if avg <= 2:
-        return 'slow-moving'
-    return 'normal-moving'
-
-alerts['movement'] = alerts['avg_daily_sales'].apply(movement_label)
-
-# --- Stock status ---
-def status_label(s):
-    if s == 0:
-        return 'out_of_stock'
-    if s < REORDER_LEVEL:
-        return 'low_stock'
-    if s > OVERSTOCK_THRESHOLD:
-        return 'overstock'
-    return 'ok'
-
-alerts['status'] = alerts['current_stock'].apply(status_label)
-
-# --- Reorder suggestion ---
-alerts['reorder_target'] = REORDER_LEVEL * 2
-alerts['reorder_suggestion'] = alerts.apply(
-    lambda r: int(max(0, r['reorder_target'] - r['current_stock']))
-    if r['status'] in ['low_stock', 'out_of_stock'] else 0,
-    axis=1
-)
-
-# --- Final columns & save ---
-alerts = alerts[['product_id', 'current_stock', 'avg_daily_sales', 'movement', 'status', 'reorder_target', 'reorder_suggestion']]
-alerts.to_csv('ai_alerts.csv', index=False)
-
-print("ai_alerts.csv generated successfully in this folder.")
-print(alerts.head(50).to_string(index=False))
\ No newline at end of file
+from data_loader import load_sales, load_stock
+from instrumentation import span
+from rules import REORDER_TARGET, movement_labels, reorder_suggestions, stock_status_labels
+from streaming import KeyAggregate, report, stream_sales
+
+
+def build_ai_alerts(sales, stock):
+    # If sales has no date column, treat it as a single day
+    if 'date' not in sales.columns:
+        sales = sales.assign(date=pd.Timestamp.today().normalize())
+
+    # --- Aggregate sales: total sold + days observed per product (across all stores) ---
+    with span('aggregate sales per product', cat='aggregate', rows=len(sales)):
+        sales_stats = sales.groupby('product_id').agg(
+            total_sold=('quantity', 'sum'),
+            days_observed=('date', lambda x: x.nunique())
+        ).reset_index()
+    return alerts_from_sales_stats(sales_stats, stock)
+
+
+def alerts_from_sales_stats(sales_stats, stock):
+    # sales_stats: product_id, total_sold, days_observed (in memory or streamed)
+    avg_daily = sales_stats.copy()
+    avg_daily['avg_daily_sales'] = (avg_daily['total_sold'] / avg_daily['days_observed']).round(2)
+
+    # --- Aggregate stock: sum stock_level across stores per product ---
+    if 'stock_level' not in stock.columns:
+        raise SystemExit("stock.csv must contain column named 'stock_level' (you have: {})".format(list(stock.columns)))
+
+    with span('aggregate stock per product', cat='aggregate', rows=len(stock)):
+        stock_agg = stock.groupby('product_id').agg(
+            current_stock=('stock_level', 'sum')
+        ).reset_index()
+
+        # --- Merge stock + avg sales ---
+        alerts = pd.merge(stock_agg, avg_daily[['product_id', 'avg_daily_sales']], on='product_id', how='left')
+
+    with span('label product alerts', cat='label', rows=len(alerts)):
+        # --- Movement label + stock status (vectorized rules, see rules.py) ---
+        alerts['movement'] = movement_labels(alerts['avg_daily_sales'])
+        alerts['status'] = stock_status_labels(alerts['current_stock'])
+
+        # --- Reorder suggestion ---
+        alerts['reorder_target'] = REORDER_TARGET
+        alerts['reorder_suggestion'] = reorder_suggestions(alerts['current_stock'], alerts['status'], as_int=True)
+
+    # --- Final columns ---
+    return alerts[['product_id', 'current_stock', 'avg_daily_sales', 'movement', 'status', 'reorder_target', 'reorder_suggestion']]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Product-level stock alerts")
+    parser.add_argument('--chunksize', type=int,
+                        help="stream sales.csv in chunks of this many rows (bounded memory)")
+    args = parser.parse_args()
+
+    # --- Load files (normalized, parsed and cached by data_loader) ---
+    stock = load_stock()
+    if args.chunksize:
+        per_product = KeyAggregate(['product_id'])
+        rows = stream_sales([per_product], 'sales.csv', args.chunksize)
+        alerts = alerts_from_sales_stats(per_product.result(), stock)
+        report('generate_ai_alerts', rows, args.chunksize)
+    else:
+        sales = load_sales()
+        alerts = build_ai_alerts(sales, stock)
+    alerts.to_csv('ai_alerts.csv', index=False)
+
+    print("ai_alerts.csv generated successfully in this folder.")
+    print(alerts.head(50).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
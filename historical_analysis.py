@@ -1,69 +1,98 @@
-import pandas as pd
+import argparse
+
+from data_loader import load_sales
+from incremental_history import update_history
+from instrumentation import span
+from rules import quantile_labels
+from sales_cube import load_sales_cube
+
+# Ranking categories by total_sales percentile (checked top to bottom)
+CATEGORY_STEPS = [
+    (0.67, '>=', "fast_selling"),
+    (0.33, '<=', "slow_selling"),
+]
+
+
+def analyze_history(sales):
+    # --- 1. TOTAL SALES PER PRODUCT ---
+    with span('aggregate total sales', cat='aggregate', rows=len(sales)):
+        total_sales = sales.groupby('product_id')['quantity'].sum().reset_index()
+        total_sales = total_sales.rename(columns={'quantity': 'total_sales'})
+
+    # --- 2. AVERAGE DAILY SALES PER PRODUCT ---
+    with span('aggregate daily sales', cat='aggregate', rows=len(sales)):
+        daily_avg = sales.groupby(['product_id', 'date']).agg(
+            daily_sales=('quantity', 'sum')
+        ).reset_index()
+
+        avg_daily_sales = daily_avg.groupby('product_id')['daily_sales'].mean().reset_index()
+        avg_daily_sales = avg_daily_sales.rename(columns={'daily_sales': 'average_daily_sales'})
+
+    # --- 3. PEAK SALES DAY ---
+    with span('peak / lowest sales day', cat='aggregate', rows=len(sales)):
+        peak_day = sales.groupby(['product_id', 'date'])['quantity'].sum().reset_index()
+        peak_day = peak_day.sort_values(['product_id', 'quantity'], ascending=[True, False])
+        peak_day = peak_day.groupby('product_id').head(1)
+        peak_day = peak_day.rename(columns={'date': 'peak_sales_day', 'quantity': 'peak_sales_qty'})
+
+        # --- 4. LOWEST SALES DAY ---
+        low_day = sales.groupby(['product_id', 'date'])['quantity'].sum().reset_index()
+        low_day = low_day.sort_values(['product_id', 'quantity'], ascending=[True, True])
+        low_day = low_day.groupby('product_id').head(1)
+        low_day = low_day.rename(columns={'date': 'lowest_sales_day', 'quantity': 'lowest_sales_qty'})
+
+    # --- 5. STORE COVERAGE (sold in how many stores) ---
+    with span('aggregate store coverage', cat='aggregate', rows=len(sales)):
+        store_coverage = sales.groupby('product_id')['store_id'].nunique().reset_index()
+        store_coverage = store_coverage.rename(columns={'store_id': 'total_store_coverage'})
+
+    # --- MERGE ALL METRICS ---
+    with span('merge history metrics', cat='aggregate', rows=len(total_sales)):
+        historical = total_sales.merge(avg_daily_sales, on='product_id')
+        historical = historical.merge(peak_day[['product_id', 'peak_sales_day', 'peak_sales_qty']], on='product_id')
+        historical = historical.merge(low_day[['product_id', 'lowest_sales_day', 'lowest_sales_qty']], on='product_id')
+        historical = historical.merge(store_coverage, on='product_id')
+
+    return historical, rank_products(total_sales)
 
-# Load sales data
-sales = pd.read_csv('sales.csv')
-
-# Normalize column names
-sales.columns = [c.lower().strip() for c in sales.columns]
-
-# Rename qty_sold → quantity
-if 'qty_sold' in sales.columns:
-    sales = sales.rename(columns={'qty_sold': 'quantity'})
-
-# Ensure date is datetime
-sales['date'] = pd.to_datetime(sales['date'], errors='coerce')
-
-# --- 1. TOTAL SALES PER PRODUCT ---
-total_sales = sales.groupby('product_id')['quantity'].sum().reset_index()
-total_sales = total_sales.rename(columns={'quantity': 'total_sales'})
-
-# --- 2. AVERAGE DAILY SALES PER PRODUCT ---
-daily_avg = sales.groupby(['product_id', 'date']).agg(
-    daily_sales=('quantity', 'sum')
-).reset_index()
-
-avg_daily_sales = daily_avg.groupby('product_id')['daily_sales'].mean().reset_index()
-avg_daily_sales = avg_daily_sales.rename(columns={'daily_sales': 'average_daily_sales'})
-
-# --- 3. PEAK SALES DAY ---
-peak_day = sales.groupby(['product_id', 'date'])['quantity'].sum().reset_index()
-peak_day = peak_day.sort_values(['product_id', 'quantity'], ascending=[True, False])
-peak_day = peak_day.groupby('product_id').head(1)
-peak_day = peak_day.rename(columns={'date': 'peak_sales_day', 'quantity': 'peak_sales_qty'})
-
-# --- 4. LOWEST SALES DAY ---
-low_day = sales.groupby(['product_id', 'date'])['quantity'].sum().reset_index()
-low_day = low_day.sort_values(['product_id', 'quantity'], ascending=[True, True])
-low_day = low_day.groupby('product_id').head(1)
-low_day = low_day.rename(columns={'date': 'lowest_sales_day', 'quantity': 'lowest_sales_qty'})
-
-# --- 5. STORE COVERAGE (sold in how many stores) ---
-store_coverage = sales.groupby('product_id')['store_id'].nunique().reset_index()
-store_coverage = store_coverage.rename(columns={'store_id': 'total_store_coverage'})
-
-# --- MERGE ALL METRICS ---
-historical = total_sales.merge(avg_daily_sales, on='product_id')
-historical = historical.merge(peak_day[['product_id', 'peak_sales_day', 'peak_sales_qty']], on='product_id')
-historical = historical.merge(low_day[['product_id', 'lowest_sales_day', 'lowest_sales_qty']], on='product_id')
-historical = historical.merge(store_coverage, on='product_id')
-
-# Save historical analysis
-historical.to_csv('historical_analysis.csv', index=False)
 
 # --- CREATE PRODUCT RANKINGS ---
-rankings = total_sales.sort_values('total_sales', ascending=False)
-rankings['rank'] = rankings['total_sales'].rank(method='dense', ascending=False).astype(int)
-
-def category(score):
-    if score >= rankings['total_sales'].quantile(0.67):
-        return "fast_selling"
-    if score <= rankings['total_sales'].quantile(0.33):
-        return "slow_selling"
-    return "medium_selling"
-
-rankings['category'] = rankings['total_sales'].apply(category)
-
-rankings.to_csv('product_rankings.csv', index=False)
-
-print("historical_analysis.csv and product_rankings.csv created successfully!")
-print(rankings.head(20).to_string(index=False))
\ No newline at end of file
+def rank_products(total_sales):
+    with span('label product rankings', cat='label', rows=len(total_sales)):
+        rankings = total_sales.sort_values('total_sales', ascending=False)
+        rankings['rank'] = rankings['total_sales'].rank(method='dense', ascending=False).astype(int)
+        rankings['category'] = quantile_labels(rankings['total_sales'], CATEGORY_STEPS, "medium_selling")
+    return rankings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Historical sales analysis + product rankings")
+    parser.add_argument('--incremental', action='store_true',
+                        help="fold only rows appended to sales.csv since the last run")
+    parser.add_argument('--cube', action='store_true',
+                        help="compute from the sales cube (see sales_cube.py; rows without a date are left out)")
+    args = parser.parse_args()
+
+    if args.incremental:
+        # Persisted per-product state + today's new rows (see incremental_history.py)
+        historical, total_sales = update_history('sales.csv')
+        rankings = rank_products(total_sales)
+    elif args.cube:
+        # Axis reductions over the memory-mapped day x store x product cube
+        historical = load_sales_cube('sales.csv').history()
+        rankings = rank_products(historical[['product_id', 'total_sales']].copy())
+    else:
+        # Load sales data (normalized, parsed and cached by data_loader)
+        sales = load_sales()
+        historical, rankings = analyze_history(sales)
+
+    # Save historical analysis + rankings
+    historical.to_csv('historical_analysis.csv', index=False)
+    rankings.to_csv('product_rankings.csv', index=False)
+
+    print("historical_analysis.csv and product_rankings.csv created successfully!")
+    print(rankings.head(20).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
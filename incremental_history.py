@@ -0,0 +1,271 @@
+# incremental_history.py
+# Append-only updates for historical_analysis.py
+#
+# Instead of re-aggregating the whole sales history every night, we keep a
+# small per-product state in .cache/historical_state/ and fold in only the
+# rows appended to sales.csv since the last run:
+#   totals  - total_sales per product (all rows)
+#   closed  - day count, sum, peak day and lowest day over finished days
+#   open    - per-product totals for the latest day (it may still grow)
+#   stores  - distinct (product_id, store_id) pairs for store coverage
+# The daily cost is reading the new tail of the file, not all of history.
+#
+# If sales.csv was rewritten (not just appended to), new rows are dated
+# before the latest day we have seen, or their dates don't fit the format
+# the file was read with (e.g. the first rows were all ambiguous day <= 12
+# and month-first was picked), the state is rebuilt from scratch, which
+# detects the format over the whole file again.
+# Rows without a valid date only count towards total_sales / coverage.
+
+import hashlib
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_loader import (CACHE_DIR, cache_file, load_sales, prepare_sales,
+                         read_cached_frame, write_cached_frame)
+from date_parsing import MixedDateFormatsError
+
+STATE_NAME = 'historical_state'
+STATE_FRAMES = ['totals', 'closed', 'open', 'stores']
+STATS_COLUMNS = ['days', 'dated_sales', 'peak_sales_day', 'peak_sales_qty',
+                 'lowest_sales_day', 'lowest_sales_qty']
+PREFIX_CHECK_BYTES = 4096
+
+
+class LateRowsError(Exception):
+    pass
+
+
+# ---- per-product aggregates ----
+
+def day_stats(daily):
+    # daily: product_id, date, quantity (one row per product per day)
+    # Ties on peak / lowest go to the earliest day, like historical_analysis.py
+    if daily.empty:
+        return pd.DataFrame(columns=STATS_COLUMNS, index=pd.Index([], name='product_id'))
+    grouped = daily.groupby('product_id')
+    stats = pd.DataFrame({'days': grouped.size(), 'dated_sales': grouped['quantity'].sum()})
+
+    peak = daily.sort_values(['product_id', 'quantity', 'date'], ascending=[True, False, True])
+    peak = peak.groupby('product_id').head(1).set_index('product_id')
+    low = daily.sort_values(['product_id', 'quantity', 'date'], ascending=[True, True, True])
+    low = low.groupby('product_id').head(1).set_index('product_id')
+
+    stats['peak_sales_day'] = peak['date']
+    stats['peak_sales_qty'] = peak['quantity']
+    stats['lowest_sales_day'] = low['date']
+    stats['lowest_sales_qty'] = low['quantity']
+    return stats
+
+
+def merge_stats(older, newer):
+    # Combine stats of two day ranges; every day in `newer` is after `older`
+    index = older.index.union(newer.index)
+    a = older.reindex(index)
+    b = newer.reindex(index)
+    merged = pd.DataFrame(index=index)
+    merged['days'] = a['days'].fillna(0) + b['days'].fillna(0)
+    merged['dated_sales'] = a['dated_sales'].fillna(0) + b['dated_sales'].fillna(0)
+
+    # Newer days only win on a strictly better value (earliest day wins ties)
+    take_peak = a['peak_sales_qty'].isna() | (b['peak_sales_qty'] > a['peak_sales_qty'])
+    take_low = a['lowest_sales_qty'].isna() | (b['lowest_sales_qty'] < a['lowest_sales_qty'])
+    merged['peak_sales_day'] = b['peak_sales_day'].where(take_peak, a['peak_sales_day'])
+    merged['peak_sales_qty'] = b['peak_sales_qty'].where(take_peak, a['peak_sales_qty'])
+    merged['lowest_sales_day'] = b['lowest_sales_day'].where(take_low, a['lowest_sales_day'])
+    merged['lowest_sales_qty'] = b['lowest_sales_qty'].where(take_low, a['lowest_sales_qty'])
+    return merged
+
+
+def _daily(rows):
+    dated = rows[rows['date'].notna()]
+    return dated.groupby(['product_id', 'date'], as_index=False)['quantity'].sum()
+
+
+def _add_totals(totals, rows):
+    new = rows.groupby('product_id')['quantity'].sum()
+    return totals.add(new, fill_value=0).astype('int64')
+
+
+def _add_stores(stores, rows):
+    # store_id may be categorical; keep plain values in the state
+    pairs = pd.DataFrame({'product_id': rows['product_id'].to_numpy(),
+                          'store_id': np.asarray(rows['store_id'])})
+    pairs = pairs.dropna().drop_duplicates()
+    if stores is None:
+        return pairs.reset_index(drop=True)
+    return pd.concat([stores, pairs], ignore_index=True).drop_duplicates(ignore_index=True)
+
+
+# ---- state ----
+
+def build_state(sales):
+    daily = _daily(sales)
+    watermark = daily['date'].max() if len(daily) else pd.NaT
+    state = {
+        'totals': sales.groupby('product_id')['quantity'].sum().astype('int64'),
+        'closed': day_stats(daily[daily['date'] < watermark]),
+        'open': daily[daily['date'] == watermark].set_index('product_id')['quantity'],
+        'stores': _add_stores(None, sales),
+        'watermark': watermark,
+    }
+    return state
+
+
+def fold_rows(state, rows):
+    # Fold newly appended sales rows into the state (in place)
+    watermark = state['watermark']
+    daily = _daily(rows)
+    if len(daily) and pd.notna(watermark) and (daily['date'] < watermark).any():
+        raise LateRowsError(f"rows dated before {watermark.date()} were appended")
+
+    state['totals'] = _add_totals(state['totals'], rows)
+    state['stores'] = _add_stores(state['stores'], rows)
+    if daily.empty:
+        return state
+
+    # More sales for the day we already have open
+    if pd.notna(watermark):
+        same_day = daily[daily['date'] == watermark].set_index('product_id')['quantity']
+        state['open'] = state['open'].add(same_day, fill_value=0).astype('int64')
+        daily = daily[daily['date'] > watermark]
+    if daily.empty:
+        return state
+
+    # New days: close the open day, fold finished days, open the latest one
+    closing = state['open'].rename('quantity').reset_index()
+    closing['date'] = watermark
+    new_watermark = daily['date'].max()
+    finished = pd.concat([closing, daily[daily['date'] < new_watermark]], ignore_index=True)
+    state['closed'] = merge_stats(state['closed'], day_stats(finished))
+    state['open'] = daily[daily['date'] == new_watermark].set_index('product_id')['quantity']
+    state['watermark'] = new_watermark
+    return state
+
+
+def state_outputs(state):
+    # State -> (historical, total_sales) frames shaped like historical_analysis.py
+    open_day = state['open'].rename('quantity').reset_index()
+    open_day['date'] = state['watermark']
+    stats = merge_stats(state['closed'], day_stats(open_day))
+    stats = stats[stats['days'] > 0]
+
+    totals = state['totals'].sort_index()
+    coverage = state['stores'].groupby('product_id').size()
+
+    historical = pd.DataFrame({
+        'product_id': stats.index.to_numpy(),
+        'total_sales': totals.reindex(stats.index).to_numpy(),
+        'average_daily_sales': (stats['dated_sales'] / stats['days']).to_numpy(),
+        'peak_sales_day': pd.to_datetime(stats['peak_sales_day']).to_numpy(),
+        'peak_sales_qty': stats['peak_sales_qty'].astype('int64').to_numpy(),
+        'lowest_sales_day': pd.to_datetime(stats['lowest_sales_day']).to_numpy(),
+        'lowest_sales_qty': stats['lowest_sales_qty'].astype('int64').to_numpy(),
+        'total_store_coverage': coverage.reindex(stats.index, fill_value=0).astype('int64').to_numpy(),
+    })
+    total_sales = pd.DataFrame({'product_id': totals.index.to_numpy(), 'total_sales': totals.to_numpy()})
+    return historical, total_sales
+
+
+def _state_dir():
+    return os.path.join(CACHE_DIR, STATE_NAME)
+
+
+def save_state(state, meta):
+    os.makedirs(_state_dir(), exist_ok=True)
+    for name in STATE_FRAMES:
+        frame = state[name]
+        frame = frame.reset_index() if name != 'stores' else frame
+        write_cached_frame(frame, cache_file(os.path.join(STATE_NAME, name)))
+    meta = dict(meta, watermark=None if pd.isna(state['watermark']) else state['watermark'].isoformat())
+    with open(os.path.join(_state_dir(), 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+
+def load_state():
+    meta_path = os.path.join(_state_dir(), 'meta.json')
+    if not os.path.exists(meta_path):
+        return None, None
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        frames = {name: read_cached_frame(cache_file(os.path.join(STATE_NAME, name)))
+                  for name in STATE_FRAMES}
+    except Exception:
+        return None, None
+    state = {
+        'totals': frames['totals'].set_index('product_id')['quantity'],
+        'closed': frames['closed'].set_index('product_id'),
+        'open': frames['open'].set_index('product_id')['quantity'],
+        'stores': frames['stores'],
+        'watermark': pd.Timestamp(meta['watermark']) if meta['watermark'] else pd.NaT,
+    }
+    return state, meta
+
+
+# ---- source file tracking (also used by sales_cube.py) ----
+
+def _prefix_digest(path, offset):
+    with open(path, 'rb') as f:
+        f.seek(max(0, offset - PREFIX_CHECK_BYTES))
+        return hashlib.sha1(f.read(min(offset, PREFIX_CHECK_BYTES))).hexdigest()
+
+
+def date_format_of(rows, meta=None):
+    # Date format to read later appends with (see date_parsing.py)
+    found = rows.attrs.get('date_format') if rows is not None else None
+    return found or (meta or {}).get('date_format')
+
+
+def source_meta(path, offset, dayfirst, date_format=None):
+    return {
+        'source': os.path.abspath(path),
+        'offset': offset,
+        'prefix_sha1': _prefix_digest(path, offset),
+        'columns': list(pd.read_csv(path, nrows=0).columns),
+        'dayfirst': dayfirst,
+        'date_format': date_format,
+    }
+
+
+def appended_only(path, meta, dayfirst):
+    return (meta is not None
+            and meta['source'] == os.path.abspath(path)
+            and meta['dayfirst'] == dayfirst
+            and os.path.getsize(path) >= meta['offset']
+            and _prefix_digest(path, meta['offset']) == meta['prefix_sha1'])
+
+
+def read_appended(path, meta, dayfirst):
+    with open(path, 'rb') as f:
+        f.seek(meta['offset'])
+        data = f.read()
+    offset = meta['offset'] + len(data)
+    if not data.strip():
+        return None, offset
+    raw = pd.read_csv(io.BytesIO(data), header=None, names=meta['columns'])
+    return prepare_sales(raw, dayfirst=dayfirst, date_format=meta.get('date_format'), label=path), offset
+
+
+def update_history(path='sales.csv', dayfirst=False):
+    # Returns (historical, total_sales) and leaves the state ready for tomorrow
+    state, meta = load_state()
+    if appended_only(path, meta, dayfirst):
+        try:
+            rows, offset = read_appended(path, meta, dayfirst)
+            if rows is not None:
+                fold_rows(state, rows)
+            save_state(state, source_meta(path, offset, dayfirst, date_format_of(rows, meta)))
+            return state_outputs(state)
+        except (LateRowsError, MixedDateFormatsError):
+            pass  # fall through to a full rebuild
+
+    offset = os.path.getsize(path)
+    sales = load_sales(path, dayfirst=dayfirst)
+    state = build_state(sales)
+    save_state(state, source_meta(path, offset, dayfirst, date_format_of(sales)))
+    return state_outputs(state)
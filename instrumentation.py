@@ -0,0 +1,220 @@
+# instrumentation.py
+# Timers, row counts and memory for pipeline stages and their sub-steps.
+#
+# Code marks a step with
+#     with span('parse_dates', rows=len(df)):
+#         ...
+# which costs one global lookup while tracing is off. Once start() has been
+# called every span records wall time, thread, rows (given up front or set
+# later with info['rows'] = ...) and the process RSS before / after. Spans
+# nest by time per thread, so a stage shows its load / normalize / aggregate
+# / label / write steps underneath it.
+#
+# save() writes Chrome trace JSON (open it in chrome://tracing or Perfetto);
+# summary() totals the spans by name for a quick text report.
+#
+# Profile mode: start(profile='cprofile') (or 'pyinstrument', if installed)
+# also profiles every span opened with profile=True (the pipeline stages).
+# Only one profiler runs at a time: from Python 3.12 cProfile sits on
+# sys.monitoring, which allows a single active profiler per process, so
+# stages can't each have their own while they overlap. pipeline.py therefore
+# runs the stages one at a time (--workers 1) in profile mode, and a profiled
+# span that opens while another one is still running is timed but not
+# profiled (its args say profiled: false). cProfile results are merged into
+# <trace>.prof (pstats / snakeviz), pyinstrument ones go to
+# <trace>.pyinstrument.txt.
+#
+# RSS is per process: while stages run in parallel their memory deltas
+# overlap. Use pipeline.py --workers 1 for clean per-stage numbers.
+#
+#   python pipeline.py --trace trace.json --profile cprofile
+#   python pipeline.py --only transfer_ai --trace trace.json   # one stage (+ its inputs)
+
+import cProfile
+import json
+import os
+import pstats
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+PROFILERS = ['cprofile', 'pyinstrument']
+
+_tracer = None
+
+
+def rss_mb():
+    # Current resident set size (Linux /proc); peak RSS elsewhere
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def rows_of(result):
+    # Row count of a DataFrame / array result (first item of a tuple)
+    if isinstance(result, tuple):
+        result = result[0] if result else None
+    try:
+        return len(result)
+    except TypeError:
+        return None
+
+
+class Tracer:
+
+    def __init__(self, profile=None):
+        if profile not in [None] + PROFILERS:
+            raise ValueError(f"profile must be one of {PROFILERS}, not {profile!r}")
+        if profile == 'pyinstrument' and pyinstrument is None:
+            raise ValueError("pyinstrument is not installed (pip install pyinstrument)")
+        self.profile = profile
+        self.events = []
+        self.profiles = []
+        self.lock = threading.Lock()
+        self.profiling = False  # a profiler is running (one per process)
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.start_rss = rss_mb()
+
+    def _profiler(self):
+        # A new profiler, or None while another one is running
+        with self.lock:
+            if self.profiling:
+                return None
+            self.profiling = True
+        if self.profile == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            profiler = pyinstrument.Profiler()
+            profiler.start()
+        return profiler
+
+    def _stop_profiler(self, name, profiler):
+        if self.profile == 'cprofile':
+            profiler.disable()
+        else:
+            profiler.stop()
+        with self.lock:
+            self.profiles.append((name, profiler))
+            self.profiling = False
+
+    @contextmanager
+    def span(self, name, cat='step', rows=None, profile=False, **args):
+        info = dict(args)
+        if rows is not None:
+            info['rows'] = rows
+        profiler = self._profiler() if profile and self.profile else None
+        if profile and self.profile and profiler is None:
+            info['profiled'] = False
+        rss_before = rss_mb()
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            end = time.perf_counter()
+            if profiler is not None:
+                self._stop_profiler(name, profiler)
+            rss_after = rss_mb()
+            info['rss_mb'] = round(rss_after, 1)
+            info['rss_delta_mb'] = round(rss_after - rss_before, 1)
+            event = {'name': name, 'cat': cat, 'ph': 'X',
+                     'ts': round((start - self.started) * 1e6, 1), 'dur': round((end - start) * 1e6, 1),
+                     'pid': os.getpid(), 'tid': threading.get_ident(), 'args': info}
+            with self.lock:
+                self.events.append(event)
+
+    def summary(self):
+        # [(name, cat, calls, seconds, rows, max rss delta MB)] slowest first
+        totals = {}
+        for event in self.events:
+            key = (event['name'], event['cat'])
+            calls, seconds, rows, delta = totals.get(key, (0, 0.0, None, None))
+            event_rows = event['args'].get('rows')
+            event_delta = event['args'].get('rss_delta_mb')
+            totals[key] = (calls + 1, seconds + event['dur'] / 1e6,
+                           event_rows if rows is None else rows + (event_rows or 0),
+                           event_delta if delta is None else max(delta, event_delta))
+        return sorted([(name, cat) + values for (name, cat), values in totals.items()],
+                      key=lambda row: -row[3])
+
+    def save(self, path):
+        # Chrome trace JSON, plus the profiler output next to it
+        trace = {
+            'traceEvents': sorted(self.events, key=lambda event: event['ts']),
+            'displayTimeUnit': 'ms',
+            'otherData': {
+                'started_at': self.started_at,
+                'seconds': round(time.perf_counter() - self.started, 3),
+                'start_rss_mb': round(self.start_rss, 1),
+                'end_rss_mb': round(rss_mb(), 1),
+                'argv': sys.argv,
+                'profile': self.profile,
+            },
+        }
+        with open(path, 'w') as f:
+            json.dump(trace, f)
+        written = [path]
+        stem = os.path.splitext(path)[0]
+        if self.profile == 'cprofile' and self.profiles:
+            stats = pstats.Stats(self.profiles[0][1])
+            for _, profiler in self.profiles[1:]:
+                stats.add(profiler)
+            stats.dump_stats(stem + '.prof')
+            written.append(stem + '.prof')
+        elif self.profile == 'pyinstrument' and self.profiles:
+            with open(stem + '.pyinstrument.txt', 'w') as f:
+                for name, profiler in self.profiles:
+                    f.write(f"===== {name} =====\n{profiler.output_text(unicode=False)}\n")
+            written.append(stem + '.pyinstrument.txt')
+        return written
+
+
+def start(profile=None):
+    global _tracer
+    _tracer = Tracer(profile)
+    return _tracer
+
+
+def stop():
+    # Turn tracing off and return the tracer (None if it wasn't on)
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def active():
+    return _tracer
+
+
+@contextmanager
+def span(name, cat='step', rows=None, profile=False, **args):
+    tracer = _tracer
+    if tracer is None:
+        yield {}
+        return
+    with tracer.span(name, cat, rows, profile, **args) as info:
+        yield info
+
+
+def print_summary(tracer, top=25, file=None):
+    print(f"{'span':<36} {'cat':<9} {'calls':>5} {'seconds':>9} {'rows':>11} {'rss +MB':>8}", file=file)
+    for name, cat, calls, seconds, rows, delta in tracer.summary()[:top]:
+        rows = '' if rows is None else rows
+        delta = '' if delta is None else delta
+        print(f"{name:<36} {cat:<9} {calls:>5} {seconds:>9.3f} {rows:>11} {delta:>8}", file=file)
+    if tracer.profile == 'cprofile' and tracer.profiles:
+        stats = pstats.Stats(tracer.profiles[0][1], stream=file or sys.stdout)
+        for _, profiler in tracer.profiles[1:]:
+            stats.add(profiler)
+        stats.sort_stats('cumulative').print_stats(top)
@@ -0,0 +1,275 @@
+# inventory_service.py
+# Small HTTP/JSON service over the latest pipeline outputs.
+#
+# ai_alerts.csv, store_alerts.csv and buying_recommendations.csv are loaded
+# into dicts keyed by product_id / store_id (and store + status), so every
+# request is a dict lookup instead of re-reading a CSV. A watcher thread
+# polls the files' mtimes; when they change (and have stopped changing for
+# one poll, so we don't read a half-written file) a new snapshot is built
+# off to the side and swapped in with one assignment. Requests always see
+# either the old or the new snapshot, never a mix.
+#
+#   python inventory_service.py --port 8765
+#
+# Endpoints (ids as in the CSVs, e.g. /products/12 or /products/12.0, or
+# text ids such as /stores/S01):
+#   GET /health
+#   GET /products/<product_id>                 alert + buying recommendation
+#   GET /products/<product_id>/priority        buying priority only
+#   GET /stores/<store_id>/products/<product_id>   every row (stock lot) of the pair
+#   GET /stores/<store_id>/alerts?status=low_stock,overstock&limit=100
+#   GET /stores/<store_id>/low_stock           low_stock + out_of_stock rows
+#   GET /low_stock?limit=100                   across all stores
+#   GET /priorities/<HIGH|MEDIUM|LOW|NO NEED>?limit=100
+
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+import pandas as pd
+
+from data_loader import id_key, normalize_columns
+from rules import REORDER_STATUSES
+
+SOURCES = {
+    'ai_alerts': 'ai_alerts.csv',
+    'store_alerts': 'store_alerts.csv',
+    'buying': 'buying_recommendations.csv',
+}
+DEFAULT_LIMIT = 1000
+POLL_SECONDS = 2.0
+
+
+def _records(df):
+    # Plain Python values (NaN -> None) so json.dumps works as is
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+def _mtimes(data_dir):
+    mtimes = {}
+    for name, filename in SOURCES.items():
+        path = os.path.join(data_dir, filename)
+        mtimes[name] = os.path.getmtime(path) if os.path.exists(path) else None
+    return mtimes
+
+
+class Snapshot:
+    # All indexes for one set of pipeline outputs; never changed once built
+
+    def __init__(self, frames, mtimes):
+        self.mtimes = mtimes
+        self.loaded_at = time.time()
+        self.counts = {name: len(df) for name, df in frames.items()}
+
+        self.alerts = {}
+        for record in _records(frames['ai_alerts']):
+            self.alerts[id_key(record['product_id'])] = record
+        self.buying = {}
+        self.by_priority = {}
+        for record in _records(frames['buying']):
+            self.buying[id_key(record['product_id'])] = record
+            self.by_priority.setdefault(record.get('buying_priority'), []).append(record)
+
+        self.pairs = {}
+        self.by_store = {}
+        self.by_store_status = {}
+        self.low_stock = []
+        for record in _records(frames['store_alerts']):
+            store = id_key(record['store_id'])
+            # stock.csv has one row per lot, so a pair can have several rows
+            self.pairs.setdefault((store, id_key(record['product_id'])), []).append(record)
+            self.by_store.setdefault(store, []).append(record)
+            self.by_store_status.setdefault((store, record.get('status')), []).append(record)
+            if record.get('status') in REORDER_STATUSES:
+                self.low_stock.append(record)
+
+
+def load_snapshot(data_dir='.'):
+    mtimes = _mtimes(data_dir)
+    frames = {}
+    for name, filename in SOURCES.items():
+        path = os.path.join(data_dir, filename)
+        frames[name] = normalize_columns(pd.read_csv(path)) if mtimes[name] is not None else pd.DataFrame(
+            columns=['product_id', 'store_id', 'status', 'buying_priority'])
+    return Snapshot(frames, mtimes)
+
+
+class InventoryState:
+    # Holds the current snapshot and replaces it when the CSVs change
+
+    def __init__(self, data_dir='.', poll=POLL_SECONDS):
+        self.data_dir = data_dir
+        self.poll = poll
+        self.snapshot = load_snapshot(data_dir)
+        self.reloads = 0
+        self.last_error = None
+        self._seen = self.snapshot.mtimes
+
+    def check(self):
+        # Reload once the mtimes differ from the snapshot and match the last poll
+        mtimes = _mtimes(self.data_dir)
+        settled = mtimes == self._seen
+        self._seen = mtimes
+        if mtimes == self.snapshot.mtimes or not settled:
+            return False
+        try:
+            snapshot = load_snapshot(self.data_dir)
+        except Exception as exc:  # e.g. a file replaced mid-read; keep serving the old one
+            self.last_error = repr(exc)
+            return False
+        self.snapshot = snapshot
+        self.reloads += 1
+        self.last_error = None
+        return True
+
+    def watch(self, stop):
+        while not stop.wait(self.poll):
+            self.check()
+
+
+# ---- HTTP ----
+
+def _limited(records, query):
+    try:
+        limit = int(query.get('limit', [DEFAULT_LIMIT])[0])
+    except ValueError:
+        limit = DEFAULT_LIMIT
+    return {'count': len(records), 'items': records[:max(0, limit)]}
+
+
+def _health(state, snapshot, query):
+    return 200, {
+        'loaded_at': snapshot.loaded_at,
+        'sources': snapshot.mtimes,
+        'rows': snapshot.counts,
+        'reloads': state.reloads,
+        'last_error': state.last_error,
+    }
+
+
+def _product(state, snapshot, query, product):
+    alert, buying = snapshot.alerts.get(id_key(product)), snapshot.buying.get(id_key(product))
+    if alert is None and buying is None:
+        return 404, {'error': f'unknown product_id {product}'}
+    return 200, {'product_id': (alert or buying)['product_id'], 'alert': alert, 'buying': buying}
+
+
+def _priority(state, snapshot, query, product):
+    buying = snapshot.buying.get(id_key(product))
+    if buying is None:
+        return 404, {'error': f'no buying recommendation for product_id {product}'}
+    return 200, {'product_id': buying['product_id'], 'buying_priority': buying.get('buying_priority'),
+                 'units_to_buy': buying.get('units_to_buy')}
+
+
+def _store_product(state, snapshot, query, store, product):
+    records = snapshot.pairs.get((id_key(store), id_key(product)))
+    if not records:
+        return 404, {'error': f'no row for store_id {store}, product_id {product}'}
+    return 200, _limited(records, query)
+
+
+def _store_alerts(state, snapshot, query, store):
+    statuses = [s for value in query.get('status', []) for s in value.split(',') if s]
+    if not statuses:
+        return 200, _limited(snapshot.by_store.get(id_key(store), []), query)
+    records = [r for status in statuses for r in snapshot.by_store_status.get((id_key(store), status), [])]
+    return 200, _limited(records, query)
+
+
+def _store_low_stock(state, snapshot, query, store):
+    records = [r for status in REORDER_STATUSES for r in snapshot.by_store_status.get((id_key(store), status), [])]
+    return 200, _limited(records, query)
+
+
+def _low_stock(state, snapshot, query):
+    return 200, _limited(snapshot.low_stock, query)
+
+
+def _by_priority(state, snapshot, query, level):
+    return 200, _limited(snapshot.by_priority.get(level.upper(), []), query)
+
+
+ROUTES = [
+    (re.compile(r'^/health$'), _health),
+    (re.compile(r'^/products/([^/]+)$'), _product),
+    (re.compile(r'^/products/([^/]+)/priority$'), _priority),
+    (re.compile(r'^/stores/([^/]+)/products/([^/]+)$'), _store_product),
+    (re.compile(r'^/stores/([^/]+)/alerts$'), _store_alerts),
+    (re.compile(r'^/stores/([^/]+)/low_stock$'), _store_low_stock),
+    (re.compile(r'^/low_stock$'), _low_stock),
+    (re.compile(r'^/priorities/([^/]+)$'), _by_priority),
+]
+
+
+def make_handler(state, verbose=False):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Headers and body are separate writes; without this, keep-alive
+        # clients wait ~40ms for a delayed ACK on every response
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            path = unquote(url.path).rstrip('/') or '/'
+            query = parse_qs(url.query)
+            snapshot = state.snapshot  # one snapshot for the whole request
+            status, body = 404, {'error': f'no route for {path}'}
+            for pattern, func in ROUTES:
+                match = pattern.match(path)
+                if match:
+                    status, body = func(state, snapshot, query, *match.groups())
+                    break
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            if verbose:
+                super().log_message(format, *args)
+
+    return Handler
+
+
+def serve(state, host='127.0.0.1', port=8765, verbose=False):
+    # Returns the server (already listening) and the watcher's stop event
+    server = ThreadingHTTPServer((host, port), make_handler(state, verbose))
+    server.daemon_threads = True
+    stop = threading.Event()
+    threading.Thread(target=state.watch, args=(stop,), daemon=True).start()
+    return server, stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP/JSON API over the latest alert / buying outputs")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--dir', default='.', help="folder with the pipeline CSVs")
+    parser.add_argument('--poll', type=float, default=POLL_SECONDS, help="seconds between mtime checks")
+    parser.add_argument('--verbose', action='store_true', help="log every request")
+    args = parser.parse_args()
+
+    state = InventoryState(args.dir, args.poll)
+    server, stop = serve(state, args.host, args.port, args.verbose)
+    print(f"serving {args.dir} on http://{args.host}:{server.server_port} "
+          f"({state.snapshot.counts}, reload check every {args.poll}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+# pipeline.py
+# Runs the whole nightly refresh in one process.
+# Stages are a DAG: each one declares the DataFrames it needs and the ones it
+# produces, and they are handed over in memory. Stages whose inputs are ready
+# run at the same time on a thread pool (e.g. expiry_alerts next to
+# historical_analysis). CSVs are only written as optional sinks.
+#
+#   python pipeline.py                       # full refresh, writes all CSVs
+#   python pipeline.py --no-csv              # compute only
+#   python pipeline.py --only buying_recommendations   # a stage + what it needs
+#   python pipeline.py --trace trace.json --profile cprofile   # see instrumentation.py
+#   python pipeline.py --signals http://127.0.0.1:8766/signals  # social_buzz from demand_signals.py
+#
+# Stages are memoized (stage_cache.py): a stage whose inputs, code and
+# settings haven't changed reuses its last outputs, and is not even loaded
+# unless a stage that does have to run needs them (or its CSV is missing).
+
+import argparse
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from buying_recommendations import recommend_buying
+from data_loader import load_sales, load_stock
+from demand_signals import TTL_SECONDS
+from expiry_alerts import build_expiry_alerts
+from expiry_index import as_of_date
+from forecast_store import SEGMENTS_FILE
+from future_prediction import predict_future
+from generate_ai_alerts import build_ai_alerts
+from historical_analysis import analyze_history
+import instrumentation
+from instrumentation import PROFILERS, rows_of, span
+from seasonal_discounts import seasonal_discounts
+from social_trends import score_trends_from_source
+from stage_cache import DEFAULT_MAX_MB, StageCache
+from store_alerts import build_store_alerts
+from transfer_ai import suggest_transfers
+
+Stage = namedtuple('Stage', ['name', 'func', 'inputs', 'outputs'])
+
+STAGES = [
+    Stage('load_sales', load_sales, [], ['sales']),
+    Stage('load_stock', load_stock, [], ['stock']),
+    Stage('expiry_alerts', build_expiry_alerts, ['stock', 'sales'], ['expiry_alerts']),
+    Stage('historical_analysis', analyze_history, ['sales'], ['historical', 'rankings']),
+    Stage('future_prediction', predict_future, ['sales', 'stock'], ['future_segments', 'future_summary']),
+    Stage('generate_ai_alerts', build_ai_alerts, ['sales', 'stock'], ['ai_alerts']),
+    Stage('store_alerts', build_store_alerts, ['sales', 'stock'], ['store_alerts']),
+    Stage('transfer_ai', suggest_transfers, ['sales', 'stock'], ['transfers']),
+    Stage('seasonal_discounts', seasonal_discounts, ['historical'], ['seasonal_discounts']),
+    Stage('social_trends', score_trends_from_source, ['rankings', 'future_summary', 'ai_alerts'],
+          ['social_trends', 'trend_recommendations']),
+    Stage('buying_recommendations', recommend_buying, ['future_summary', 'social_trends', 'ai_alerts'],
+          ['buying']),
+]
+
+# Where each DataFrame goes on disk (same files the scripts write)
+SINKS = {
+    'expiry_alerts': 'expiry_alerts.csv',
+    'historical': 'historical_analysis.csv',
+    'rankings': 'product_rankings.csv',
+    'future_segments': SEGMENTS_FILE,
+    'future_summary': 'future_prediction_summary.csv',
+    'ai_alerts': 'ai_alerts.csv',
+    'store_alerts': 'store_alerts.csv',
+    'transfers': 'transfer_suggestions.csv',
+    'seasonal_discounts': 'seasonal_discounts.csv',
+    'social_trends': 'social_trends.csv',
+    'trend_recommendations': 'trend_based_recommendations.csv',
+    'buying': 'buying_recommendations.csv',
+}
+
+# Sinks that aren't DataFrames and how they are written
+SINK_WRITERS = {
+    'future_segments': lambda segments, path: segments.save(path),
+}
+
+# The file each loading stage reads (hashed for the stage cache)
+SOURCES = {
+    'load_sales': 'sales.csv',
+    'load_stock': 'stock.csv',
+}
+
+# Run-time parameters a stage's result depends on besides its inputs / code
+STAGE_PARAMS = {
+    'expiry_alerts': lambda: {'as_of': as_of_date().isoformat()},
+}
+
+
+def signal_params(source, ttl=TTL_SECONDS):
+    # Fingerprint params of social_trends with --signals: the source, plus the
+    # file's mtime / size, or for a URL the TTL window (asked again once per TTL)
+    params = {'signals': source, 'signal_ttl': ttl}
+    if source and source.startswith(('http://', 'https://')):
+        params['signal_window'] = int(time.time() // ttl)
+    elif source:
+        st = os.stat(source)
+        params['signal_file'] = [st.st_mtime_ns, st.st_size]
+    return params
+
+
+def check_dag(stages):
+    producers = {}
+    for stage in stages:
+        for name in stage.outputs:
+            if name in producers:
+                raise ValueError(f"'{name}' is produced by both {producers[name]} and {stage.name}")
+            producers[name] = stage.name
+    for stage in stages:
+        missing = [name for name in stage.inputs if name not in producers]
+        if missing:
+            raise ValueError(f"stage {stage.name} needs {missing}, which no stage produces")
+    return producers
+
+
+def select_stages(stages, wanted):
+    # The wanted stages plus everything upstream of them
+    producers = check_dag(stages)
+    by_name = {stage.name: stage for stage in stages}
+    unknown = [name for name in wanted if name not in by_name]
+    if unknown:
+        raise ValueError(f"unknown stage(s): {unknown}")
+    keep, todo = set(), list(wanted)
+    while todo:
+        name = todo.pop()
+        if name not in keep:
+            keep.add(name)
+            todo.extend(producers[dep] for dep in by_name[name].inputs)
+    return [stage for stage in stages if stage.name in keep]
+
+
+def _write_sinks(produced, cache=None, fingerprint=None):
+    for name, df in produced.items():
+        if name in SINKS:
+            with span(f'write {SINKS[name]}', cat='write', rows=len(df)):
+                if name in SINK_WRITERS:
+                    SINK_WRITERS[name](df, SINKS[name])
+                else:
+                    df.to_csv(SINKS[name], index=False)
+            if cache is not None:
+                cache.wrote_sink(SINKS[name], fingerprint)
+
+
+def _run_stage(stage, inputs, write_csv, cache=None, fingerprint=None, options=None):
+    start = time.perf_counter()
+    with span(stage.name, cat='stage', profile=True) as info:
+        result = stage.func(*inputs, **(options or {}))
+        info['rows'] = rows_of(result)
+    if len(stage.outputs) == 1:
+        result = (result,)
+    produced = dict(zip(stage.outputs, result))
+    if cache is not None and stage.name not in SOURCES:
+        with span(f'cache {stage.name}', cat='write'):
+            cache.put(fingerprint, stage.name, produced)
+    if write_csv:
+        _write_sinks(produced, cache, fingerprint)
+    return produced, time.perf_counter() - start
+
+
+def _restore_stage(stage, names, write_csv, cache, fingerprint):
+    start = time.perf_counter()
+    with span(f'restore {stage.name}', cat='load'):
+        produced = cache.get(fingerprint, names)
+    if write_csv:
+        stale = {name: df for name, df in produced.items()
+                 if name in SINKS and not cache.sink_current(SINKS[name], fingerprint)}
+        _write_sinks(stale, cache, fingerprint)
+    return produced, time.perf_counter() - start
+
+
+def plan_cached(stages, cache, write_csv=True, params=None):
+    # -> (fingerprints, {stage: 'run' | 'restore' | 'skip'}, {stage: outputs to restore})
+    fingerprints = cache.fingerprints(stages, SOURCES, STAGE_PARAMS if params is None else params)
+    hit = {s.name: s.name not in SOURCES and cache.has(fingerprints[s.name]) for s in stages}
+
+    # Frames that must be in memory: inputs of stages that run, and outputs
+    # of cached stages whose CSV isn't the one written for that fingerprint
+    needed = set()
+    for stage in stages:
+        if not hit[stage.name] and stage.name not in SOURCES:
+            needed.update(stage.inputs)
+        elif hit[stage.name] and write_csv:
+            needed.update(name for name in stage.outputs
+                          if name in SINKS and not cache.sink_current(SINKS[name], fingerprints[stage.name]))
+
+    actions, restore = {}, {}
+    for stage in stages:
+        wanted = [name for name in stage.outputs if name in needed]
+        if stage.name in SOURCES:
+            actions[stage.name] = 'run' if wanted else 'skip'
+        elif not hit[stage.name]:
+            actions[stage.name] = 'run'
+        elif wanted:
+            actions[stage.name], restore[stage.name] = 'restore', wanted
+        else:
+            actions[stage.name] = 'skip'
+    return fingerprints, actions, restore
+
+
+def run_pipeline(stages=STAGES, write_csv=True, workers=4, verbose=True, cache=None, options=None, params=None):
+    # With a StageCache, the returned frames only hold what was computed or
+    # restored (cached stages nobody needed are skipped). options: {stage:
+    # keyword arguments for its func}; params: fingerprint params like
+    # STAGE_PARAMS (default), which should cover those options.
+    check_dag(stages)
+    options = options or {}
+    if cache is not None:
+        fingerprints, actions, restore = plan_cached(stages, cache, write_csv, params)
+    else:
+        fingerprints, actions, restore = {}, {stage.name: 'run' for stage in stages}, {}
+    frames = {}
+    pending = [stage for stage in stages if actions[stage.name] != 'skip']
+    running = {}
+    if verbose:
+        for stage in stages:
+            if actions[stage.name] == 'skip':
+                print(f"{stage.name:<24}   cached")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while pending or running:
+            # Start every stage whose inputs are all in memory (cached
+            # stages are restored right away, they need no inputs)
+            for stage in [s for s in pending if actions[s.name] == 'restore'
+                          or all(name in frames for name in s.inputs)]:
+                pending.remove(stage)
+                fingerprint = fingerprints.get(stage.name)
+                if actions[stage.name] == 'restore':
+                    future = pool.submit(_restore_stage, stage, restore[stage.name], write_csv, cache, fingerprint)
+                else:
+                    inputs = [frames[name] for name in stage.inputs]
+                    future = pool.submit(_run_stage, stage, inputs, write_csv, cache, fingerprint,
+                                         options.get(stage.name))
+                running[future] = stage
+
+            if not running:
+                raise ValueError(f"stages can never run (cycle?): {[s.name for s in pending]}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                produced, seconds = future.result()
+                frames.update(produced)
+                if verbose:
+                    note = '  (restored from cache)' if actions[stage.name] == 'restore' else ''
+                    print(f"{stage.name:<24} {seconds:8.3f}s{note}")
+
+    if cache is not None:
+        cache.evict()
+        cache.save_index()
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run all pipeline stages in one process")
+    parser.add_argument('--no-csv', action='store_true', help="don't write the CSV outputs")
+    parser.add_argument('--only', nargs='+', metavar='STAGE',
+                        help="run these stages (and the stages they depend on)")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--trace', metavar='JSON',
+                        help="write a Chrome trace of every stage / sub-step here")
+    parser.add_argument('--profile', choices=PROFILERS,
+                        help="also profile each stage (written next to --trace)")
+    parser.add_argument('--no-stage-cache', action='store_true',
+                        help="run every stage, don't read or write the stage cache")
+    parser.add_argument('--signals', metavar='SOURCE',
+                        help="demand signal URL or CSV for social_trends' social_buzz (see demand_signals.py)")
+    parser.add_argument('--signal-ttl', type=float, default=TTL_SECONDS,
+                        help="seconds a cached signal is reused without asking the source again")
+    parser.add_argument('--stage-cache-mb', type=float, default=DEFAULT_MAX_MB,
+                        help="on-disk budget of the stage cache (least recently used entries go first)")
+    args = parser.parse_args()
+
+    stages = select_stages(STAGES, args.only) if args.only else STAGES
+    if args.profile and not args.trace:
+        parser.error("--profile needs --trace")
+    if args.profile and args.workers > 1:
+        # One profiler per process (see instrumentation.py): stages in turn
+        print(f"--profile: running stages one at a time instead of on {args.workers} workers", file=sys.stderr)
+        args.workers = 1
+    try:
+        tracer = instrumentation.start(args.profile) if args.trace else None
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    start = time.perf_counter()
+    try:
+        cache = None if args.no_stage_cache else StageCache(max_mb=args.stage_cache_mb)
+        options = {'social_trends': {'source': args.signals, 'ttl': args.signal_ttl}}
+        params = dict(STAGE_PARAMS, social_trends=lambda: signal_params(args.signals, args.signal_ttl))
+        run_pipeline(stages, write_csv=not args.no_csv, workers=args.workers, cache=cache,
+                     options=options, params=params)
+        if cache is not None:
+            print(f"stage cache: {cache.hits} restored, {cache.misses} stored")
+    finally:
+        if tracer is not None:
+            instrumentation.stop()
+            written = tracer.save(args.trace)
+            instrumentation.print_summary(tracer, file=sys.stderr)
+            print(f"trace written to {', '.join(written)}")
+    print(f"pipeline finished in {time.perf_counter() - start:.3f}s")
+
+
+if __name__ == '__main__':
+    main()
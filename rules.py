@@ -0,0 +1,117 @@
+# rules.py
+# Alert thresholds + vectorized label rules shared by the alert scripts.
+# Every rule works on a whole Series at once (np.select) and gives the same
+# labels the old per-row functions did, including for missing values.
+
+import numpy as np
+import pandas as pd
+
+# ---- thresholds (Option 2 settings) ----
+REORDER_LEVEL = 10
+OVERSTOCK_THRESHOLD = 60
+REORDER_TARGET = REORDER_LEVEL * 2
+
+# avg daily sales cut-offs for movement labels
+FAST_MOVING_MIN = 10
+SLOW_MOVING_MAX = 2
+
+# avg daily sales cut-offs for ai_alerts.py speed categories
+FAST_SPEED_ABOVE = 15
+SLOW_SPEED_BELOW = 5
+
+# days left before expiry that counts as "expiring soon"
+EXPIRING_SOON_DAYS = 7
+
+REORDER_STATUSES = ['low_stock', 'out_of_stock']
+
+# trend categories that get extra stock / a HIGH buying priority
+HOT_TRENDS = ['viral', 'trending']
+
+
+def _labels(series, conditions, choices, default):
+    values = np.select([np.asarray(c, dtype=bool) for c in conditions], choices, default=default)
+    return pd.Series(values, index=series.index)
+
+
+def movement_labels(avg_daily_sales):
+    avg = avg_daily_sales.astype(float)
+    return _labels(avg,
+                   [avg.isna(), avg >= FAST_MOVING_MIN, avg <= SLOW_MOVING_MAX],
+                   ['unknown', 'fast-moving', 'slow-moving'],
+                   'normal-moving')
+
+
+def stock_status_labels(stock_level):
+    # Missing stock levels fall through to 'ok', as before
+    level = stock_level.astype(float)
+    return _labels(level,
+                   [level == 0, level < REORDER_LEVEL, level > OVERSTOCK_THRESHOLD],
+                   ['out_of_stock', 'low_stock', 'overstock'],
+                   'ok')
+
+
+def reorder_suggestions(stock_level, status, target=REORDER_TARGET, as_int=False):
+    # Units needed to get back to target, only for low / out-of-stock rows
+    needs = status.isin(REORDER_STATUSES).to_numpy()
+    if as_int or not needs.any():
+        level = stock_level.to_numpy(dtype=float)
+        values = np.where(needs, np.maximum(0, target - np.nan_to_num(level)), 0).astype('int64')
+    else:
+        values = np.where(needs, np.maximum(0, target - stock_level.to_numpy()), 0)
+    return pd.Series(values, index=stock_level.index)
+
+
+def expiry_status_labels(days_left):
+    days = days_left.astype(float)
+    return _labels(days,
+                   [days.isna(), days < 0, days <= EXPIRING_SOON_DAYS],
+                   ['unknown', 'expired', 'expiring_soon'],
+                   'safe')
+
+
+def fefo_status_labels(days_left, expected_unsold):
+    # Outlook for a lot once stock is sold first-expired-first-out
+    days = days_left.astype(float)
+    unsold = expected_unsold.astype(float)
+    return _labels(days,
+                   [days.isna() | unsold.isna(), days < 0, unsold > 0],
+                   ['unknown', 'expired', 'will_expire_unsold'],
+                   'sells_through')
+
+
+def speed_labels(avg_daily_sale):
+    avg = avg_daily_sale.astype(float)
+    return _labels(avg,
+                   [avg > FAST_SPEED_ABOVE, avg < SLOW_SPEED_BELOW],
+                   ['Fast Moving', 'Slow Moving'],
+                   'Medium')
+
+
+# ---- percentile buckets ----
+
+_COMPARE = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+}
+
+
+def quantile_labels(values, steps, default):
+    # steps: [(quantile, op, label), ...] checked in order, like an if/elif
+    # ladder of `value <op> values.quantile(q)`. The cut points are computed
+    # once (one quantile() call) instead of once per row.
+    cuts = values.quantile([q for q, _, _ in steps]).to_numpy()
+    x = values.to_numpy(dtype=float)
+    conditions = [_COMPARE[op](x, cut) for (_, op, _), cut in zip(steps, cuts)]
+    return _labels(values, conditions, [label for _, _, label in steps], default)
+
+
+def buying_priority_labels(trend_category, movement, units_to_buy):
+    # HIGH / MEDIUM / LOW / NO NEED, checked in the old priority() order
+    buy = units_to_buy > 0
+    return _labels(units_to_buy,
+                   [trend_category.isin(HOT_TRENDS) & buy, movement == 'fast-moving',
+                    (trend_category == 'stable') & buy, buy],
+                   ['HIGH', 'HIGH', 'MEDIUM', 'LOW'],
+                   'NO NEED')
@@ -0,0 +1,364 @@
+# sales_cube.py
+# Dense int32 sales cube (day x store x product) in memory-mapped .npy files.
+#
+# Most scripts group sales by some mix of store_id, product_id and date. The
+# cube does that grouping once: qty[day, store, product] is the units sold
+# and seen[day, store, product] says whether there was a sales row at all
+# (so days_observed / daily means match the groupbys, which only see days
+# that have rows). Totals, daily averages, peak / lowest days, store coverage
+# and trailing windows are then axis reductions and slices.
+#
+# Layout: days are the outer axis, cut into blocks of BLOCK_DAYS days, one
+# qty-*.npy / seen-*.npy pair per block in .cache/sales_cube/. New days only
+# add (or rewrite) the last blocks, so updates are incremental by day. Rows
+# appended to sales.csv are folded in like incremental_history.py does; a
+# rewritten file, a row dated before the first day, a store / product the
+# cube has never seen or appended dates that don't fit the file's detected
+# format trigger a full rebuild. Block files are versioned and
+# meta.json is replaced last, so a crash mid-update leaves the old cube.
+#
+# Arrays are opened with mmap_mode='r'. A SalesCube pickles as its folder
+# name only, so worker processes re-open the same files and share the pages
+# through the OS cache instead of copying the data.
+#
+# Rows without a date, store_id or product_id are counted (skipped_rows) but
+# not stored. Store / product ids are kept as they are in the file (text ids
+# as strings, whole numbers as ints) and rows are matched to them by label.
+#
+#   python sales_cube.py                 # build / update, print a summary
+#   python sales_cube.py --rebuild --days 7
+
+import argparse
+import glob
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_loader import CACHE_DIR, load_sales
+from date_parsing import MixedDateFormatsError
+from incremental_history import appended_only, date_format_of, read_appended, source_meta
+
+CUBE_NAME = 'sales_cube'
+CUBE_VERSION = 1
+BLOCK_DAYS = 32
+INT32_MAX = np.iinfo(np.int32).max
+
+
+class RebuildNeeded(Exception):
+    pass
+
+
+def cube_dir():
+    return os.path.join(CACHE_DIR, CUBE_NAME)
+
+
+def _day_numbers(dates, first_day):
+    return ((dates - first_day) // pd.Timedelta(days=1)).to_numpy()
+
+
+def _positions(values, labels):
+    # Position of each id in `labels` (-1 if it isn't there)
+    values = np.asarray(values)
+    if labels.dtype.kind == 'U':
+        values = values.astype(str)
+    return pd.Index(labels).get_indexer(values)
+
+
+def _placed(rows, first_day, stores, products):
+    # -> (day, store pos, product pos, qty) for rows that fit in the cube,
+    # and the number of rows that can't be placed (no date / store / product)
+    day = pd.to_datetime(rows['date']).dt.normalize()
+    store, product = np.asarray(rows['store_id']), np.asarray(rows['product_id'])
+    keep = day.notna().to_numpy() & ~pd.isna(store) & ~pd.isna(product)
+    qty = rows['quantity'].to_numpy(dtype=float)[keep]
+    if not np.array_equal(qty, np.round(qty)):
+        raise ValueError("the sales cube stores whole units; quantity has fractions")
+
+    day = _day_numbers(day[keep], first_day)
+    s, p = _positions(store[keep], stores), _positions(product[keep], products)
+    if (s < 0).any() or (p < 0).any() or (day < 0).any():
+        raise RebuildNeeded("new store / product ids or days before the first day")
+    return day, s, p, qty.astype('int64'), int((~keep).sum())
+
+
+def _add_rows(qty, seen, day, s, p, units):
+    # Add rows (day relative to the block) into dense block arrays in place
+    n_stores, n_products = qty.shape[1], qty.shape[2]
+    flat = (day * n_stores + s) * n_products + p
+    added = np.bincount(flat, weights=units, minlength=qty.size).reshape(qty.shape)
+    total = qty + added.astype('int64')
+    if np.abs(total).max(initial=0) > INT32_MAX:
+        raise OverflowError("a (day, store, product) total no longer fits in int32")
+    qty[...] = total
+    seen.reshape(-1)[flat] = True
+
+
+class SalesCube:
+
+    def __init__(self, directory, meta):
+        self.directory = directory
+        self.meta = meta
+        self.stores = np.asarray(meta['stores'])
+        self.products = np.asarray(meta['products'])
+        self.first_day = pd.Timestamp(meta['first_day'])
+        self.n_days = meta['n_days']
+        self.block_days = meta['block_days']
+        self._open = {}
+
+    @classmethod
+    def open(cls, directory=None):
+        directory = directory or cube_dir()
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('version') != CUBE_VERSION:
+            raise RebuildNeeded(f"cube version {meta.get('version')} != {CUBE_VERSION}")
+        return cls(directory, meta)
+
+    # Pickle as the folder only: other processes map the same files
+    def __getstate__(self):
+        return {'directory': self.directory}
+
+    def __setstate__(self, state):
+        cube = SalesCube.open(state['directory'])
+        self.__dict__.update(cube.__dict__)
+
+    @property
+    def shape(self):
+        return self.n_days, len(self.stores), len(self.products)
+
+    @property
+    def dates(self):
+        return pd.date_range(self.first_day, periods=self.n_days, freq='D')
+
+    @property
+    def store_index(self):
+        return {store: i for i, store in enumerate(self.stores.tolist())}
+
+    @property
+    def product_index(self):
+        return {product: i for i, product in enumerate(self.products.tolist())}
+
+    def block(self, b):
+        # (qty, seen) memmaps of block b, shape (block_days, stores, products)
+        if b not in self._open:
+            files = self.meta['blocks'][str(b)]
+            self._open[b] = tuple(np.load(os.path.join(self.directory, files[name]), mmap_mode='r')
+                                  for name in ['qty', 'seen'])
+        return self._open[b]
+
+    def _ranges(self, start, stop):
+        for b in range(start // self.block_days, -(-stop // self.block_days)):
+            base = b * self.block_days
+            yield b, max(start, base) - base, min(stop, base + self.block_days) - base
+
+    # ---- slices ----
+
+    def days(self, start=0, stop=None):
+        # (qty, seen) for days [start, stop); a view when it is inside one block
+        stop = self.n_days if stop is None else min(stop, self.n_days)
+        start = max(0, start)
+        parts = [(self.block(b)[0][lo:hi], self.block(b)[1][lo:hi]) for b, lo, hi in self._ranges(start, stop)]
+        if len(parts) == 1:
+            return parts[0]
+        if not parts:
+            empty = (0, len(self.stores), len(self.products))
+            return np.zeros(empty, dtype='int32'), np.zeros(empty, dtype=bool)
+        return np.concatenate([q for q, _ in parts]), np.concatenate([s for _, s in parts])
+
+    def trailing(self, n_days):
+        return self.days(self.n_days - n_days, self.n_days)
+
+    def day_of(self, date):
+        return int(_day_numbers(pd.DatetimeIndex([pd.Timestamp(date).normalize()]), self.first_day)[0])
+
+    # ---- reductions (one block at a time, so memory stays at one block) ----
+
+    def reduce(self, func, start=0, stop=None):
+        stop = self.n_days if stop is None else min(stop, self.n_days)
+        return [func(self.block(b)[0][lo:hi], self.block(b)[1][lo:hi])
+                for b, lo, hi in self._ranges(max(0, start), stop)]
+
+    def product_daily(self, start=0, stop=None):
+        # [day, product] units and [day, product] "had a sales row"
+        parts = self.reduce(lambda q, s: (q.sum(axis=1, dtype='int64'), s.any(axis=1)), start, stop)
+        if not parts:
+            return np.zeros((0, len(self.products)), dtype='int64'), np.zeros((0, len(self.products)), dtype=bool)
+        return np.concatenate([q for q, _ in parts]), np.concatenate([s for _, s in parts])
+
+    def store_product_totals(self, start=0, stop=None):
+        parts = self.reduce(lambda q, s: q.sum(axis=0, dtype='int64'), start, stop)
+        return np.sum(parts, axis=0) if parts else np.zeros((len(self.stores), len(self.products)), dtype='int64')
+
+    def product_totals(self, start=0, stop=None):
+        return self.store_product_totals(start, stop).sum(axis=0)
+
+    def store_coverage(self, start=0, stop=None):
+        # Number of stores with at least one sales row per product
+        parts = self.reduce(lambda q, s: s.any(axis=0), start, stop)
+        sold = np.logical_or.reduce(parts) if parts else np.zeros((len(self.stores), len(self.products)), dtype=bool)
+        return sold.sum(axis=0)
+
+    def history(self):
+        # historical_analysis-style stats per product (products with dated rows)
+        daily, observed = self.product_daily()
+        days = observed.sum(axis=0)
+        peak = np.where(observed, daily, np.iinfo('int64').min).argmax(axis=0)
+        low = np.where(observed, daily, np.iinfo('int64').max).argmin(axis=0)
+        cols = np.arange(len(self.products))
+        dates = self.dates
+        stats = pd.DataFrame({
+            'product_id': self.products,
+            'total_sales': daily.sum(axis=0),
+            'average_daily_sales': np.divide(daily.sum(axis=0), days, out=np.full(len(days), np.nan), where=days > 0),
+            'peak_sales_day': dates[peak] if len(dates) else pd.NaT,
+            'peak_sales_qty': daily[peak, cols] if len(dates) else 0,
+            'lowest_sales_day': dates[low] if len(dates) else pd.NaT,
+            'lowest_sales_qty': daily[low, cols] if len(dates) else 0,
+            'total_store_coverage': self.store_coverage(),
+        })
+        return stats[days > 0].reset_index(drop=True)
+
+
+# ---- build / update ----
+
+def _write_blocks(directory, blocks, generation):
+    # blocks: {b: (qty, seen)} -> {str(b): {'qty': file, 'seen': file}}
+    files = {}
+    for b, (qty, seen) in blocks.items():
+        names = {'qty': f'qty-{b:05d}-{generation}.npy', 'seen': f'seen-{b:05d}-{generation}.npy'}
+        for name, array, dtype in [('qty', qty, 'int32'), ('seen', seen, bool)]:
+            out = np.lib.format.open_memmap(os.path.join(directory, names[name]), mode='w+',
+                                            dtype=dtype, shape=array.shape)
+            out[...] = array
+            out.flush()
+            del out
+        files[str(b)] = names
+    return files
+
+
+def _save(directory, meta):
+    tmp = os.path.join(directory, 'meta.json.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(directory, 'meta.json'))
+    # Drop block files the new meta no longer points to
+    keep = {name for files in meta['blocks'].values() for name in files.values()}
+    for path in glob.glob(os.path.join(directory, '*.npy')):
+        if os.path.basename(path) not in keep:
+            os.remove(path)
+
+
+def _ids(values):
+    # Distinct ids, sorted, as JSON-able labels: numbers (ints when whole)
+    # or fixed-width unicode for anything else, like expiry_index._storable
+    _, labels = pd.factorize(np.asarray(values), sort=True)
+    labels = np.asarray(labels)
+    if labels.dtype.kind == 'f' and np.array_equal(labels, np.floor(labels)):
+        labels = labels.astype('int64')
+    elif labels.dtype.kind not in 'iuf':
+        labels = labels.astype(str)
+    return labels
+
+
+def build_cube(sales, directory=None, block_days=BLOCK_DAYS, source=None):
+    directory = directory or cube_dir()
+    os.makedirs(directory, exist_ok=True)
+    dates = pd.to_datetime(sales['date']).dropna()
+    first_day = dates.min().normalize() if len(dates) else pd.Timestamp(0)
+    stores, products = _ids(sales['store_id']), _ids(sales['product_id'])
+    day, s, p, units, skipped = _placed(sales, first_day, stores, products)
+    n_days = int(day.max()) + 1 if len(day) else 0
+
+    order = np.argsort(day, kind='stable')
+    day, s, p, units = day[order], s[order], p[order], units[order]
+    shape = (block_days, len(stores), len(products))
+    blocks = {}
+    for b in range(-(-n_days // block_days)):
+        lo, hi = np.searchsorted(day, [b * block_days, (b + 1) * block_days])
+        qty, seen = np.zeros(shape, dtype='int64'), np.zeros(shape, dtype=bool)
+        _add_rows(qty, seen, day[lo:hi] - b * block_days, s[lo:hi], p[lo:hi], units[lo:hi])
+        blocks[b] = (qty, seen)
+
+    meta = {'version': CUBE_VERSION, 'first_day': first_day.isoformat(), 'n_days': n_days,
+            'block_days': block_days, 'stores': stores.tolist(), 'products': products.tolist(),
+            'skipped_rows': skipped, 'generation': 0, 'source': source}
+    meta['blocks'] = _write_blocks(directory, blocks, 0)
+    _save(directory, meta)
+    return SalesCube(directory, meta)
+
+
+def fold_rows(cube, rows, source=None):
+    # Add appended rows: rewrites only the blocks they touch (raises
+    # RebuildNeeded for rows the current layout can't hold)
+    day, s, p, units, skipped = _placed(rows, cube.first_day, cube.stores, cube.products)
+    meta = dict(cube.meta, skipped_rows=cube.meta['skipped_rows'] + skipped, source=source)
+    generation = meta['generation'] + 1
+    shape = (cube.block_days, len(cube.stores), len(cube.products))
+    blocks = {}
+    for b in np.unique(day // cube.block_days).tolist():
+        at = day // cube.block_days == b
+        if str(b) in cube.meta['blocks']:
+            qty, seen = (np.array(a) for a in cube.block(b))
+            qty = qty.astype('int64')
+        else:
+            qty, seen = np.zeros(shape, dtype='int64'), np.zeros(shape, dtype=bool)
+        _add_rows(qty, seen, day[at] - b * cube.block_days, s[at], p[at], units[at])
+        blocks[b] = (qty, seen)
+    meta['blocks'] = dict(cube.meta['blocks'], **_write_blocks(cube.directory, blocks, generation))
+    meta['generation'] = generation
+    meta['n_days'] = max(cube.n_days, int(day.max()) + 1 if len(day) else 0)
+    _save(cube.directory, meta)
+    return SalesCube(cube.directory, meta)
+
+
+def load_sales_cube(path='sales.csv', dayfirst=False, directory=None, rebuild=False):
+    # The cube for `path`, folding in rows appended since the last call
+    directory = directory or cube_dir()
+    cube = None
+    if not rebuild:
+        try:
+            cube = SalesCube.open(directory)
+        except (OSError, ValueError, KeyError, RebuildNeeded):
+            cube = None
+    if cube is not None and appended_only(path, cube.meta['source'], dayfirst):
+        try:
+            rows, offset = read_appended(path, cube.meta['source'], dayfirst)
+            if rows is None:
+                return cube
+            return fold_rows(cube, rows, source_meta(path, offset, dayfirst, date_format_of(rows, cube.meta['source'])))
+        except (RebuildNeeded, MixedDateFormatsError):
+            pass  # fall through to a full rebuild (format detected over the whole file)
+    offset = os.path.getsize(path)
+    sales = load_sales(path, dayfirst=dayfirst)
+    return build_cube(sales, directory, source=source_meta(path, offset, dayfirst, date_format_of(sales)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build / update the sales cube and print a summary")
+    parser.add_argument('--rebuild', action='store_true', help="ignore the existing cube")
+    parser.add_argument('--days', type=int, default=7, help="trailing window for the summary")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    cube = load_sales_cube(rebuild=args.rebuild)
+    seconds = time.perf_counter() - start
+    n_days, n_stores, n_products = cube.shape
+    size_mb = sum(os.path.getsize(os.path.join(cube.directory, name))
+                  for files in cube.meta['blocks'].values() for name in files.values()) / 1e6
+    print(f"cube {n_days} days x {n_stores} stores x {n_products} products "
+          f"({len(cube.meta['blocks'])} blocks, {size_mb:.1f} MB, {cube.meta['skipped_rows']} rows skipped) "
+          f"ready in {seconds:.3f}s")
+
+    start = time.perf_counter()
+    qty, seen = cube.trailing(args.days)
+    recent = qty.sum(axis=(0, 1), dtype='int64')
+    top = np.argsort(-recent, kind='stable')[:10]
+    print(f"top products over the last {args.days} days ({(time.perf_counter() - start) * 1e3:.1f} ms):")
+    print(pd.DataFrame({'product_id': cube.products[top], 'units': recent[top]}).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
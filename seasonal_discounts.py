@@ -4,25 +4,17 @@
 import pandas as pd
 import numpy as np
 
-# Load historical analysis (sales trends)
-historical = pd.read_csv('historical_analysis.csv')
-
-# Normalize column names
-historical.columns = [c.lower().strip() for c in historical.columns]
-
-# Create a mock seasonal factor based on sales performance
-def get_season(total):
-    if total > historical['total_sales'].quantile(0.75):
-        return "festival"
-    elif total > historical['total_sales'].quantile(0.50):
-        return "summer"
-    elif total > historical['total_sales'].quantile(0.25):
-        return "winter"
-    else:
-        return "off-season"
-
-# Assign season
-historical['season'] = historical['total_sales'].apply(get_season)
+from data_loader import normalize_columns
+from instrumentation import span
+from rules import quantile_labels
+
+# Mock seasonal factor from total_sales percentile (checked top to bottom)
+SEASON_STEPS = [
+    (0.75, '>', "festival"),
+    (0.50, '>', "summer"),
+    (0.25, '>', "winter"),
+]
+
 
 # Discount logic
 def discount_factor(season):
@@ -34,7 +26,6 @@ def discount_factor(season):
         return 15
     return 25  # off-season highest discount
 
-historical['recommended_discount_percent'] = historical['season'].apply(discount_factor)
 
 # Explanation column
 def reason(season):
@@ -46,10 +37,32 @@ def reason(season):
         return "Low demand — increase discount"
     return "Very low sales — offer big discount"
 
-historical['discount_reason'] = historical['season'].apply(reason)
 
-# Save output
-historical.to_csv('seasonal_discounts.csv', index=False)
+def seasonal_discounts(historical):
+    historical = historical.copy()
+
+    # Assign season based on sales performance
+    with span('label seasons', cat='label', rows=len(historical)):
+        historical['season'] = quantile_labels(historical['total_sales'], SEASON_STEPS, "off-season")
+
+    with span('label discounts', cat='label', rows=len(historical)):
+        historical['recommended_discount_percent'] = historical['season'].apply(discount_factor)
+        historical['discount_reason'] = historical['season'].apply(reason)
+    return historical
+
+
+def main():
+    # Load historical analysis (sales trends)
+    historical = normalize_columns(pd.read_csv('historical_analysis.csv'))
+
+    historical = seasonal_discounts(historical)
+
+    # Save output
+    historical.to_csv('seasonal_discounts.csv', index=False)
+
+    print("seasonal_discounts.csv created successfully!")
+    print(historical[['product_id','total_sales','season','recommended_discount_percent','discount_reason']].head(20))
+
 
-print("seasonal_discounts.csv created successfully!")
-print(historical[['product_id','total_sales','season','recommended_discount_percent','discount_reason']].head(20))
\ No newline at end of file
+if __name__ == '__main__':
+    main()
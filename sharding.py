@@ -0,0 +1,55 @@
+# sharding.py
+# Store-sharded execution for the per-(store, product) jobs.
+#
+# Sales and stock are split into shards by store_id: every store lands in
+# exactly one shard, so per-store aggregation never needs data from another
+# shard. Stores are spread over shards by sales volume (largest first onto the
+# lightest shard) to keep the workers evenly loaded. Shards run on a process
+# pool, and the results come back in shard order, so merging is deterministic.
+# Rows without a store_id go to the first shard.
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+def _store_values(frame):
+    # Plain store_id values (numbers or text; categorical codes differ per frame)
+    return np.asarray(frame['store_id'])
+
+
+def assign_stores(sales, stock, n_shards):
+    # store_id -> shard number, balanced by number of sales + stock rows
+    codes, stores = pd.factorize(np.concatenate([_store_values(sales), _store_values(stock)]), sort=True)
+    counts = np.bincount(codes[codes >= 0], minlength=len(stores))
+
+    load = np.zeros(n_shards)
+    shard_of = np.empty(len(stores), dtype=int)
+    for i in np.argsort(-counts, kind='stable'):
+        shard = int(np.argmin(load))
+        shard_of[i] = shard
+        load[shard] += counts[i]
+    return stores, shard_of
+
+
+def _shard_ids(frame, stores, shard_of):
+    pos = pd.Index(stores).get_indexer(_store_values(frame))
+    return np.where(pos >= 0, shard_of[pos], 0)
+
+
+def store_shards(sales, stock, n_shards):
+    # [(sales_shard, stock_shard), ...]; original row index is kept
+    n_shards = max(1, n_shards)
+    stores, shard_of = assign_stores(sales, stock, n_shards)
+    sales_ids = _shard_ids(sales, stores, shard_of)
+    stock_ids = _shard_ids(stock, stores, shard_of)
+    return [(sales[sales_ids == i], stock[stock_ids == i]) for i in range(n_shards)]
+
+
+def run_sharded(func, shards, workers):
+    # func(sales_shard, stock_shard) on every shard, results in shard order
+    if workers <= 1 or len(shards) <= 1:
+        return [func(sales, stock) for sales, stock in shards]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(func, *zip(*shards)))
@@ -1,66 +1,115 @@
 # social_trends.py
 # AI-based social media trend scoring for each product
+#
+# social_buzz comes from external demand signals when --signals names a
+# source (demand_signals.py; pipeline.py --signals for the pipeline stage);
+# products without a signal, and every product when no source is given,
+# keep the seeded simulated buzz and say so: signal_status 'simulated'.
+
+import argparse
 
 import pandas as pd
 import numpy as np
 
-# Load previous outputs
-rankings = pd.read_csv('product_rankings.csv')
-future = pd.read_csv('future_prediction_summary.csv')
-ai_alerts = pd.read_csv('ai_alerts.csv')
-
-# Normalize column names
-rankings.columns = [c.lower().strip() for c in rankings.columns]
-future.columns = [c.lower().strip() for c in future.columns]
-ai_alerts.columns = [c.lower().strip() for c in ai_alerts.columns]
-
-# Merge everything
-merged = rankings.merge(future, on='product_id', how='left')
-merged = merged.merge(ai_alerts[['product_id','movement']], on='product_id', how='left')
-
-# --- AI SOCIAL TREND SCORING ---
-
-# Social buzz factor (simulated social media buzz)
-np.random.seed(42)
-merged['social_buzz'] = np.random.randint(10, 100, size=len(merged))
-
-# Trend score calculation
-merged['trend_score'] = (
-    merged['total_sales'] * 0.30 +
-    merged['forecast_next_30'] * 0.30 +
-    merged['social_buzz'] * 0.20 +
-    merged['rank'].max() / merged['rank'] * 0.10 +
-    merged['suggested_additional_stock'] * 0.10
-).round(2)
-
-# Trend category
-def trend_label(score):
-    if score >= merged['trend_score'].quantile(0.75):
-        return "viral"
-    if score >= merged['trend_score'].quantile(0.50):
-        return "trending"
-    if score >= merged['trend_score'].quantile(0.25):
-        return "stable"
-    return "declining"
-
-merged['trend_category'] = merged['trend_score'].apply(trend_label)
-
-# Save social trends
-merged.to_csv('social_trends.csv', index=False)
-
-# --- TREND-BASED BUYING RECOMMENDATIONS ---
-
-recommendations = merged[['product_id','trend_score','trend_category',
-                          'forecast_next_30','current_stock','suggested_additional_stock']].copy()
-
-def buy_suggestion(row):
-    if row['trend_category'] in ['viral','trending']:
-        return int(row['suggested_additional_stock'] + (row['trend_score'] * 0.1))
-    return 0  # don't buy for declining or stable
-
-recommendations['extra_qty_to_buy'] = recommendations.apply(buy_suggestion, axis=1)
-
-recommendations.to_csv('trend_based_recommendations.csv', index=False)
-
-print("social_trends.csv and trend_based_recommendations.csv created successfully!")
-print(recommendations.head(20).to_string(index=False))
\ No newline at end of file
+from data_loader import normalize_columns
+from demand_signals import SIGNAL_COLUMNS, TTL_SECONDS, load_signals
+from features import lookup, product_features
+from instrumentation import span
+from rules import HOT_TRENDS, quantile_labels
+
+# Trend category by trend_score percentile (checked top to bottom)
+TREND_STEPS = [
+    (0.75, '>=', "viral"),
+    (0.50, '>=', "trending"),
+    (0.25, '>=', "stable"),
+]
+
+
+def score_trends(rankings, future, ai_alerts, signals=None):
+    # One feature table: rankings + forecast + movement (see features.py)
+    with span('merge product features', cat='aggregate', rows=len(rankings)):
+        merged = product_features(rankings, future, ai_alerts)
+
+    # --- AI SOCIAL TREND SCORING ---
+
+    # Social buzz factor (simulated social media buzz)
+    np.random.seed(42)
+    merged['social_buzz'] = np.random.randint(10, 100, size=len(merged))
+
+    # Measured signals where there are any (demand_signals.fetch_signals output)
+    if signals is not None:
+        signals = signals.drop_duplicates('product_id', keep='last')
+        merged = lookup(merged.rename(columns={'social_buzz': 'simulated_buzz'}), signals,
+                        SIGNAL_COLUMNS + ['signal_status'])
+        measured = merged['social_buzz'].notna()
+        merged['social_buzz'] = merged['social_buzz'].fillna(merged.pop('simulated_buzz'))
+        merged['signal_status'] = merged['signal_status'].where(measured, 'simulated')
+    else:
+        merged['signal_status'] = 'simulated'
+
+    with span('label trends', cat='label', rows=len(merged)):
+        # Trend score calculation
+        merged['trend_score'] = (
+            merged['total_sales'] * 0.30 +
+            merged['forecast_next_30'] * 0.30 +
+            merged['social_buzz'] * 0.20 +
+            merged['rank'].max() / merged['rank'] * 0.10 +
+            merged['suggested_additional_stock'] * 0.10
+        ).round(2)
+
+        # Trend category
+        merged['trend_category'] = quantile_labels(merged['trend_score'], TREND_STEPS, "declining")
+
+    # --- TREND-BASED BUYING RECOMMENDATIONS ---
+
+    with span('trend recommendations', cat='label', rows=len(merged)):
+        recommendations = merged[['product_id','trend_score','trend_category',
+                                  'forecast_next_30','current_stock','suggested_additional_stock']].copy()
+
+        # Extra stock (truncated like int()) for hot trends only; don't buy for declining or stable
+        extra = np.trunc(recommendations['suggested_additional_stock'] + recommendations['trend_score'] * 0.1)
+        hot = recommendations['trend_category'].isin(HOT_TRENDS)
+        recommendations['extra_qty_to_buy'] = extra.where(hot, 0).astype('int64')
+
+    return merged, recommendations
+
+
+def score_trends_from_source(rankings, future, ai_alerts, source=None, ttl=TTL_SECONDS):
+    # score_trends with signals fetched from `source` (URL / CSV, see
+    # demand_signals.py); None keeps the simulated buzz
+    signals = None
+    if source:
+        signals = load_signals(rankings['product_id'].unique(), source, ttl=ttl)
+    return score_trends(rankings, future, ai_alerts, signals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trend scores and trend-based buying suggestions")
+    parser.add_argument('--signals', metavar='SOURCE',
+                        help="demand signal URL or CSV for social_buzz (see demand_signals.py)")
+    parser.add_argument('--signal-ttl', type=float, default=TTL_SECONDS,
+                        help="seconds a cached signal is reused without asking the source again")
+    args = parser.parse_args()
+
+    # Load previous outputs (normalized column names)
+    rankings = normalize_columns(pd.read_csv('product_rankings.csv'))
+    future = normalize_columns(pd.read_csv('future_prediction_summary.csv'))
+    ai_alerts = normalize_columns(pd.read_csv('ai_alerts.csv'))
+
+    signals = None
+    if args.signals:
+        signals = load_signals(rankings['product_id'].unique(), args.signals, ttl=args.signal_ttl)
+        print(f"demand signals from {args.signals}: {signals.attrs['signal_stats']}")
+
+    merged, recommendations = score_trends(rankings, future, ai_alerts, signals)
+
+    # Save social trends + recommendations
+    merged.to_csv('social_trends.csv', index=False)
+    recommendations.to_csv('trend_based_recommendations.csv', index=False)
+
+    print("social_trends.csv and trend_based_recommendations.csv created successfully!")
+    print(recommendations.head(20).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+# stage_cache.py
+# Memoized pipeline stages: a stage whose inputs, code and parameters are
+# unchanged since an earlier run reuses that run's outputs.
+#
+# Every stage gets a fingerprint (sha1) of
+#   - its name
+#   - the source of its module and every local module it imports, directly
+#     or not (so editing rules.py invalidates every stage that uses it)
+#   - the UPPER_CASE settings of those modules as loaded (SAFETY_FACTOR,
+#     REORDER_LEVEL, N_DAYS_FORECAST, ... even if changed at runtime)
+#   - the fingerprints of the stages producing its inputs, or, for the
+#     loading stages, a content hash of the source CSV
+#   - any run-time parameters the caller declares for it (e.g. the "today"
+#     expiry_alerts counts days from)
+# Content hashes are remembered per (path, mtime, size), so an unchanged
+# file isn't read again.
+#
+# Outputs are pickled (index and dtypes come back exactly) under
+# .cache/stages/, one folder per fingerprint. index.json tracks size and last
+# use; when the cache grows past its budget the least recently used entries
+# are removed.
+#
+# pipeline.py uses this by default (--no-stage-cache to turn it off).
+
+import ast
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import sys
+import threading
+import time
+
+from data_loader import CACHE_DIR
+
+STAGE_CACHE_NAME = 'stages'
+STAGE_CACHE_VERSION = 1
+DEFAULT_MAX_MB = 2048
+HASH_CHUNK = 1 << 20
+PARAM_TYPES = (bool, int, float, str, tuple, list, dict, type(None))
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def file_digest(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def local_imports(module_name, root=_ROOT):
+    # module_name plus every module of `root` it imports, transitively
+    seen, todo = set(), [module_name]
+    while todo:
+        name = todo.pop()
+        path = os.path.join(root, name + '.py')
+        if name in seen or not os.path.exists(path):
+            continue
+        seen.add(name)
+        with open(path, 'rb') as f:
+            tree = ast.parse(f.read(), filename=path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                todo.extend(alias.name.split('.')[0] for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                todo.append(node.module.split('.')[0])
+    return sorted(seen)
+
+
+def module_settings(names):
+    # UPPER_CASE module-level settings of the loaded modules, as JSON text
+    settings = {}
+    for name in names:
+        module = sys.modules.get(name)
+        if module is None:
+            continue
+        for attr, value in vars(module).items():
+            if attr.isupper() and isinstance(value, PARAM_TYPES):
+                settings[f'{name}.{attr}'] = value
+    return json.dumps(settings, sort_keys=True, default=_stable_name)
+
+
+def _stable_name(value):
+    # Functions / classes inside settings (e.g. a model registry) by name;
+    # repr() would include a memory address that changes every run
+    return getattr(value, '__qualname__', type(value).__name__)
+
+
+class StageCache:
+
+    def __init__(self, directory=None, max_mb=DEFAULT_MAX_MB, root=_ROOT):
+        self.directory = directory or os.path.join(CACHE_DIR, STAGE_CACHE_NAME)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.root = root
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+        self._code = {}
+        self.index = self._read_index()
+
+    # ---- index ----
+
+    def _index_path(self):
+        return os.path.join(self.directory, 'index.json')
+
+    def _read_index(self):
+        try:
+            with open(self._index_path()) as f:
+                index = json.load(f)
+            if index.get('version') == STAGE_CACHE_VERSION:
+                return index
+        except (OSError, ValueError):
+            pass
+        return {'version': STAGE_CACHE_VERSION, 'entries': {}, 'files': {}, 'sinks': {}}
+
+    def save_index(self):
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = self._index_path() + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.index, f, indent=1)
+            os.replace(tmp, self._index_path())
+
+    # ---- fingerprints ----
+
+    def source_digest(self, path):
+        # Content hash of a source file, re-read only when mtime / size change
+        st = os.stat(path)
+        key = os.path.abspath(path)
+        known = self.index['files'].get(key)
+        if known and known['mtime_ns'] == st.st_mtime_ns and known['size'] == st.st_size:
+            return known['sha1']
+        digest = file_digest(path)
+        with self.lock:
+            self.index['files'][key] = {'mtime_ns': st.st_mtime_ns, 'size': st.st_size, 'sha1': digest}
+        return digest
+
+    def code_digest(self, module_name):
+        if module_name not in self._code:
+            h = hashlib.sha1()
+            modules = local_imports(module_name, self.root)
+            for name in modules:
+                h.update(name.encode('utf-8'))
+                h.update(file_digest(os.path.join(self.root, name + '.py')).encode('ascii'))
+            h.update(module_settings(modules).encode('utf-8'))
+            self._code[module_name] = h.hexdigest()
+        return self._code[module_name]
+
+    def fingerprints(self, stages, sources, params=None):
+        # stage name -> fingerprint. sources: {stage: file it reads};
+        # params: {stage: callable returning JSON-able run-time parameters}
+        params = params or {}
+        producers = {name: stage for stage in stages for name in stage.outputs}
+        result = {}
+
+        def visit(stage):
+            if stage.name in result:
+                return result[stage.name]
+            h = hashlib.sha1(f'{STAGE_CACHE_VERSION}|{stage.name}'.encode('utf-8'))
+            h.update(self.code_digest(stage.func.__module__).encode('ascii'))
+            if stage.name in sources:
+                h.update(self.source_digest(sources[stage.name]).encode('ascii'))
+            if stage.name in params:
+                h.update(json.dumps(params[stage.name](), sort_keys=True).encode('utf-8'))
+            for name in stage.inputs:
+                h.update(f'|{name}={visit(producers[name])}'.encode('utf-8'))
+            result[stage.name] = h.hexdigest()
+            return result[stage.name]
+
+        for stage in stages:
+            visit(stage)
+        return result
+
+    # ---- entries ----
+
+    def _entry_dir(self, fingerprint):
+        return os.path.join(self.directory, fingerprint)
+
+    def has(self, fingerprint):
+        entry = self.index['entries'].get(fingerprint)
+        return entry is not None and os.path.isdir(self._entry_dir(fingerprint))
+
+    def get(self, fingerprint, names):
+        # The cached frames `names` of an entry (marks it as recently used)
+        frames = {}
+        for name in names:
+            with open(os.path.join(self._entry_dir(fingerprint), name + '.pkl'), 'rb') as f:
+                frames[name] = pickle.load(f)
+        with self.lock:
+            self.index['entries'][fingerprint]['last_used'] = time.time()
+            self.hits += 1
+        return frames
+
+    def put(self, fingerprint, stage_name, frames):
+        final = self._entry_dir(fingerprint)
+        tmp = final + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        size = 0
+        for name, frame in frames.items():
+            path = os.path.join(tmp, name + '.pkl')
+            with open(path, 'wb') as f:
+                pickle.dump(frame, f, protocol=pickle.HIGHEST_PROTOCOL)
+            size += os.path.getsize(path)
+        shutil.rmtree(final, ignore_errors=True)
+        os.replace(tmp, final)
+        now = time.time()
+        with self.lock:
+            self.index['entries'][fingerprint] = {'stage': stage_name, 'outputs': sorted(frames),
+                                                  'bytes': size, 'created': now, 'last_used': now}
+            self.misses += 1
+
+    def evict(self):
+        # Drop least recently used entries until the cache fits its budget
+        with self.lock:
+            entries = self.index['entries']
+            total = sum(entry['bytes'] for entry in entries.values())
+            removed = []
+            for fingerprint in sorted(entries, key=lambda fp: entries[fp]['last_used']):
+                if total <= self.max_bytes:
+                    break
+                total -= entries[fingerprint]['bytes']
+                removed.append(fingerprint)
+            for fingerprint in removed:
+                del entries[fingerprint]
+                shutil.rmtree(self._entry_dir(fingerprint), ignore_errors=True)
+        return removed
+
+    # ---- CSV sinks ----
+
+    def sink_current(self, path, fingerprint):
+        # True if `path` is still the file written for this fingerprint
+        known = self.index['sinks'].get(os.path.abspath(path))
+        if not known or known['fingerprint'] != fingerprint or not os.path.exists(path):
+            return False
+        st = os.stat(path)
+        return known['mtime_ns'] == st.st_mtime_ns and known['size'] == st.st_size
+
+    def wrote_sink(self, path, fingerprint):
+        st = os.stat(path)
+        with self.lock:
+            self.index['sinks'][os.path.abspath(path)] = {'fingerprint': fingerprint,
+                                                          'mtime_ns': st.st_mtime_ns, 'size': st.st_size}
@@ -1,80 +1,93 @@
+import argparse
+
 import pandas as pd
 
-REORDER_LEVEL = 10
-OVERSTOCK_THRESHOLD = 60
-
-# Load files
-sales = pd.read_csv('sales.csv')
-stock = pd.read_csv('stock.csv')
-
-# Normalize column names
-sales.columns = [c.lower().strip() for c in sales.columns]
-stock.columns = [c.lower().strip() for c in stock.columns]
-
-# Rename qty_sold → quantity
-if 'qty_sold' in sales.columns:
-    sales = sales.rename(columns={'qty_sold': 'quantity'})
-
-# Ensure product_id exists
-if 'product' in sales.columns and 'product_id' not in sales.columns:
-    sales = sales.rename(columns={'product': 'product_id'})
-if 'product' in stock.columns and 'product_id' not in stock.columns:
-    stock = stock.rename(columns={'product': 'product_id'})
-
-# Parse dates
-sales['date'] = pd.to_datetime(sales['date'], errors='coerce')
-
-# Group sales BY STORE + PRODUCT
-sales_store = sales.groupby(['store_id','product_id']).agg(
-    total_sold=('quantity','sum'),
-    days_observed=('date', lambda x: x.nunique())
-).reset_index()
-
-# Compute avg daily sales
-sales_store['avg_daily_sales'] = (sales_store['total_sold'] / sales_store['days_observed']).round(2)
-
-# Merge with stock (store-wise)
-merged = pd.merge(
-    stock[['store_id','product_id','stock_level']],
-    sales_store[['store_id','product_id','avg_daily_sales']],
-    on=['store_id','product_id'],
-    how='left'
-)
-
-# Movement label
-def movement(avg):
-    if pd.isna(avg):
-        return 'unknown'
-    if avg >= 10:
-        return 'fast-moving'
-    if avg <= 2:
-        return 'slow-moving'
-    return 'normal-moving'
-
-merged['movement'] = merged['avg_daily_sales'].apply(movement)
-
-# Stock status
-def stock_status(val):
-    if val == 0:
-        return 'out_of_stock'
-    if val < REORDER_LEVEL:
-        return 'low_stock'
-    if val > OVERSTOCK_THRESHOLD:
-        return 'overstock'
-    return 'ok'
-
-merged['status'] = merged['stock_level'].apply(stock_status)
-
-# Reorder suggestion
-merged['reorder_target'] = REORDER_LEVEL * 2
-merged['reorder_suggestion'] = merged.apply(
-    lambda r: max(0, r['reorder_target'] - r['stock_level'])
-              if r['status'] in ['low_stock','out_of_stock'] else 0,
-    axis=1
-)
-
-# Save file
-merged.to_csv('store_alerts.csv', index=False)
-
-print("store_alerts.csv created successfully!")
-print(merged.head(40).to_string(index=False))
\ No newline at end of file
+from data_loader import load_sales, load_stock
+from instrumentation import span
+from sharding import run_sharded, store_shards
+from rules import REORDER_TARGET, movement_labels, reorder_suggestions, stock_status_labels
+from streaming import KeyAggregate, report, stream_sales
+
+
+def build_store_alerts(sales, stock):
+    # Group sales BY STORE + PRODUCT
+    with span('aggregate sales per store', cat='aggregate', rows=len(sales)):
+        sales_store = sales.groupby(['store_id','product_id'], observed=True).agg(
+            total_sold=('quantity','sum'),
+            days_observed=('date', lambda x: x.nunique())
+        ).reset_index()
+    return store_alerts_from_sales_stats(sales_store, stock)
+
+
+def store_alerts_from_sales_stats(sales_store, stock):
+    # sales_store: store_id, product_id, total_sold, days_observed
+    sales_store = sales_store.copy()
+
+    # Compute avg daily sales
+    sales_store['avg_daily_sales'] = (sales_store['total_sold'] / sales_store['days_observed']).round(2)
+
+    # Merge with stock (store-wise)
+    with span('merge store stock', cat='aggregate', rows=len(stock)):
+        merged = pd.merge(
+            stock[['store_id','product_id','stock_level']],
+            sales_store[['store_id','product_id','avg_daily_sales']],
+            on=['store_id','product_id'],
+            how='left'
+        )
+
+    with span('label store alerts', cat='label', rows=len(merged)):
+        # Movement label + stock status (vectorized rules, see rules.py)
+        merged['movement'] = movement_labels(merged['avg_daily_sales'])
+        merged['status'] = stock_status_labels(merged['stock_level'])
+
+        # Reorder suggestion
+        merged['reorder_target'] = REORDER_TARGET
+        merged['reorder_suggestion'] = reorder_suggestions(merged['stock_level'], merged['status'])
+    return merged
+
+
+def _store_alerts_shard(sales, stock):
+    # Left merge keeps stock row order, so put the original row labels back
+    merged = build_store_alerts(sales, stock)
+    merged.index = stock.index
+    return merged
+
+
+def build_store_alerts_sharded(sales, stock, workers):
+    # Same output as build_store_alerts, computed per store shard in parallel
+    shards = store_shards(sales, stock, workers)
+    parts = run_sharded(_store_alerts_shard, shards, workers)
+    return pd.concat(parts).sort_index().reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Store-level stock alerts")
+    parser.add_argument('--chunksize', type=int,
+                        help="stream sales.csv in chunks of this many rows (bounded memory)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="split by store_id and run the shards on this many processes")
+    args = parser.parse_args()
+
+    # Load files (normalized, parsed and cached by data_loader)
+    stock = load_stock()
+    if args.chunksize:
+        per_store = KeyAggregate(['store_id', 'product_id'])
+        rows = stream_sales([per_store], 'sales.csv', args.chunksize)
+        merged = store_alerts_from_sales_stats(per_store.result(), stock)
+        report('store_alerts', rows, args.chunksize)
+    elif args.workers > 1:
+        sales = load_sales()
+        merged = build_store_alerts_sharded(sales, stock, args.workers)
+    else:
+        sales = load_sales()
+        merged = build_store_alerts(sales, stock)
+
+    # Save file
+    merged.to_csv('store_alerts.csv', index=False)
+
+    print("store_alerts.csv created successfully!")
+    print(merged.head(40).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
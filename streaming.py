@@ -0,0 +1,128 @@
+# streaming.py
+# Bounded-memory sales aggregation for files that don't fit in RAM.
+#
+# sales.csv is read in chunks (pd.read_csv(chunksize=...)) and each chunk is
+# reduced to small partial aggregates that are merged into a running state:
+#   KeyAggregate   - per key: total_sold, rows, distinct days, first/last date
+#   TrailingDaily  - per product: daily totals for the last N observed days
+# Memory depends on the number of keys (products, store x product), not rows.
+#
+# Distinct-day counts are merged by checking whether a key's last day in the
+# previous chunk is its first day in the next one, so the file must be in
+# date order (which an append-by-day sales.csv is). Out-of-order dates raise
+# instead of silently giving wrong counts.
+
+import resource
+import sys
+
+import numpy as np
+import pandas as pd
+
+from data_loader import prepare_sales, sniff_sales_date_format
+
+STATS_COLUMNS = ['total_sold', 'rows', 'days_observed', 'first_date', 'last_date']
+
+
+class UnsortedDatesError(ValueError):
+    pass
+
+
+def peak_rss_mb():
+    # Peak resident set size of this process so far (ru_maxrss is KB on Linux, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def iter_sales_chunks(path='sales.csv', chunksize=1_000_000, dayfirst=False):
+    # The date format is detected once over the whole file's dates (the
+    # first chunk alone may not tell month-first from day-first)
+    date_format = sniff_sales_date_format(path, dayfirst)
+    for raw in pd.read_csv(path, chunksize=chunksize):
+        yield prepare_sales(raw, dayfirst=dayfirst, date_format=date_format, label=path)
+
+
+def _plain_keys(chunk, keys):
+    # Categorical store_id has different categories per chunk; use plain values
+    return pd.DataFrame({key: np.asarray(chunk[key]) for key in keys})
+
+
+class KeyAggregate:
+    # Running sum / row count / distinct days / first + last date per key
+
+    def __init__(self, keys):
+        self.keys = list(keys)
+        self.state = None
+
+    def add(self, chunk):
+        frame = _plain_keys(chunk, self.keys)
+        frame['quantity'] = chunk['quantity'].to_numpy()
+        frame['date'] = chunk['date'].to_numpy()
+        grouped = frame.groupby(self.keys)
+        part = pd.DataFrame({
+            'total_sold': grouped['quantity'].sum(),
+            'rows': grouped.size(),
+            'days_observed': grouped['date'].nunique(),
+            'first_date': grouped['date'].min(),
+            'last_date': grouped['date'].max(),
+        })
+        self.state = part if self.state is None else self._merge(self.state, part)
+
+    @staticmethod
+    def _merge(old, new):
+        index = old.index.union(new.index)
+        a = old.reindex(index)
+        b = new.reindex(index)
+        # A day split across two chunks must only be counted once
+        shared_day = (a['last_date'] == b['first_date']).astype('int64')
+        merged = pd.DataFrame(index=index)
+        merged['total_sold'] = a['total_sold'].fillna(0) + b['total_sold'].fillna(0)
+        merged['rows'] = a['rows'].fillna(0) + b['rows'].fillna(0)
+        merged['days_observed'] = a['days_observed'].fillna(0) + b['days_observed'].fillna(0) - shared_day
+        merged['first_date'] = a['first_date'].where(a['first_date'].notna(), b['first_date'])
+        merged['last_date'] = b['last_date'].where(b['last_date'].notna(), a['last_date'])
+        return merged.astype({'total_sold': 'int64', 'rows': 'int64', 'days_observed': 'int64'})
+
+    def result(self):
+        if self.state is None:
+            return pd.DataFrame(columns=self.keys + STATS_COLUMNS)
+        return self.state.sort_index().reset_index()
+
+
+class TrailingDaily:
+    # Daily totals per product, keeping only the last `window` observed days
+
+    def __init__(self, window=7):
+        self.window = window
+        self.kept = None
+
+    def add(self, chunk):
+        daily = chunk.groupby(['product_id', 'date'], as_index=False).agg(daily_qty=('quantity', 'sum'))
+        if self.kept is not None:
+            daily = pd.concat([self.kept, daily], ignore_index=True)
+            daily = daily.groupby(['product_id', 'date'], as_index=False)['daily_qty'].sum()
+        self.kept = daily.groupby('product_id').tail(self.window)
+
+    def result(self):
+        return self.kept.sort_values(['product_id', 'date'], ignore_index=True)
+
+
+def stream_sales(aggregates, path='sales.csv', chunksize=1_000_000, dayfirst=False):
+    # Feed every chunk of sales.csv to each aggregate; returns the number of rows read
+    last_date = None
+    total_rows = 0
+    for chunk in iter_sales_chunks(path, chunksize, dayfirst):
+        dates = chunk['date'].dropna()
+        if len(dates):
+            if (last_date is not None and dates.iloc[0] < last_date) or not dates.is_monotonic_increasing:
+                raise UnsortedDatesError(
+                    f"{path} is not in date order; streaming aggregation needs an append-by-day file")
+            last_date = dates.iloc[-1]
+        for aggregate in aggregates:
+            aggregate.add(chunk)
+        total_rows += len(chunk)
+    return total_rows
+
+
+def report(label, rows, chunksize):
+    print(f"[streaming] {label}: {rows} sales rows in chunks of {chunksize}, "
+          f"peak RSS {peak_rss_mb():.1f} MB")
@@ -0,0 +1,117 @@
+# synthetic_data.py
+# Synthetic retail data in the same schemas as our real files:
+#   products.csv  product_id,name,reorder_level
+#   sales.csv     date,store_id,product_id,qty_sold   (M/D/YYYY dates)
+#   stock.csv     date,store_id,product_id,stock_level,expiry_date
+#
+# The data is skewed like real point-of-sale data: a few products sell most
+# of the volume (Zipf-like popularity), store sizes vary, weekends sell more,
+# and slow products don't sell every day in every store.
+#
+#   python synthetic_data.py --stores 50 --products 5000 --days 365 --out bench_data
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+WEEKDAY_FACTOR = np.array([0.9, 0.85, 0.9, 1.0, 1.15, 1.35, 1.2])  # Mon..Sun
+
+
+def _date_strings(dates):
+    return np.array([f"{d.month}/{d.day}/{d.year}" for d in dates])
+
+
+def write_products(path, n_products, rng):
+    products = pd.DataFrame({
+        'product_id': np.arange(1, n_products + 1),
+        'name': [f"product {i}" for i in range(1, n_products + 1)],
+        'reorder_level': rng.integers(5, 40, size=n_products),
+    })
+    products.to_csv(path, index=False, encoding='utf-8-sig')
+
+
+def demand_rates(n_stores, n_products, rng, zipf=1.1):
+    # Expected units per (store, product) per day
+    popularity = 1.0 / np.arange(1, n_products + 1) ** zipf
+    popularity = rng.permutation(popularity) * 40 / popularity.max()
+    store_size = rng.lognormal(mean=0.0, sigma=0.5, size=n_stores)
+    return np.outer(store_size, popularity)
+
+
+def write_sales(path, rates, start, n_days, rng):
+    # Written one day at a time, so memory stays at one day of rows
+    n_stores, n_products = rates.shape
+    stores = np.repeat(np.arange(1, n_stores + 1), n_products)
+    products = np.tile(np.arange(1, n_products + 1), n_stores)
+    flat_rates = rates.ravel()
+    dates = pd.date_range(start, periods=n_days, freq='D')
+    labels = _date_strings(dates)
+
+    total = 0
+    with open(path, 'w', newline='') as f:
+        f.write('date,store_id,product_id,qty_sold\n')
+        for day, label in zip(dates, labels):
+            qty = rng.poisson(flat_rates * WEEKDAY_FACTOR[day.weekday()])
+            sold = qty > 0
+            day_rows = pd.DataFrame({'date': label, 'store_id': stores[sold],
+                                     'product_id': products[sold], 'qty_sold': qty[sold]})
+            day_rows.to_csv(f, header=False, index=False)
+            total += int(sold.sum())
+    return total
+
+
+def write_stock(path, rates, snapshot_date, rng, missing=0.03):
+    n_stores, n_products = rates.shape
+    stores = np.repeat(np.arange(1, n_stores + 1), n_products)
+    products = np.tile(np.arange(1, n_products + 1), n_stores)
+    keep = rng.random(len(stores)) >= missing
+
+    # Days of cover vary a lot, so we get low stock, overstock and zeros
+    cover_days = rng.choice([0, 0.3, 1, 3, 7, 14, 30], size=len(stores),
+                            p=[0.05, 0.1, 0.15, 0.25, 0.25, 0.15, 0.05])
+    stock_level = np.rint(rates.ravel() * cover_days).astype(int)
+    # Expiry from 10 days ago to 120 days ahead (format each distinct day once)
+    expiry_days = pd.date_range(pd.Timestamp(snapshot_date) - pd.Timedelta(days=10), periods=130, freq='D')
+    expiry = _date_strings(expiry_days)[rng.integers(0, 130, size=len(stores))]
+
+    stock = pd.DataFrame({
+        'date': _date_strings([pd.Timestamp(snapshot_date)])[0],
+        'store_id': stores[keep],
+        'product_id': products[keep],
+        'stock_level': stock_level[keep],
+        'expiry_date': expiry[keep],
+    })
+    stock.to_csv(path, index=False)
+    return len(stock)
+
+
+def generate(out_dir, n_stores, n_products, n_days, start='2025-01-01', seed=42):
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    rates = demand_rates(n_stores, n_products, rng)
+    write_products(os.path.join(out_dir, 'products.csv'), n_products, rng)
+    sales_rows = write_sales(os.path.join(out_dir, 'sales.csv'), rates, start, n_days, rng)
+    last_day = pd.Timestamp(start) + pd.Timedelta(days=n_days - 1)
+    stock_rows = write_stock(os.path.join(out_dir, 'stock.csv'), rates, last_day, rng)
+    return {'sales_rows': sales_rows, 'stock_rows': stock_rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic sales/stock/products CSVs")
+    parser.add_argument('--stores', type=int, default=10)
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--start', default='2025-01-01')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', default='synthetic_data')
+    args = parser.parse_args()
+
+    counts = generate(args.out, args.stores, args.products, args.days, args.start, args.seed)
+    print(f"wrote {args.out}/: {counts['sales_rows']} sales rows, {counts['stock_rows']} stock rows, "
+          f"{args.products} products")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+# test_rules.py
+# Regression test: rules.quantile_labels gives the same labels as the old
+# per-row percentile functions it replaced (category() in
+# historical_analysis.py, get_season() in seasonal_discounts.py,
+# trend_label() in social_trends.py).
+#
+#   python -m pytest -q test_rules.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from historical_analysis import CATEGORY_STEPS
+from rules import quantile_labels
+from seasonal_discounts import SEASON_STEPS
+from social_trends import TREND_STEPS
+
+
+# ---- the old per-row logic, as it was ----
+
+def old_category(values):
+    def category(score):
+        if score >= values.quantile(0.67):
+            return "fast_selling"
+        if score <= values.quantile(0.33):
+            return "slow_selling"
+        return "medium_selling"
+    return values.apply(category)
+
+
+def old_season(values):
+    def get_season(total):
+        if total > values.quantile(0.75):
+            return "festival"
+        elif total > values.quantile(0.50):
+            return "summer"
+        elif total > values.quantile(0.25):
+            return "winter"
+        else:
+            return "off-season"
+    return values.apply(get_season)
+
+
+def old_trend(values):
+    def trend_label(score):
+        if score >= values.quantile(0.75):
+            return "viral"
+        if score >= values.quantile(0.50):
+            return "trending"
+        if score >= values.quantile(0.25):
+            return "stable"
+        return "declining"
+    return values.apply(trend_label)
+
+
+RULES = [
+    (old_category, CATEGORY_STEPS, "medium_selling"),
+    (old_season, SEASON_STEPS, "off-season"),
+    (old_trend, TREND_STEPS, "declining"),
+]
+
+CASES = {
+    'distinct': pd.Series([5.0, 1.0, 9.0, 3.0, 7.0, 2.0, 8.0]),
+    'ties': pd.Series([3, 3, 3, 1, 1, 7, 7, 7, 7, 2]),
+    'all_equal': pd.Series([4.0] * 6),
+    'with_nan': pd.Series([1.0, np.nan, 5.0, 5.0, np.nan, 2.5, 10.0]),
+    'all_nan': pd.Series([np.nan, np.nan]),
+    'single_row': pd.Series([42.0]),
+    'two_rows': pd.Series([1, 2]),
+    # 0..100: the 0.25 / 0.33 / 0.5 / 0.67 / 0.75 cut points are values
+    # of the column, so every boundary comparison is exercised
+    'on_boundaries': pd.Series(np.arange(101, dtype=float)),
+    'empty': pd.Series([], dtype=float),
+    'non_default_index': pd.Series([10, 20, 20, 30], index=[7, 3, 99, 0]),
+}
+
+
+@pytest.mark.parametrize('case', list(CASES))
+@pytest.mark.parametrize('old, steps, default', RULES, ids=['category', 'season', 'trend'])
+def test_matches_old_per_row_labels(case, old, steps, default):
+    values = CASES[case]
+    expected = old(values)
+    got = quantile_labels(values, steps, default)
+    assert got.index.equals(values.index)
+    assert got.tolist() == expected.astype(object).tolist()
+
+
+@pytest.mark.parametrize('old, steps, default', RULES, ids=['category', 'season', 'trend'])
+def test_matches_old_on_random_data(old, steps, default):
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        values = pd.Series(rng.integers(0, 8, size=rng.integers(1, 40)).astype(float))
+        values[rng.random(len(values)) < 0.1] = np.nan
+        assert quantile_labels(values, steps, default).tolist() == old(values).tolist()
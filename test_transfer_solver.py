@@ -0,0 +1,189 @@
+# test_transfer_solver.py
+# transfer_solver.min_cost_flow / solve_transfers against a plain textbook
+# min-cost max-flow (successive shortest paths, one path at a time, every
+# lane from the start) on small random instances, with capacity limits and
+# missing lanes. The solver's flow is also certified on its own: no
+# augmenting path left and no negative cycle in the residual graph.
+#
+#   python -m pytest -q test_transfer_solver.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from transfer_solver import LaneCosts, OverAllocationError, check_plan, min_cost_flow, plan_cost, solve_transfers
+
+INF = float('inf')
+
+
+# ---- reference solver ----
+
+def reference_flow(supply, demand, cost, capacity=None):
+    # -> (units moved, total cost) of the cheapest maximum flow
+    m, n = cost.shape
+    source, sink = m + n, m + n + 1
+    graph = [[] for _ in range(m + n + 2)]  # [head, capacity left, cost, reverse index]
+
+    def add(a, b, cap, c):
+        graph[a].append([b, cap, c, len(graph[b])])
+        graph[b].append([a, 0, -c, len(graph[a]) - 1])
+
+    for i in range(m):
+        add(source, i, int(supply[i]), 0.0)
+    for j in range(n):
+        add(m + j, sink, int(demand[j]), 0.0)
+    for i in range(m):
+        for j in range(n):
+            if np.isfinite(cost[i, j]):
+                lane_cap = capacity[i, j] if capacity is not None else INF
+                add(i, m + j, int(lane_cap) if np.isfinite(lane_cap) else 10**9, float(cost[i, j]))
+
+    units, total = 0, 0.0
+    while True:
+        dist = [INF] * len(graph)
+        back = [None] * len(graph)
+        dist[source] = 0.0
+        for _ in range(len(graph)):
+            changed = False
+            for a, out in enumerate(graph):
+                if dist[a] == INF:
+                    continue
+                for k, (b, cap, c, _) in enumerate(out):
+                    if cap > 0 and dist[a] + c < dist[b] - 1e-12:
+                        dist[b], back[b], changed = dist[a] + c, (a, k), True
+            if not changed:
+                break
+        if dist[sink] == INF:
+            return units, total
+        push, node = INF, sink
+        while node != source:
+            a, k = back[node]
+            push, node = min(push, graph[a][k][1]), a
+        node = sink
+        while node != source:
+            a, k = back[node]
+            graph[a][k][1] -= push
+            graph[node][graph[a][k][3]][1] += push
+            node = a
+        units += push
+        total += push * dist[sink]
+
+
+def certified(supply, demand, cost, capacity, flow):
+    # Optimal iff the flow is feasible, no augmenting path is left and the
+    # residual graph has no negative cycle
+    m, n = cost.shape
+    cap = np.where(np.isfinite(capacity), capacity, 10**9) if capacity is not None else np.full((m, n), 10**9)
+    if (flow < 0).any() or (flow > cap).any() or (flow[~np.isfinite(cost)] > 0).any():
+        return False
+    if (flow.sum(axis=1) > supply).any() or (flow.sum(axis=0) > demand).any():
+        return False
+    source, sink = m + n, m + n + 1
+    edges = [(source, i, 0.0) for i in range(m) if flow[i].sum() < supply[i]]
+    edges += [(i, source, 0.0) for i in range(m) if flow[i].sum() > 0]
+    edges += [(m + j, sink, 0.0) for j in range(n) if flow[:, j].sum() < demand[j]]
+    edges += [(sink, m + j, 0.0) for j in range(n) if flow[:, j].sum() > 0]
+    for i in range(m):
+        for j in range(n):
+            if np.isfinite(cost[i, j]):
+                if flow[i, j] < cap[i, j]:
+                    edges.append((i, m + j, float(cost[i, j])))
+                if flow[i, j] > 0:
+                    edges.append((m + j, i, -float(cost[i, j])))
+    # augmenting path: sink reachable from the source in the residual graph
+    reach, todo = {source}, [source]
+    while todo:
+        a = todo.pop()
+        for x, y, _ in edges:
+            if x == a and y not in reach:
+                reach.add(y)
+                todo.append(y)
+    if sink in reach:
+        return False
+    # negative cycle: Bellman-Ford from every node at once still relaxing
+    dist = [0.0] * (m + n + 2)
+    for _ in range(m + n + 2):
+        changed = False
+        for x, y, c in edges:
+            if dist[x] + c < dist[y] - 1e-9:
+                dist[y], changed = dist[x] + c, True
+        if not changed:
+            return True
+    return False
+
+
+def random_instance(rng):
+    m, n = rng.integers(1, 6), rng.integers(1, 6)
+    supply = rng.integers(0, 9, size=m)
+    demand = rng.integers(0, 9, size=n)
+    cost = rng.integers(1, 10, size=(m, n)).astype(float)
+    cost[rng.random((m, n)) < 0.3] = INF  # missing lanes
+    capacity = None
+    if rng.random() < 0.5:
+        capacity = rng.integers(1, 6, size=(m, n)).astype(float)
+        capacity[rng.random((m, n)) < 0.3] = INF  # unlimited lanes
+    return supply, demand, cost, capacity
+
+
+# ---- tests ----
+
+@pytest.mark.parametrize('lanes_per_store', [None, 1])
+def test_min_cost_flow_matches_reference(lanes_per_store):
+    # lanes_per_store=1 starts from one lane per store, so the certificate /
+    # reachability checks have to add the rest
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        supply, demand, cost, capacity = random_instance(rng)
+        flow = min_cost_flow(supply, demand, cost, capacity, lanes_per_store=lanes_per_store)
+        units, total = reference_flow(supply, demand, cost, capacity)
+        assert flow.sum() == units
+        assert np.nansum(np.where(flow > 0, cost, 0) * flow) == pytest.approx(total)
+        assert certified(supply, demand, cost, capacity, flow)
+
+
+def _positions(rng, stores, products):
+    # transfer_ai-style excess / shortage rows for every store x product
+    frame = pd.DataFrame({'store_id': np.repeat(stores, len(products)),
+                          'product_id': np.tile(products, len(stores))})
+    frame['excess'] = rng.integers(-15, 15, size=len(frame)).astype(float)
+    return frame[frame['excess'] > 0], frame[frame['excess'] < 0]
+
+
+@pytest.mark.parametrize('stores', [[1, 2, 3, 4], ['S01', 'S02', 'S03', 'S10']], ids=['int_ids', 'text_ids'])
+def test_solve_transfers_matches_reference(stores):
+    rng = np.random.default_rng(1)
+    for _ in range(20):
+        excess_items, shortage_items = _positions(rng, stores, [7, 8, 9])
+        src, dst = np.meshgrid(stores, stores, indexing='ij')
+        lanes = pd.DataFrame({'from_store': src.ravel(), 'to_store': dst.ravel(),
+                              'cost': rng.integers(1, 10, size=src.size).astype(float),
+                              'capacity': rng.integers(1, 8, size=src.size).astype(float)})
+        lanes = lanes[(lanes['from_store'] != lanes['to_store']) & (rng.random(len(lanes)) < 0.8)]
+        costs = LaneCosts.from_frame(lanes, stores)
+
+        plan = solve_transfers(excess_items, shortage_items, costs)
+        check_plan(plan, excess_items, shortage_items)
+        assert set(plan['from_store']) | set(plan['to_store']) <= set(stores)
+
+        units, total = 0, 0.0
+        for product in [7, 8, 9]:
+            give = excess_items[excess_items['product_id'] == product]
+            need = shortage_items[shortage_items['product_id'] == product]
+            if give.empty or need.empty:
+                continue
+            cost, capacity = costs.block(give['store_id'].to_numpy(), need['store_id'].to_numpy())
+            moved, cheapest = reference_flow(np.floor(give['excess'].to_numpy()).astype(int),
+                                             np.floor(-need['excess'].to_numpy()).astype(int), cost, capacity)
+            units, total = units + moved, total + cheapest
+        assert plan['qty_transfer'].sum() == units
+        assert plan_cost(plan, costs) == pytest.approx(total)
+
+
+def test_check_plan_rejects_over_allocation():
+    excess_items = pd.DataFrame({'store_id': ['S01'], 'product_id': [7], 'excess': [3.0]})
+    shortage_items = pd.DataFrame({'store_id': ['S02'], 'product_id': [7], 'excess': [-10.0]})
+    plan = solve_transfers(excess_items, shortage_items)
+    assert plan['qty_transfer'].tolist() == [3]
+    plan.loc[0, 'qty_transfer'] = 4
+    with pytest.raises(OverAllocationError):
+        check_plan(plan, excess_items, shortage_items)
@@ -1,46 +1,117 @@
+import argparse
+from functools import partial
+
 import pandas as pd
 
-# Load data
-stock = pd.read_csv("stock.csv")
-sales = pd.read_csv("sales.csv")
+from data_loader import load_sales, load_stock, normalize_columns
+from future_prediction import N_DAYS_FORECAST, STORE_SUMMARY_FILE
+from instrumentation import span
+from sharding import run_sharded, store_shards
+from streaming import KeyAggregate, report, stream_sales
+from transfer_planner import plan_transfers
+from transfer_solver import load_lanes, plan_cost, solve_transfers
+
+
+def suggest_transfers(sales, stock, planner=plan_transfers):
+    return _plan(planner, *transfer_candidates(sales, stock))
+
+
+def _plan(planner, excess_items, shortage_items):
+    with span('plan transfers', cat='plan', rows=len(excess_items) + len(shortage_items)) as info:
+        transfers = planner(excess_items, shortage_items)
+        info['transfers'] = len(transfers)
+    return transfers
+
+
+def transfer_candidates(sales, stock):
+    # Average sales per product per store
+    with span("aggregate transfer demand", cat="aggregate", rows=len(sales)):
+        avg_sales = sales.groupby(["store_id","product_id"], observed=True)["quantity"].mean().reset_index()
+        avg_sales.columns = ["store_id","product_id","avg_daily_sale"]
+    return candidates_from_demand(avg_sales, stock)
+
+
+def transfers_from_demand(avg_sales, stock, planner=plan_transfers):
+    return _plan(planner, *candidates_from_demand(avg_sales, stock))
+
+
+def candidates_from_demand(avg_sales, stock):
+    # avg_sales: store_id, product_id, avg_daily_sale
+    # Merge stock + demand
+    with span("merge transfer stock", cat="aggregate", rows=len(stock)):
+        merged = stock.merge(avg_sales, on=["store_id","product_id"], how="left")
+
+    with span("label excess / shortage", cat="label", rows=len(merged)):
+        # Calculate shortage & excess
+        merged["required_stock"] = merged["avg_daily_sale"] * 7    # 1 week buffer
+        merged["excess"] = merged["stock_level"] - merged["required_stock"]
 
-# Average sales per product per store
-avg_sales = sales.groupby(["store_id","product_id"])["qty_sold"].mean().reset_index()
-avg_sales.columns = ["store_id","product_id","avg_daily_sale"]
+        # Stores with excess
+        excess_items = merged[merged["excess"] > 20]
 
-# Merge stock + demand
-merged = stock.merge(avg_sales, on=["store_id","product_id"], how="left")
+        # Stores with shortage
+        shortage_items = merged[merged["excess"] < -5]
+    return excess_items, shortage_items
 
-# Calculate shortage & excess
-merged["required_stock"] = merged["avg_daily_sale"] * 7    # 1 week buffer
-merged["excess"] = merged["stock_level"] - merged["required_stock"]
 
-# Stores with excess
-excess_items = merged[merged["excess"] > 20]
+def suggest_transfers_sharded(sales, stock, workers, planner=plan_transfers):
+    # Map: excess / shortage candidates per store shard (in parallel)
+    shards = store_shards(sales, stock, workers)
+    parts = run_sharded(transfer_candidates, shards, workers)
 
-# Stores with shortage
-shortage_items = merged[merged["excess"] < -5]
+    # Reduce: one matching over all shards' candidates (both planners sort
+    # their inputs themselves, so the order the shards come back in doesn't matter)
+    excess_items = pd.concat([excess for excess, _ in parts], ignore_index=True)
+    shortage_items = pd.concat([shortage for _, shortage in parts], ignore_index=True)
+    return _plan(planner, excess_items, shortage_items)
 
-# --- CREATE TRANSFER SUGGESTIONS ---
-suggestions = []
 
-for _, excess_row in excess_items.iterrows():
-    for _, short_row in shortage_items.iterrows():
+def main():
+    parser = argparse.ArgumentParser(description="Store-to-store transfer suggestions")
+    parser.add_argument("--chunksize", type=int,
+                        help="stream sales.csv in chunks of this many rows (bounded memory)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="split by store_id and run the shards on this many processes")
+    parser.add_argument("--solver", choices=["greedy", "mincost"], default="greedy",
+                        help="greedy matching, or cost-optimal min-cost flow (transfer_solver.py)")
+    parser.add_argument("--lanes", metavar="CSV",
+                        help="from_store,to_store,cost[,capacity] for --solver mincost "
+                             "(lanes not listed are not used; default: every lane costs 1)")
+    parser.add_argument("--store-forecast", nargs="?", const=STORE_SUMMARY_FILE, metavar="CSV",
+                        help="use the per-store forecast (future_prediction.py --hierarchical) as daily "
+                             "demand instead of the mean quantity sold")
+    args = parser.parse_args()
 
-        if excess_row["product_id"] == short_row["product_id"]:
-            qty_to_send = min(excess_row["excess"], abs(short_row["excess"]))
+    # Load data (normalized, parsed and cached by data_loader)
+    stock = load_stock()
+    planner, lanes = plan_transfers, None
+    if args.solver == "mincost":
+        lanes = load_lanes(args.lanes, stock["store_id"].dropna().unique()) if args.lanes else None
+        planner = partial(solve_transfers, lanes=lanes)
+    if args.store_forecast:
+        forecast = normalize_columns(pd.read_csv(args.store_forecast))
+        forecast["avg_daily_sale"] = forecast["forecast_next_30"] / N_DAYS_FORECAST
+        transfer_df = transfers_from_demand(forecast[["store_id","product_id","avg_daily_sale"]], stock, planner)
+    elif args.chunksize:
+        per_store = KeyAggregate(["store_id", "product_id"])
+        rows = stream_sales([per_store], "sales.csv", args.chunksize)
+        avg_sales = per_store.result()
+        avg_sales["avg_daily_sale"] = avg_sales["total_sold"] / avg_sales["rows"]
+        transfer_df = transfers_from_demand(avg_sales[["store_id","product_id","avg_daily_sale"]], stock, planner)
+        report("transfer_ai", rows, args.chunksize)
+    elif args.workers > 1:
+        sales = load_sales()
+        transfer_df = suggest_transfers_sharded(sales, stock, args.workers, planner)
+    else:
+        sales = load_sales()
+        transfer_df = suggest_transfers(sales, stock, planner)
 
-            suggestions.append([
-                excess_row["store_id"],
-                short_row["store_id"],
-                excess_row["product_id"],
-                int(qty_to_send)
-            ])
+    print("\n=========== STORE TRANSFER SUGGESTIONS ===========")
+    print(transfer_df)
+    if lanes is not None:
+        print(f"total transfer cost: {plan_cost(transfer_df, lanes):,.2f}")
+    transfer_df.to_csv("transfer_suggestions.csv", index=False)
 
-transfer_df = pd.DataFrame(suggestions,
-    columns=["from_store","to_store","product_id","qty_transfer"]
-)
 
-print("\n=========== STORE TRANSFER SUGGESTIONS ===========")
-print(transfer_df)
-transfer_df.to_csv("transfer_suggestions.csv", index=False)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# transfer_planner.py
+# Vectorized store-to-store transfer matching.
+# Excess and shortage rows are grouped by product_id and matched with a
+# sorted greedy allocation: biggest surplus feeds biggest shortage first,
+# and every unit of surplus is promised to at most one store.
+#
+# Run directly for a scale benchmark against the old iterrows double loop:
+#   python transfer_planner.py --stores 50 --products 2000
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+TRANSFER_COLUMNS = ["from_store", "to_store", "product_id", "qty_transfer"]
+
+
+def _sorted_units(items, units):
+    # One row per (store, product) with whole units, largest first per product
+    df = pd.DataFrame({
+        "store_id": items["store_id"].to_numpy(),
+        "product_id": items["product_id"].to_numpy(),
+        "units": units,
+    })
+    df = df[df["units"] > 0]
+    return df.sort_values(["product_id", "units", "store_id"],
+                          ascending=[True, False, True], kind="mergesort")
+
+
+def plan_transfers(excess_items, shortage_items):
+    # excess_items / shortage_items need store_id, product_id and excess
+    # (positive surplus for excess rows, negative for shortage rows)
+    give = _sorted_units(excess_items, np.floor(excess_items["excess"].to_numpy()))
+    need = _sorted_units(shortage_items, np.floor(-shortage_items["excess"].to_numpy()))
+
+    # Only products that have both a giver and a taker can move stock
+    common = np.intersect1d(give["product_id"].unique(), need["product_id"].unique())
+    give = give[give["product_id"].isin(common)]
+    need = need[need["product_id"].isin(common)]
+    if len(common) == 0:
+        return pd.DataFrame(columns=TRANSFER_COLUMNS)
+
+    give_total = give.groupby("product_id")["units"].sum().reindex(common).to_numpy()
+    need_total = need.groupby("product_id")["units"].sum().reindex(common).to_numpy()
+
+    # Lay every product out on one number line: product k owns the range
+    # [offset_k, offset_k + max(give, need)). Each giver / taker occupies a
+    # slice of that range, so a greedy allocation is just the overlap of
+    # giver slices with taker slices.
+    span = np.maximum(give_total, need_total)
+    offset = np.concatenate([[0], np.cumsum(span)[:-1]])
+    moved_end = offset + np.minimum(give_total, need_total)
+
+    give_pos = np.searchsorted(common, give["product_id"].to_numpy())
+    need_pos = np.searchsorted(common, need["product_id"].to_numpy())
+    give_end = offset[give_pos] + give.groupby("product_id")["units"].cumsum().to_numpy()
+    need_end = offset[need_pos] + need.groupby("product_id")["units"].cumsum().to_numpy()
+
+    cuts = np.unique(np.concatenate([offset, moved_end, give_end, need_end]))
+    seg_start, seg_end = cuts[:-1], cuts[1:]
+    product_pos = np.searchsorted(offset, seg_start, side="right") - 1
+    keep = seg_start < moved_end[product_pos]
+    seg_start, seg_end = seg_start[keep], seg_end[keep]
+
+    giver = np.searchsorted(give_end, seg_start, side="right")
+    taker = np.searchsorted(need_end, seg_start, side="right")
+
+    transfers = pd.DataFrame({
+        "from_store": give["store_id"].to_numpy()[giver],
+        "to_store": need["store_id"].to_numpy()[taker],
+        "product_id": give["product_id"].to_numpy()[giver],
+        "qty_transfer": (seg_end - seg_start).astype(int),
+    })
+    return transfers.groupby(["product_id", "from_store", "to_store"], as_index=False, sort=False)[
+        "qty_transfer"].sum()[TRANSFER_COLUMNS]
+
+
+def pairwise_transfers(excess_items, shortage_items):
+    # The original O(excess x shortage) loop, kept for benchmarking only
+    suggestions = []
+    for _, excess_row in excess_items.iterrows():
+        for _, short_row in shortage_items.iterrows():
+            if excess_row["product_id"] == short_row["product_id"]:
+                qty_to_send = min(excess_row["excess"], abs(short_row["excess"]))
+                suggestions.append([
+                    excess_row["store_id"],
+                    short_row["store_id"],
+                    excess_row["product_id"],
+                    int(qty_to_send)
+                ])
+    return pd.DataFrame(suggestions, columns=TRANSFER_COLUMNS)
+
+
+def synthetic_positions(n_stores, n_products, seed=42):
+    # Fake (store, product) stock positions shaped like transfer_ai.py's merged frame
+    rng = np.random.default_rng(seed)
+    stores = np.repeat(np.arange(1, n_stores + 1), n_products)
+    products = np.tile(np.arange(1, n_products + 1), n_stores)
+    avg_daily_sale = rng.gamma(2.0, 4.0, size=len(stores)).round(2)
+    stock_level = rng.integers(0, 150, size=len(stores))
+    merged = pd.DataFrame({"store_id": stores, "product_id": products,
+                           "stock_level": stock_level, "avg_daily_sale": avg_daily_sale})
+    merged["required_stock"] = merged["avg_daily_sale"] * 7
+    merged["excess"] = merged["stock_level"] - merged["required_stock"]
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark transfer matching at scale")
+    parser.add_argument("--stores", type=int, default=20)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--max-legacy-pairs", type=float, default=5e6,
+                        help="skip the old double loop above this many row pairs")
+    args = parser.parse_args()
+
+    merged = synthetic_positions(args.stores, args.products)
+    excess_items = merged[merged["excess"] > 20]
+    shortage_items = merged[merged["excess"] < -5]
+    pairs = len(excess_items) * len(shortage_items)
+
+    print(f"stores={args.stores} products={args.products} "
+          f"excess_rows={len(excess_items)} shortage_rows={len(shortage_items)}")
+
+    start = time.perf_counter()
+    planned = plan_transfers(excess_items, shortage_items)
+    planner_secs = time.perf_counter() - start
+    print(f"plan_transfers     : {planner_secs:9.3f}s  {len(planned)} transfers, "
+          f"{int(planned['qty_transfer'].sum())} units")
+
+    if pairs > args.max_legacy_pairs:
+        print(f"pairwise (iterrows): skipped ({pairs:.0f} row pairs)")
+        return
+    start = time.perf_counter()
+    legacy = pairwise_transfers(excess_items, shortage_items)
+    legacy_secs = time.perf_counter() - start
+    print(f"pairwise (iterrows): {legacy_secs:9.3f}s  {len(legacy)} transfers, "
+          f"{int(legacy['qty_transfer'].sum())} units (surplus re-used across stores)")
+    print(f"speedup            : {legacy_secs / max(planner_secs, 1e-9):9.1f}x")
+
+
+if __name__ == "__main__":
+    main()